@@ -9,6 +9,7 @@ a = Analysis(
     datas=[
         ('yellow_theme.json', '.'),  # 主题文件
         ('.env', '.'),  # 环境变量文件
+        ('static', 'static'),  # Artifacts 页面使用的离线 Chart.js 与共用样式
     ],  # 需要包含的资源文件
     hiddenimports=[
         'customtkinter',  # 确保 UI 库被包含
@@ -23,6 +24,8 @@ a = Analysis(
         'requests',  # 网络请求库
         'tavily',  # 搜索 API 库，注意：可能需要根据 API 变更调整
         'python-dotenv',  # 环境变量加载库
+        'pypdf',  # 上传 PDF 时延迟导入的解析库
+        'charset_normalizer',  # 上传文本时的编码检测
     ],  # 手动指定可能未被自动检测到的依赖模块
     hookspath=[],  # 自定义钩子路径（可选）
     hooksconfig={},  # 钩子配置（可选）
@@ -22,7 +22,7 @@ def initialize_api_client(api_key):
         client = None
         return None
 
-def get_deepseek_response_stream(messages, chunk_callback):
+def get_deepseek_response_stream(messages, chunk_callback, usage_callback=None):
     """
     调用 DeepSeek API 获取流式回复。
     参数:
@@ -30,6 +30,7 @@ def get_deepseek_response_stream(messages, chunk_callback):
         chunk_callback (function): 每收到一个数据块时调用的回调函数。
                                    回调函数接收一个参数：收到的文本块 (str)。
                                    如果回调函数返回 False，则停止接收。
+        usage_callback (function): 可选，流结束时以最后一个数据块的 usage 对象调用（含前缀缓存命中 token 数）。
     返回:
         str: 累积的完整回复文本。
     异常:
@@ -51,10 +52,13 @@ def get_deepseek_response_stream(messages, chunk_callback):
             stream=True,
             timeout=30,  # 添加超时设置，单位为秒
             temperature=0.7,  # 设置温度参数，控制生成文本的创造性
-            max_tokens=4096  # 设置最大 token 数，限制响应长度
+            max_tokens=4096,  # 设置最大 token 数，限制响应长度
+            stream_options={"include_usage": True}  # 最后一个数据块附带 usage（含缓存命中 token 数）
         )
 
         for chunk in stream:
+            if getattr(chunk, "usage", None) and usage_callback:
+                usage_callback(chunk.usage)
             if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
                 content_piece = chunk.choices[0].delta.content
                 accumulated_text += content_piece  # 累积文本
@@ -0,0 +1,302 @@
+# artifact_renderer.py (v1.3 - Artifacts 渲染：模板在启动时预编译一次，按类型构建上下文，以分块方式流式输出页面；大表格按列编码并虚拟滚动，大图表降采样；发布到服务器的页面直接编码到一个 bytearray 中)
+import os
+import re
+import json
+import html
+import logging
+from itertools import zip_longest
+from pathlib import Path
+
+from static_assets import asset_url
+from chart_downsample import make_series
+
+WRITE_BUFFER_CHARS = 64 * 1024  # 流式写出时积累到这么多字符再编码写入一次
+TABLE_VIRTUAL_THRESHOLD = int(os.getenv("TABLE_VIRTUAL_THRESHOLD", "1000"))  # 超过这么多行的表格改用按列编码 + 虚拟滚动
+
+# {{ 名称 }} 或 {{ 名称|过滤器 }}
+_PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*(?:\|\s*(\w+)\s*)?\}\}")
+
+# --- 过滤器：把上下文中的值转换为若干字符串块 ---
+def _filter_escape(value):
+    yield html.escape(str(value))
+
+def _filter_raw(value):
+    yield str(value)
+
+def _filter_json(value):
+    """JSON 分块编码，"</" 转义后可安全放入 <script>"""
+    for chunk in json.JSONEncoder(ensure_ascii=False).iterencode(value):
+        yield chunk.replace("</", "<\\/")
+
+def _filter_stream(value):
+    """值本身是字符串块的可迭代对象（已经是 HTML），逐块原样输出"""
+    for chunk in value:
+        yield chunk
+
+_FILTERS = {"e": _filter_escape, "raw": _filter_raw, "json": _filter_json, "stream": _filter_stream}
+
+class ArtifactTemplate:
+    """
+    预编译的页面模板：构造时把源文本切分为 文字片段 与 (名称, 过滤器) 占位，
+    render 时只按顺序产出字符串块，不拼接整页字符串。默认过滤器为 HTML 转义。
+    """
+
+    def __init__(self, name, source):
+        self.name = name
+        self._parts = []  # (文字, None, None) 或 (None, 名称, 过滤器函数)
+        position = 0
+        for match in _PLACEHOLDER_PATTERN.finditer(source):
+            if match.start() > position:
+                self._parts.append((source[position:match.start()], None, None))
+            filter_name = match.group(2) or "e"
+            if filter_name not in _FILTERS:
+                raise ValueError(f"模板 {name} 使用了未知的过滤器: {filter_name}")
+            self._parts.append((None, match.group(1), _FILTERS[filter_name]))
+            position = match.end()
+        if position < len(source):
+            self._parts.append((source[position:], None, None))
+
+    def render(self, context):
+        """按顺序产出页面的字符串块"""
+        for literal, key, apply_filter in self._parts:
+            if key is None:
+                yield literal
+            else:
+                yield from apply_filter(context[key])
+
+# --- 页面模板 ---
+_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <title>{{ title }}</title>
+    {{ asset_tags|raw }}
+</head>
+<body>
+    <h1>{{ title }}</h1>
+"""
+_PAGE_TAIL = """</body>
+</html>
+"""
+
+_TEMPLATE_SOURCES = {
+    "text": _PAGE_HEAD + """    <pre>{{ content }}</pre>
+""" + _PAGE_TAIL,
+    "chart": _PAGE_HEAD + """    <!-- 用于显示错误的 Div -->
+    <div id="errorMessage"></div>
+    <canvas id="myChart"></canvas>
+    <p id="chartStatus" style="color: #666; font-size: 13px;"></p>
+    <script>
+        const chartLabels = {{ labels|json }};
+        const chartDatasets = {{ datasets|json }};
+        // 数据经过降采样时不为 null：{url, axis, indices, shown, in_range}，用于缩放时按范围重新取样
+        const chartZoom = {{ zoom|json }};
+        try {
+            if (!Array.isArray(chartLabels) || chartDatasets.some(ds => !Array.isArray(ds.data))) {
+                throw new Error("图表数据格式无效 (标签或数据集数据不是数组)");
+            }
+            const chart = new Chart(document.getElementById('myChart').getContext('2d'), {
+                type: {{ chart_type|json }},
+                data: { labels: chartLabels, datasets: chartDatasets },
+                options: {
+                    ...(chartZoom ? { animation: false, elements: { point: { radius: chartZoom.axis === 'index' ? 0 : 2 } } } : {}),
+                    responsive: true,
+                    maintainAspectRatio: true,
+                    scales: {
+                        x: { title: { display: true, text: {{ xlabel|json }} } },
+                        y: { title: { display: true, text: {{ ylabel|json }} }, beginAtZero: true }
+                    },
+                    plugins: { title: { display: true, text: {{ title|json }} } }
+                }
+            });
+            if (chartZoom) {
+                ChartZoom.mount(chart, chartZoom, document.getElementById('chartStatus'));
+            }
+        } catch (error) {
+            console.error('图表渲染错误:', error);
+            const errorDiv = document.getElementById('errorMessage');
+            errorDiv.style.display = 'block';
+            errorDiv.innerText = '图表渲染失败: ' + error.message + '\\n请检查控制台获取详细信息。'
+                + '\\n\\n原始数据 (部分):\\nLabels: ' + JSON.stringify(chartLabels).substring(0, 200)
+                + '...\\nDatasets: ' + JSON.stringify(chartDatasets).substring(0, 300) + '...';
+        }
+    </script>
+""" + _PAGE_TAIL,
+    "table": _PAGE_HEAD + """    <table>
+        <tr>{{ header_cells|stream }}</tr>
+{{ rows|stream }}    </table>
+""" + _PAGE_TAIL,
+    # 大表格：数据以按列编码的 JSON 嵌入页面，由 virtual-table.js 只渲染可见行，排序与筛选在列数据上进行
+    "table_virtual": _PAGE_HEAD + """    <div id="virtualTable"></div>
+    <script type="application/json" id="tableData">{{ payload|json }}</script>
+    <script>
+        VirtualTable.mount(document.getElementById('virtualTable'), JSON.parse(document.getElementById('tableData').textContent));
+    </script>
+""" + _PAGE_TAIL,
+    "image": _PAGE_HEAD + """    <img src="{{ image_url }}" alt="Generated Image">
+    <p>图片路径: {{ image_path }}</p>
+""" + _PAGE_TAIL,
+    "html": "{{ html|raw }}",
+}
+
+# 导入时编译一次，之后每次渲染只遍历切分好的片段
+TEMPLATES = {kind: ArtifactTemplate(kind, source) for kind, source in _TEMPLATE_SOURCES.items()}
+
+# --- 上下文构建（在渲染线程中执行）：返回 (标题, 模板名, 上下文) ---
+def parse_artifact_payload(data):
+    """AI 响应中的 Artifact 数据可能是 dict，也可能是夹带其他文字的 JSON 字符串：取第一个 { 到最后一个 } 之间解析"""
+    if not isinstance(data, str):
+        return data
+    start_idx = data.find("{")
+    end_idx = data.rfind("}")
+    if start_idx < 0 or end_idx <= start_idx:
+        raise ValueError("无法从字符串中提取有效的 JSON 数据")
+    return json.loads(data[start_idx:end_idx + 1])
+
+def _asset_tags(server, *names):
+    """<head> 中引用随程序打包的静态资源（Chart.js、共用样式）的标签"""
+    tags = []
+    for name in names:
+        url = asset_url(name, server)
+        if not url:
+            continue
+        tags.append(f'<link rel="stylesheet" href="{html.escape(url)}">' if name.endswith(".css") else f'<script src="{html.escape(url)}"></script>')
+    return "\n    ".join(tags)
+
+def _text_context(content, server, file_url):
+    return "Artifacts 内容", "text", {"title": "Artifacts 内容", "content": content, "asset_tags": _asset_tags(server, "artifact.css")}
+
+def _chart_context(chart_data, server, file_url):
+    chart_data = parse_artifact_payload(chart_data)
+    data = chart_data.get("data", {})
+    options = chart_data.get("options", {})
+    title = str(chart_data.get("title", "图表"))
+    chart_type = chart_data.get("type", "bar")
+    labels = data.get("labels", [])
+    raw_datasets = data.get("datasets", [])
+    datasets = [{"label": str(ds.get("label", "数据集")), "data": ds.get("values", [])} for ds in raw_datasets]
+    assets = ["artifact.css", "chart.js"]
+    zoom = None
+    # 折线图/散点图点数过多时降采样，完整数据留在服务器上，缩放时按范围重新取样
+    series = make_series(chart_type, labels, [ds["data"] for ds in datasets])
+    if series is not None:
+        view = series.view()
+        for dataset, values in zip(datasets, view["datasets"]):
+            dataset["data"] = values
+        if chart_type == "scatter":
+            zoom = {"axis": "x"}
+        else:
+            labels = view["labels"]
+            zoom = {"axis": "index", "indices": view["indices"]}
+        zoom.update(url=server.register_data(series.query) if server else None, shown=view["shown"], in_range=view["in_range"])
+        assets.append("chart-zoom.js")
+        logging.info("[Artifacts] 图表有 %d 个点，降采样后输出 %d 个", view["in_range"], view["shown"])
+    return title, "chart", {
+        "title": title,
+        "chart_type": chart_type,
+        "labels": labels,
+        "datasets": datasets,
+        "zoom": zoom,
+        "xlabel": str(options.get("xlabel", "X轴")),
+        "ylabel": str(options.get("ylabel", "Y轴")),
+        "asset_tags": _asset_tags(server, *assets),
+    }
+
+def _table_rows(rows):
+    """逐行产出 <tr>，不在内存中拼出整张表"""
+    escape = html.escape
+    for row in rows:
+        yield "        <tr>" + "".join(f"<td>{escape(str(cell))}</td>" for cell in row) + "</tr>\n"
+
+def columnar_payload(headers, rows):
+    """
+    把按行的表格转换为按列编码：{"headers": [...], "columns": [[第 1 列的值...], ...], "row_count": n}。
+    同一列的值连续存放，JSON 中不再为每一行重复方括号，页面端排序/筛选也直接按列访问。
+    长短不一的行用 null 补齐，表头不足时补上 "列N"。
+    """
+    columns = [list(column) for column in zip_longest(*rows)] if rows else []
+    width = max(len(headers), len(columns))
+    headers = [str(header) for header in headers] + [f"列{i + 1}" for i in range(len(headers), width)]
+    columns += [[None] * len(rows) for _ in range(len(columns), width)]
+    return {"headers": headers, "columns": columns, "row_count": len(rows)}
+
+def _table_context(table_data, server, file_url):
+    table_data = parse_artifact_payload(table_data)
+    data = table_data.get("data", {})
+    title = str(table_data.get("title", "表格"))
+    rows = data.get("rows", [])
+    if len(rows) > TABLE_VIRTUAL_THRESHOLD:
+        logging.info("[Artifacts] 表格有 %d 行，使用按列编码 + 虚拟滚动", len(rows))
+        return title, "table_virtual", {
+            "title": title,
+            "payload": columnar_payload(data.get("headers", []), rows),
+            "asset_tags": _asset_tags(server, "artifact.css", "virtual-table.js"),
+        }
+    return title, "table", {
+        "title": title,
+        "header_cells": (f"<th>{html.escape(str(header))}</th>" for header in data.get("headers", [])),
+        "rows": _table_rows(rows),
+        "asset_tags": _asset_tags(server, "artifact.css"),
+    }
+
+def _image_context(image_path, server, file_url):
+    return "生成的图片", "image", {
+        "title": "生成的图片",
+        "image_url": file_url(image_path),
+        "image_path": image_path,
+        "asset_tags": _asset_tags(server, "artifact.css"),
+    }
+
+def _html_context(html_data, server, file_url):
+    html_data = parse_artifact_payload(html_data)
+    content = html_data.get("html", "<h1>错误</h1><p>无网页内容</p>")
+    logging.info("[Artifacts] 开始处理HTML内容，内容长度: %d", len(content))
+    return html_data.get("title", "网页内容"), "html", {"html": content}
+
+_CONTEXT_BUILDERS = {
+    "text": _text_context,
+    "chart": _chart_context,
+    "table": _table_context,
+    "image": _image_context,
+    "html": _html_context,
+}
+
+def render_artifact(kind, payload, server=None, file_url=lambda path: Path(path).as_uri()):
+    """
+    构建上下文并渲染页面。
+    参数:
+        kind (str): text/chart/table/image/html
+        payload: AI 返回的数据（dict 或 JSON 字符串；text 为纯文本，image 为图片路径）
+        server: Artifacts 服务器（决定静态资源的 URL），None 表示使用 file:// 地址
+        file_url (function): 把本地文件路径转换为页面中引用的 URL
+    返回:
+        tuple: (标题, 字符串块的迭代器)
+    """
+    title, template_name, context = _CONTEXT_BUILDERS[kind](payload, server, file_url)
+    return title, TEMPLATES[template_name].render(context)
+
+def _encoded_blocks(chunks, buffer_chars):
+    """把字符串块积累到 buffer_chars 个字符后按 UTF-8 编码，逐块产出 bytes"""
+    pending, pending_chars = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_chars += len(chunk)
+        if pending_chars >= buffer_chars:
+            yield "".join(pending).encode('utf-8')
+            pending, pending_chars = [], 0
+    if pending:
+        yield "".join(pending).encode('utf-8')
+
+def write_chunks(chunks, fp, buffer_chars=WRITE_BUFFER_CHARS):
+    """把字符串块按 UTF-8 编码写入二进制文件对象，积累到 buffer_chars 再写一次；返回写入的字节数"""
+    return sum(fp.write(block) for block in _encoded_blocks(chunks, buffer_chars))
+
+def encode_chunks(chunks, buffer_chars=WRITE_BUFFER_CHARS):
+    """
+    把字符串块按 UTF-8 编码追加到一个 bytearray 中并返回。
+    发布到 Artifacts 服务器时直接交出这个 bytearray，服务器原样持有，页面只在内存中保存一份。
+    """
+    body = bytearray()
+    for block in _encoded_blocks(chunks, buffer_chars):
+        body += block
+    return body
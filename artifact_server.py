@@ -0,0 +1,367 @@
+# artifact_server.py (v1.3 - 本地 Artifacts 服务器：在内存中保存渲染结果，通过 Server-Sent Events 推送到同一个已打开的页面，提供长期缓存的静态资源与按需取数接口；校验 Host 头防止 DNS 重绑定)
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote, parse_qsl
+
+from static_assets import static_file_for, STATIC_CACHE_CONTROL
+
+ARTIFACT_SERVER_ENABLED = os.getenv("ARTIFACT_SERVER", "1") == "1"  # 为 False 时沿用临时文件 + 打开浏览器
+ARTIFACT_SERVER_PORT = int(os.getenv("ARTIFACT_SERVER_PORT", "0"))  # 0 表示由系统分配空闲端口
+MAX_ARTIFACTS = 50  # 内存中保留的最近 Artifacts 数量
+SSE_HEARTBEAT_SECONDS = 15
+VIEWER_CONNECT_GRACE_SECONDS = 10  # 刚打开浏览器、页面还没连上事件流时，不重复打开
+
+_VIEWER_PAGE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="UTF-8">
+<title>Artifacts</title>
+<style>
+    html, body { margin: 0; height: 100%; font-family: Arial, sans-serif; }
+    body { display: flex; }
+    #sidebar { width: 220px; overflow-y: auto; border-right: 1px solid #ddd; background: #fafafa; }
+    #sidebar h3 { margin: 12px; font-size: 14px; color: #666; }
+    #sidebar a { display: block; padding: 8px 12px; color: #333; text-decoration: none; font-size: 13px; border-bottom: 1px solid #eee; }
+    #sidebar a.active { background: #fff3c4; font-weight: bold; }
+    #status { font-size: 12px; color: #999; margin: 0 12px 8px; }
+    iframe { flex: 1; border: none; height: 100%; }
+</style>
+</head>
+<body>
+<div id="sidebar"><h3>Artifacts</h3><div id="status">连接中…</div><div id="list"></div></div>
+<iframe id="view"></iframe>
+<script>
+const artifacts = new Map();
+let current = null;
+function show(id) {
+    const a = artifacts.get(id);
+    if (!a) return;
+    current = id;
+    document.getElementById('view').src = '/a/' + id + '?v=' + a.version;
+    document.title = a.title + ' - Artifacts';
+    renderList();
+}
+function renderList() {
+    const list = document.getElementById('list');
+    list.innerHTML = '';
+    [...artifacts.values()].reverse().forEach(a => {
+        const link = document.createElement('a');
+        link.href = '#';
+        link.textContent = a.title;
+        link.className = a.id === current ? 'active' : '';
+        link.onclick = e => { e.preventDefault(); show(a.id); };
+        list.appendChild(link);
+    });
+}
+function upsert(a) { artifacts.set(a.id, a); }
+fetch('/list').then(r => r.json()).then(items => {
+    items.forEach(upsert);
+    if (items.length) show(items[items.length - 1].id);
+});
+const events = new EventSource('/events');
+events.addEventListener('artifact', e => { const a = JSON.parse(e.data); upsert(a); show(a.id); });
+events.onopen = () => { document.getElementById('status').textContent = '已连接'; };
+events.onerror = () => { document.getElementById('status').textContent = '连接已断开，正在重试…'; };
+</script>
+</body>
+</html>
+"""
+
+class ArtifactServer:
+    """
+    只监听 127.0.0.1 的 HTTP 服务器：
+    - GET /            查看页（左侧列表 + iframe），通过 EventSource 接收新的或更新的 Artifacts
+    - GET /list        当前保存的 Artifacts 元数据
+    - GET /a/<id>      某个 Artifact 的 HTML
+    - GET /events      Server-Sent Events 事件流
+    - GET /files/<令牌>/<文件名>  经 file_url 登记的本地文件（生成的图片等）
+    - GET /static/<文件名>  随程序打包的静态资源（Chart.js、共用样式），文件名带版本号，长期缓存
+    - GET /data/<令牌>?参数  经 register_data 登记的取数函数（如图表缩放时按范围重新取样），返回 JSON
+    Host 头不是 127.0.0.1:<端口> 或 localhost:<端口> 的请求一律拒绝（403），防止其他网站通过 DNS 重绑定读取本地内容。
+    """
+
+    def __init__(self, host="127.0.0.1", port=ARTIFACT_SERVER_PORT, max_artifacts=MAX_ARTIFACTS):
+        self.host = host
+        self.port = port
+        self.max_artifacts = max_artifacts
+        self._artifacts = OrderedDict()  # id -> {"id", "title", "kind", "version", "body"}
+        self._files = {}  # 令牌 -> 本地路径
+        self._static_cache = {}  # 文件名 -> 内容（静态资源只读一次）
+        self._data_providers = OrderedDict()  # 令牌 -> 取数函数（与 Artifacts 一样只保留最近 max_artifacts 个）
+        self._clients = set()  # 每个事件流连接一个 queue.Queue
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._viewer_opened_at = 0.0
+        self._httpd = None
+        self._thread = None
+
+    # --- 生命周期 ---
+    def start(self):
+        server = self
+
+        class Handler(_ArtifactRequestHandler):
+            artifact_server = server
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="artifact-server", daemon=True)
+        self._thread.start()
+        logging.info("[Artifacts 服务器] 已启动: %s", self.url)
+        return self
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        with self._lock:
+            for client in self._clients:
+                client.put(None)
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+        logging.info("[Artifacts 服务器] 已停止")
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    # --- 发布 ---
+    def publish(self, body, title, kind="html", artifact_id=None):
+        """
+        保存一个 Artifact 并推送给已打开的查看页。
+        参数:
+            body (str | bytes | bytearray): 完整的 HTML 页面；bytes / bytearray 原样保存，不复制（调用方交出后不应再修改）
+            artifact_id (str): 传入已有的 id 时原地更新（版本号加一），否则新建
+        返回:
+            str: artifact id
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self._lock:
+            if artifact_id is None or artifact_id not in self._artifacts:
+                self._counter += 1
+                artifact_id = artifact_id or f"{kind}-{self._counter}"
+                entry = {"id": artifact_id, "title": title, "kind": kind, "version": 0}
+            else:
+                entry = self._artifacts.pop(artifact_id)
+            entry.update(title=title, body=body, version=entry["version"] + 1)
+            self._artifacts[artifact_id] = entry
+            while len(self._artifacts) > self.max_artifacts:
+                self._artifacts.popitem(last=False)
+            event = json.dumps(_public(entry), ensure_ascii=False)
+            for client in self._clients:
+                client.put(event)
+            viewers = len(self._clients)
+        logging.info("[Artifacts 服务器] 发布 %s (v%d, %d 字节)，推送给 %d 个页面", artifact_id, entry["version"], len(body), viewers)
+        return artifact_id
+
+    def file_url(self, path):
+        """登记本地文件并返回可在 Artifact 页面中引用的 URL（http 页面不能加载 file:// 资源）"""
+        token = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+        with self._lock:
+            self._files[token] = os.path.abspath(path)
+        return f"{self.url}files/{token}/{quote(os.path.basename(path))}"
+
+    def register_data(self, provider):
+        """
+        登记一个取数函数，返回页面中请求数据使用的 URL。
+        参数:
+            provider (function): 接收查询参数 dict（值均为字符串），返回可 JSON 序列化的结果；在请求线程中调用
+        """
+        with self._lock:
+            self._counter += 1
+            token = f"d{self._counter}"
+            self._data_providers[token] = provider
+            while len(self._data_providers) > self.max_artifacts:
+                self._data_providers.popitem(last=False)
+        return f"{self.url}data/{token}"
+
+    def needs_viewer(self):
+        """没有已连接的查看页（且不是刚刚打开）时返回 True，调用方应打开浏览器"""
+        with self._lock:
+            if self._clients:
+                return False
+        return time.time() - self._viewer_opened_at > VIEWER_CONNECT_GRACE_SECONDS
+
+    def mark_viewer_opened(self):
+        self._viewer_opened_at = time.time()
+
+    # --- 供请求处理器使用 ---
+    def _list(self):
+        with self._lock:
+            return [_public(entry) for entry in self._artifacts.values()]
+
+    def _get(self, artifact_id):
+        with self._lock:
+            entry = self._artifacts.get(artifact_id)
+            return entry["body"] if entry else None
+
+    def _file_path(self, token):
+        with self._lock:
+            return self._files.get(token)
+
+    def _data_provider(self, token):
+        with self._lock:
+            return self._data_providers.get(token)
+
+    def _static(self, filename):
+        with self._lock:
+            body = self._static_cache.get(filename)
+        if body is None:
+            path = static_file_for(filename)
+            if path is None:
+                return None
+            body = path.read_bytes()
+            with self._lock:
+                self._static_cache[filename] = body
+        return body
+
+    def _subscribe(self):
+        client = queue.Queue()
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def _unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+def _public(entry):
+    return {"id": entry["id"], "title": entry["title"], "kind": entry["kind"], "version": entry["version"]}
+
+class _ArtifactRequestHandler(BaseHTTPRequestHandler):
+    artifact_server = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug("[Artifacts 服务器] " + format, *args)
+
+    def _send(self, status, body, content_type, cache_control="no-store"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _host_allowed(self):
+        """只接受以回环地址访问的请求：DNS 重绑定攻击中浏览器发送的 Host 是攻击者的域名"""
+        port = self.artifact_server.port
+        host = (self.headers.get("Host") or "").strip().lower()
+        return host in (f"127.0.0.1:{port}", f"localhost:{port}")
+
+    def do_GET(self):
+        if not self._host_allowed():
+            logging.warning("[Artifacts 服务器] 拒绝 Host 为 %r 的请求: %s", self.headers.get("Host"), self.path)
+            self._send(403, b"Forbidden", "text/plain")
+            return
+        path = self.path.split("?", 1)[0]
+        server = self.artifact_server
+        if path == "/":
+            self._send(200, _VIEWER_PAGE.encode('utf-8'), "text/html; charset=utf-8")
+        elif path == "/list":
+            self._send(200, json.dumps(server._list(), ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8")
+        elif path.startswith("/a/"):
+            body = server._get(unquote(path[3:]))
+            if body is None:
+                self._send(404, "Artifact 已过期或不存在".encode('utf-8'), "text/plain; charset=utf-8")
+            else:
+                self._send(200, body, "text/html; charset=utf-8")
+        elif path == "/events":
+            self._stream_events()
+        elif path.startswith("/static/"):
+            filename = unquote(path[len("/static/"):])
+            body = server._static(filename)
+            if body is None:
+                self._send(404, b"Not Found", "text/plain")
+                return
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type.endswith("javascript"):
+                content_type += "; charset=utf-8"
+            self._send(200, body, content_type, cache_control=STATIC_CACHE_CONTROL)
+        elif path.startswith("/data/"):
+            provider = server._data_provider(path[len("/data/"):])
+            if provider is None:
+                self._send(404, "数据已过期或不存在".encode('utf-8'), "text/plain; charset=utf-8")
+                return
+            params = dict(parse_qsl(self.path.split("?", 1)[1])) if "?" in self.path else {}
+            try:
+                result = provider(params)
+            except Exception as e:
+                logging.warning("[Artifacts 服务器] 取数出错 %s: %s", path, e)
+                self._send(400, str(e).encode('utf-8'), "text/plain; charset=utf-8")
+                return
+            self._send(200, json.dumps(result, ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8")
+        elif path.startswith("/files/"):
+            token = path[len("/files/"):].split("/", 1)[0]
+            file_path = server._file_path(token)
+            if not file_path or not os.path.isfile(file_path):
+                self._send(404, b"Not Found", "text/plain")
+                return
+            with open(file_path, 'rb') as f:
+                body = f.read()
+            content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+            self._send(200, body, content_type, cache_control="public, max-age=86400")
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _stream_events(self):
+        """Server-Sent Events：每个新的或更新的 Artifact 推送一条 artifact 事件，空闲时发送心跳注释"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Connection", "keep-alive")
+        self.end_headers()
+        client = self.artifact_server._subscribe()
+        try:
+            self.wfile.write(b"retry: 1000\n\n")
+            self.wfile.flush()
+            while True:
+                try:
+                    event = client.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b": ping\n\n")
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    break
+                self.wfile.write(f"event: artifact\ndata: {event}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            self.artifact_server._unsubscribe(client)
+            self.close_connection = True
+
+_artifact_server = None
+_artifact_server_lock = threading.Lock()
+
+def get_artifact_server():
+    """获取共享的 Artifacts 服务器（首次调用时启动）；未启用或启动失败时返回 None"""
+    global _artifact_server
+    if not ARTIFACT_SERVER_ENABLED:
+        return None
+    with _artifact_server_lock:
+        if _artifact_server is None:
+            try:
+                _artifact_server = ArtifactServer().start()
+            except OSError as e:
+                logging.error("[Artifacts 服务器] 启动失败，改用临时文件: %s", e)
+                return None
+        return _artifact_server
+
+def shutdown_artifact_server():
+    """程序退出时调用"""
+    global _artifact_server
+    with _artifact_server_lock:
+        if _artifact_server is not None:
+            _artifact_server.stop()
+            _artifact_server = None
@@ -0,0 +1,115 @@
+# attachment_retrieval.py (v1.1 - 附件本地检索：分块建立 BM25 索引，发送时只附上与问题最相关的片段，并返回哪些附件附上了全文)
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from text_index import BM25Index, chunk_text
+from utils import estimate_tokens
+
+# 附件内容的 token 预算（超过预算才启用检索），以及最多附上的片段数
+ATTACHMENT_TOKEN_BUDGET = int(os.getenv("ATTACHMENT_TOKEN_BUDGET", "6000"))
+ATTACHMENT_TOP_K = int(os.getenv("ATTACHMENT_TOP_K", "8"))
+CHUNK_TOKENS = 400
+
+class AttachmentRetriever:
+    """
+    为附件建立分块 BM25 索引（按附件内容哈希缓存），发送时按用户最终输入挑选最相关的片段。
+    附件总量不超过预算或开启全文发送时，直接附上全文。
+    """
+
+    def __init__(self, attachment_store, token_budget=ATTACHMENT_TOKEN_BUDGET, top_k=ATTACHMENT_TOP_K, max_cached_indexes=8):
+        self.attachment_store = attachment_store
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.max_cached_indexes = max_cached_indexes
+        self._indexes = OrderedDict()  # 附件哈希 -> Future[(chunks, BM25Index)]
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="attachment-indexer")
+
+    def _build_index(self, digest, text=None):
+        if text is None:
+            text = self.attachment_store.read(digest)
+        chunks = chunk_text(text, CHUNK_TOKENS)
+        index = BM25Index()
+        for chunk in chunks:
+            index.add(chunk["text"])
+        logging.info("[附件检索] 已为附件 %s... 建立索引，共 %d 个片段", digest[:12], len(chunks))
+        return chunks, index
+
+    def _get_index_future(self, digest, text=None):
+        with self._lock:
+            future = self._indexes.get(digest)
+            if future is not None:
+                self._indexes.move_to_end(digest)
+                return future
+            future = self._executor.submit(self._build_index, digest, text)
+            self._indexes[digest] = future
+            while len(self._indexes) > self.max_cached_indexes:
+                self._indexes.popitem(last=False)
+            return future
+
+    def prepare_async(self, digest):
+        """在后台预先为大附件建立索引，发送时即可直接检索"""
+        self._get_index_future(digest)
+
+    def build_context(self, query, items, force_full=False):
+        """
+        决定每个附件实际发送的内容。
+        参数:
+            query (str): 用户最终输入，用作检索查询
+            items (list): (附件元数据, 附件全文) 列表
+            force_full (bool): 为 True 时始终附上全文
+        返回:
+            tuple: (dict 附件哈希 -> 要放入消息的文本, set 附上了全文的附件哈希)
+        """
+        total_tokens = sum(att.get("tokens") or estimate_tokens(text) for att, text in items)
+        if force_full or total_tokens <= self.token_budget:
+            logging.info("[附件检索] 附件共约 %d tokens (预算 %d, 强制全文: %s)，附上全文", total_tokens, self.token_budget, force_full)
+            return {att["digest"]: text for att, text in items}, {att["digest"] for att, text in items}
+
+        indexed = {att["digest"]: self._get_index_future(att["digest"], text).result() for att, text in items}
+        candidates = []
+        if query.strip():
+            for digest, (chunks, index) in indexed.items():
+                candidates.extend((score, digest, doc_id) for doc_id, score in index.search(query, self.top_k))
+            candidates.sort(reverse=True)
+
+        selected = {digest: [] for digest in indexed}
+        used_tokens = 0
+        if candidates:
+            for score, digest, doc_id in candidates[:self.top_k]:
+                chunk_tokens = estimate_tokens(indexed[digest][0][doc_id]["text"])
+                if used_tokens + chunk_tokens > self.token_budget:
+                    continue
+                selected[digest].append(doc_id)
+                used_tokens += chunk_tokens
+            mode = "相关片段"
+        else:
+            # 没有可用的查询或没有任何命中：按预算平均分配，附上各附件开头的片段
+            per_attachment = self.token_budget // max(1, len(indexed))
+            for digest, (chunks, index) in indexed.items():
+                budget_left = per_attachment
+                for doc_id, chunk in enumerate(chunks):
+                    chunk_tokens = estimate_tokens(chunk["text"])
+                    if chunk_tokens > budget_left:
+                        break
+                    selected[digest].append(doc_id)
+                    budget_left -= chunk_tokens
+                    used_tokens += chunk_tokens
+            mode = "开头片段"
+        logging.info("[附件检索] 附件共约 %d tokens 超出预算 %d，选取%s约 %d tokens", total_tokens, self.token_budget, mode, used_tokens)
+
+        contexts = {}
+        for att, text in items:
+            digest = att["digest"]
+            chunks = indexed[digest][0]
+            doc_ids = sorted(selected[digest])
+            if not doc_ids:
+                contexts[digest] = f"（附件共 {att.get('lines', '?')} 行，约 {att.get('tokens', '?')} tokens，未找到与问题相关的内容，已省略）"
+                continue
+            excerpts = [f"[第 {chunks[i]['start_line']}-{chunks[i]['end_line']} 行]\n{chunks[i]['text'].rstrip()}" for i in doc_ids]
+            note = f"（附件共 {att.get('lines', '?')} 行，约 {att.get('tokens', '?')} tokens，以下仅为{mode} {len(doc_ids)} 段）"
+            contexts[digest] = note + "\n" + "\n...\n".join(excerpts)
+        return contexts, set()
@@ -0,0 +1,182 @@
+# attachment_store.py (v1.1 - 内容寻址的附件存储，按哈希去重，mmap 读取，后台线程加载，文件由统一临时目录管理)
+import os
+import json
+import mmap
+import time
+import uuid
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import estimate_tokens
+from temp_manager import get_temp_manager
+
+class AttachmentStore:
+    """
+    以内容 SHA-256 为键保存附件文本。
+    - 相同内容只落盘一次，重复保存直接返回已有记录。
+    - 索引文件 index.json 记录大小、行数、字符数和 token 估算等元数据，无需重新读取文件。
+    - 读取通过内存映射完成，加载在专用线程池中进行，不占用 Tk 主线程。
+    """
+
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, root_dir=None, max_workers=2):
+        """
+        初始化附件存储。
+        参数:
+            root_dir: 存储目录，默认为统一临时目录下的 attachments。
+            max_workers (int): 后台加载线程数。
+        """
+        self.temp_manager = get_temp_manager()
+        self.root_dir = Path(root_dir) if root_dir else self.temp_manager.dir_for("attachments")
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root_dir / self.INDEX_FILE_NAME
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attachment-loader")
+        logging.info("[附件存储] 初始化完成，目录: %s，已索引 %d 个附件", self.root_dir, len(self._index))
+
+    # --- 索引 ---
+    def _load_index(self):
+        """读取索引文件，丢弃对应文件已不存在的记录"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning("[附件存储] 索引文件损坏，将重新建立: %s", e)
+            return {}
+        return {digest: record for digest, record in index.items() if self._path_for(digest).exists()}
+
+    def _save_index(self):
+        """原子地写回索引文件（调用方需持有锁）"""
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logging.error("[附件存储] 写入索引文件出错: %s", e)
+
+    def _path_for(self, digest):
+        return self.root_dir / f"{digest}.txt"
+
+    # --- 写入 ---
+    def put(self, content, source="用户输入"):
+        """
+        保存附件内容。
+        参数:
+            content (str): 附件文本
+            source (str): 来源描述（文件名、粘贴内容等）
+        返回:
+            tuple: (record, is_new)，record 为元数据字典，is_new 表示是否为首次保存
+        """
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            record = self._index.get(digest)
+            if record and self._path_for(digest).exists():
+                record["last_used"] = time.time()
+                self._save_index()
+                logging.info("[附件存储] 内容已存在 (%s...)，复用已有附件", digest[:12])
+                return dict(record), False
+
+        # 写入临时文件后原子重命名，避免并发写入或中途失败留下半个文件
+        target_path = self._path_for(digest)
+        tmp_path = target_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, target_path)
+        self.temp_manager.register(target_path)
+
+        record = {
+            "digest": digest,
+            "source": source,
+            "size": len(data),
+            "chars": len(content),
+            "lines": content.count("\n") + 1 if content else 0,
+            "tokens": estimate_tokens(content),
+            "created": time.time(),
+            "last_used": time.time(),
+        }
+        with self._lock:
+            self._index[digest] = record
+            self._save_index()
+        logging.info("[附件存储] 已保存附件 %s... (来源: %s, %d 字节, 约 %d tokens)", digest[:12], source, record["size"], record["tokens"])
+        return dict(record), True
+
+    def new_staging_path(self):
+        """返回存储目录内的临时文件路径，供外部（如文档解析进程）直接写入后再调用 adopt"""
+        return self.root_dir / f"staging_{uuid.uuid4().hex}.part"
+
+    def adopt(self, staging_path, meta, source):
+        """
+        接管一个已写好的 UTF-8 文本文件（由 new_staging_path 分配），按其哈希并入存储。
+        参数:
+            staging_path: 临时文件路径
+            meta (dict): 写入方统计的元数据，需包含 digest、size、chars、lines、tokens
+            source (str): 来源描述
+        返回:
+            tuple: (record, is_new)
+        """
+        digest = meta["digest"]
+        target_path = self._path_for(digest)
+        with self._lock:
+            record = self._index.get(digest)
+            if record and target_path.exists():
+                os.remove(staging_path)
+                record["last_used"] = time.time()
+                self._save_index()
+                logging.info("[附件存储] 解析结果与已有附件 %s... 相同，丢弃重复文件", digest[:12])
+                return dict(record), False
+            os.replace(staging_path, target_path)
+            self.temp_manager.register(target_path)
+            record = {
+                "digest": digest,
+                "source": source,
+                "size": meta["size"],
+                "chars": meta["chars"],
+                "lines": meta["lines"],
+                "tokens": meta["tokens"],
+                "created": time.time(),
+                "last_used": time.time(),
+            }
+            self._index[digest] = record
+            self._save_index()
+        logging.info("[附件存储] 已接管附件 %s... (来源: %s, %d 字节, 约 %d tokens)", digest[:12], source, record["size"], record["tokens"])
+        return dict(record), True
+
+    # --- 读取 ---
+    def get_record(self, digest):
+        """返回附件元数据的副本，不存在时返回 None"""
+        with self._lock:
+            record = self._index.get(digest)
+            return dict(record) if record else None
+
+    def read(self, digest):
+        """通过内存映射读取附件全文"""
+        path = self._path_for(digest)
+        self.temp_manager.touch(path)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:].decode('utf-8')
+
+    def load_async(self, digests):
+        """
+        在后台线程池中并行读取多个附件。
+        参数:
+            digests (list): 附件哈希列表
+        返回:
+            list: 与 digests 顺序对应的 Future 列表，结果为附件文本
+        """
+        return [self._executor.submit(self.read, digest) for digest in digests]
+
+    def shutdown(self):
+        """关闭后台加载线程池"""
+        self._executor.shutdown(wait=False)
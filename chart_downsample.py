@@ -0,0 +1,190 @@
+# chart_downsample.py (v1.1 - 大数据量图表的降采样：折线图用 LTTB，散点图按网格分箱，NumPy 向量化计算；保留完整数据供缩放时按范围重新取样；折线图数据不是纯数值时按原样输出)
+import os
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时图表按原样输出
+    np = None
+
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "2000"))  # 每个数据集最多输出的点数
+DOWNSAMPLE_CHART_TYPES = ("line", "scatter")
+BIN_REFINE_STEPS = 4  # 散点分箱时网格最多加密的次数
+
+def lttb_indices(y, threshold, x=None):
+    """
+    Largest-Triangle-Three-Buckets：从序列中选出 threshold 个点的下标，保留折线的形状（峰谷）。
+    首尾两点固定保留，中间按等宽分桶，每桶选出与 上一个选中点、下一桶均值 构成三角形面积最大的点。
+    参数:
+        y (ndarray): 数值序列（NaN 表示缺失，不会被优先选中）
+        x (ndarray): 横坐标，缺省时使用下标
+    返回:
+        ndarray: 递增的下标
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else x
+    # 中间 n-2 个点分成 threshold-2 个桶，edges[i]:edges[i+1] 是第 i 个桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # 每个桶的均值一次算好：第 i 个桶选点时使用第 i+1 个桶的均值（最后一个桶使用末点）
+    counts = np.diff(edges)
+    filled_y = np.where(np.isnan(y), 0.0, y)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(filled_y[1:n - 1], edges[:-1] - 1) / counts
+    next_x = np.append(mean_x[1:], x[n - 1])
+    next_y = np.append(mean_y[1:], filled_y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[previous] - next_x[bucket]) * (by - filled_y[previous])
+                      - (x[previous] - bx) * (next_y[bucket] - filled_y[previous]))
+        area = np.where(np.isnan(area), -1.0, area)
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+def bin_indices(x, y, max_points):
+    """
+    散点图分箱：把数据范围划分为约 max_points 个网格，每个有点的格子保留一个真实的点（格子中的第一个点），
+    稀疏区域的离群点因此全部保留，密集区域被压缩。
+    返回:
+        ndarray: 递增的下标
+    """
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    if len(valid) <= max_points:
+        return valid
+    vx, vy = _unit_scale(x[valid]), _unit_scale(y[valid])
+    # 数据集中在少数区域时，大部分格子是空的：网格逐步加密，直到保留的点数接近 max_points
+    side = max(1, int(np.sqrt(max_points)))
+    best = None
+    for _ in range(BIN_REFINE_STEPS):
+        cells = np.minimum((vx * side).astype(np.int64), side - 1) * side + np.minimum((vy * side).astype(np.int64), side - 1)
+        _, first = np.unique(cells, return_index=True)
+        if len(first) > max_points and best is not None:
+            break
+        best = first
+        if len(first) >= max_points // 2:
+            break
+        side *= 2
+    return valid[np.sort(best)]
+
+def _unit_scale(values):
+    """线性缩放到 [0, 1]"""
+    low, high = values.min(), values.max()
+    return (values - low) / (high - low) if high > low else np.zeros_like(values)
+
+def _to_float_array(values):
+    """数值列表转换为 float 数组（None 转为 NaN）；含有 {x, y} 点对象、字符串等非数值时抛出 TypeError / ValueError"""
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+def _plain(array):
+    """NumPy 数组转换为 JSON 可序列化的列表（NaN 转为 null）"""
+    return [None if v != v else v for v in array.tolist()]
+
+class ChartSeries:
+    """
+    保存一个图表的完整数据（NumPy 数组），按需返回某个范围内降采样后的数据。
+    - 折线图：按下标范围 [start, end) 取样，各数据集的 LTTB 结果取并集，标签随之取子集；
+    - 散点图：按横坐标范围 [x0, x1] 过滤后分箱。
+    范围内的点数不超过 max_points 时返回完整分辨率的数据。
+    """
+
+    def __init__(self, chart_type, labels, datasets, max_points=CHART_MAX_POINTS):
+        self.chart_type = chart_type
+        self.max_points = max_points
+        self.labels = list(labels)
+        if chart_type == "scatter":
+            self.points = [self._scatter_arrays(ds) for ds in datasets]
+            self.total = max((len(px) for px, _ in self.points), default=0)
+        else:
+            self.values = [_to_float_array(ds) for ds in datasets]
+            self.total = max([len(self.labels)] + [len(v) for v in self.values])
+
+    @staticmethod
+    def _scatter_arrays(values):
+        """散点数据可能是 [{x, y}]、[[x, y]] 或纯数值（以下标为横坐标）"""
+        xs, ys = [], []
+        for i, point in enumerate(values):
+            if isinstance(point, dict):
+                xs.append(point.get("x"))
+                ys.append(point.get("y"))
+            elif isinstance(point, (list, tuple)) and len(point) >= 2:
+                xs.append(point[0])
+                ys.append(point[1])
+            else:
+                xs.append(i)
+                ys.append(point)
+        return _to_float_array(xs), _to_float_array(ys)
+
+    def view(self, start=None, end=None, x0=None, x1=None):
+        """
+        返回范围内降采样后的数据。
+        返回:
+            dict: 折线图 {"labels", "datasets", "indices", "shown", "in_range"}；
+                  散点图 {"datasets", "shown", "in_range"}，数据集为 [{x, y}]
+        """
+        if self.chart_type == "scatter":
+            return self._scatter_view(x0, x1)
+        start = max(0, int(start or 0))
+        end = min(self.total, int(end if end is not None else self.total))
+        in_range = max(0, end - start)
+        if in_range <= self.max_points:
+            indices = np.arange(start, end)
+        else:
+            chosen = [lttb_indices(values[start:end], self.max_points) + start for values in self.values if len(values) > start]
+            indices = np.unique(np.concatenate(chosen)) if chosen else np.arange(0)
+        datasets = []
+        for values in self.values:
+            picked = indices[indices < len(values)]
+            datasets.append(_plain(values[picked]))
+        labels = [self.labels[i] if i < len(self.labels) else i for i in indices.tolist()]
+        return {"labels": labels, "datasets": datasets, "indices": indices.tolist(),
+                "shown": len(indices), "in_range": in_range}
+
+    def query(self, params):
+        """Artifacts 服务器取数接口：查询参数（字符串）转换后调用 view"""
+        def number(name, convert):
+            value = params.get(name)
+            return convert(float(value)) if value not in (None, "") else None
+        return self.view(number("start", int), number("end", int), number("x0", float), number("x1", float))
+
+    def _scatter_view(self, x0, x1):
+        datasets, shown, in_range = [], 0, 0
+        for xs, ys in self.points:
+            mask = np.ones(len(xs), dtype=bool)
+            if x0 is not None:
+                mask &= xs >= float(x0)
+            if x1 is not None:
+                mask &= xs <= float(x1)
+            candidates = np.flatnonzero(mask)
+            picked = candidates[bin_indices(xs[candidates], ys[candidates], self.max_points)]
+            datasets.append([{"x": x, "y": y} for x, y in zip(_plain(xs[picked]), _plain(ys[picked]))])
+            shown += len(picked)
+            in_range += len(candidates)
+        return {"datasets": datasets, "shown": shown, "in_range": in_range}
+
+def make_series(chart_type, labels, datasets, max_points=CHART_MAX_POINTS):
+    """
+    数据量超过 max_points 的折线图/散点图返回 ChartSeries，否则（或未安装 numpy 时）返回 None，按原样输出。
+    参数:
+        datasets (list): 每个数据集的数值列表（散点图也可以是 {x, y} / [x, y] 点）
+    折线图按下标降采样，数据是 {x, y} 点对象等非数值时无法按下标取样，同样返回 None。
+    """
+    if chart_type not in DOWNSAMPLE_CHART_TYPES:
+        return None
+    largest = max([len(values) for values in datasets] + [0])
+    if largest <= max_points:
+        return None
+    if np is None:
+        logging.warning("[图表降采样] 图表有 %d 个点，但未安装 numpy，按原样输出（pip install numpy）", largest)
+        return None
+    try:
+        return ChartSeries(chart_type, labels, datasets, max_points)
+    except (TypeError, ValueError) as e:
+        logging.warning("[图表降采样] %s 图的数据不是纯数值，按原样输出: %s", chart_type, e)
+        return None
@@ -0,0 +1,86 @@
+# chat_history.py (v1.0 - 不可变消息与写时复制的对话历史：快照 O(1)，各线程共享消息正文)
+
+class Message:
+    """
+    不可变的对话消息（使用 __slots__，没有实例字典）。
+    兼容原先的字典用法：msg["role"]、msg.get("content")。
+    """
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        object.__setattr__(self, "role", role)
+        object.__setattr__(self, "content", content)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Message 是不可变对象")
+
+    def __getitem__(self, key):
+        if key in Message.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in Message.__slots__ else default
+
+    def __eq__(self, other):
+        return isinstance(other, Message) and self.role == other.role and self.content == other.content
+
+    def __hash__(self):
+        return hash((self.role, self.content))
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:30]!r}...)"
+
+    def to_dict(self):
+        """转换为 API 需要的字典（正文字符串共享，不复制）"""
+        return {"role": self.role, "content": self.content}
+
+class HistorySnapshot:
+    """
+    对话历史的只读快照：系统消息 + 共享的消息列表前 length 条。
+    ChatManager 的消息列表只追加、不修改（新建/切换对话时换成新列表），
+    因此快照只需记住列表引用和长度，创建为 O(1)，之后的追加对快照不可见。
+    """
+    __slots__ = ("system", "_messages", "_length")
+
+    def __init__(self, system, messages, length):
+        self.system = system
+        self._messages = messages
+        self._length = length
+
+    def __len__(self):
+        return self._length + (1 if self.system is not None else 0)
+
+    def __iter__(self):
+        if self.system is not None:
+            yield self.system
+        messages = self._messages
+        for i in range(self._length):
+            yield messages[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if self.system is not None:
+            if index == 0:
+                return self.system
+            index -= 1
+        if not 0 <= index < self._length:
+            raise IndexError("快照索引超出范围")
+        return self._messages[index]
+
+    def with_system(self, content):
+        """返回替换了系统消息的新快照（O(1)，不复制对话消息）"""
+        return HistorySnapshot(Message("system", content), self._messages, self._length)
+
+    def to_api_messages(self):
+        """转换为发送给 API 的字典列表"""
+        return [msg.to_dict() for msg in self]
+
+def to_api_messages(history):
+    """把快照或消息列表（Message / dict 混合）转换为 API 需要的字典列表"""
+    if isinstance(history, HistorySnapshot):
+        return history.to_api_messages()
+    return [msg.to_dict() if isinstance(msg, Message) else msg for msg in history]
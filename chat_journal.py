@@ -0,0 +1,207 @@
+# chat_journal.py (v1.1 - 对话写入日志：界面线程只入队，专用写线程批量追加日志、按策略 fsync 并写入 SQLite，写库失败时与下一批一起重试，崩溃后重放)
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from utils import get_data_dir
+
+# fsync 策略：距上次 fsync 超过该毫秒数时才 fsync（0 表示每批都 fsync），关闭时总会 fsync
+JOURNAL_FSYNC_MS = int(os.getenv("CHAT_JOURNAL_FSYNC_MS", "200"))
+JOURNAL_BATCH_WAIT_MS = 50  # 收到第一条记录后再等待这么久以攒批
+JOURNAL_ROTATE_BYTES = 4 * 1024 * 1024  # 日志超过该大小且没有进行中的流式回答时截断
+
+RECOVERED_SUFFIX = "\n\n（程序在生成回答时意外退出，以上为恢复的部分内容）"
+
+class ChatJournal:
+    """
+    追加写的对话日志（JSON Lines），位于对话数据库之前：
+    - create_chat / append_message / stream_delta / stream_end 只把记录放入内存队列，调用方（包括 Tk 主线程）不做磁盘 I/O；
+    - 写线程批量取出记录，先追加到日志文件（按 fsync 策略刷盘），再在一个事务中写入 ChatStore；
+    - 启动时重放日志中尚未写入数据库的记录，并把没有 stream_end 的流式回答恢复为一条助手消息。
+    """
+
+    JOURNAL_FILE_NAME = "chats.journal"
+
+    def __init__(self, chat_store, journal_path=None, fsync_ms=JOURNAL_FSYNC_MS):
+        self.chat_store = chat_store
+        self.journal_path = journal_path or get_data_dir() / self.JOURNAL_FILE_NAME
+        self.fsync_interval = fsync_ms / 1000.0
+        self._queue = queue.Queue()
+        self._seq_lock = threading.Lock()
+        self._applied = threading.Condition()
+        self._applied_seq = self._next_seq = self.chat_store.get_journal_seq()
+        self._active_streams = set()  # 有增量但尚未结束的流（对话 id）
+        self._unapplied = []  # 写入数据库失败、留待与下一批一起重试的记录（journal_seq 在它们写入前不前进）
+        self._unapplied_seq = None
+
+        self._replay()
+        self._file = open(self.journal_path, 'ab')
+        self._last_fsync = time.time()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-journal-writer", daemon=True)
+        self._writer.start()
+        logging.info("[对话日志] 写线程已启动，日志: %s，fsync 间隔: %d ms", self.journal_path, fsync_ms)
+
+    # --- 入队接口（任意线程调用，只操作内存队列） ---
+    def _push(self, op, **fields):
+        with self._seq_lock:
+            self._next_seq += 1
+            record = {"seq": self._next_seq, "op": op, **fields}
+            self._queue.put(record)
+        return record["seq"]
+
+    def create_chat(self, chat_id, title):
+        return self._push("create_chat", chat_id=chat_id, title=title, ts=time.time())
+
+    def append_message(self, chat_id, role, content):
+        return self._push("append", chat_id=chat_id, role=role, content=content, ts=time.time())
+
+    def stream_delta(self, chat_id, text):
+        """记录流式回答的增量文本（只写日志，不写数据库），用于崩溃后恢复"""
+        return self._push("delta", chat_id=chat_id, text=text)
+
+    def stream_end(self, chat_id):
+        """流式回答结束（无论是否保存为消息），之前的增量不再需要恢复"""
+        return self._push("stream_end", chat_id=chat_id)
+
+    def flush(self, timeout=2.0):
+        """
+        等待此前入队的记录全部写入数据库（供读取前调用，不应在 Tk 主线程中长时间等待）。
+        返回:
+            bool: 是否在超时前完成
+        """
+        with self._seq_lock:
+            target = self._next_seq
+        with self._applied:
+            return self._applied.wait_for(lambda: self._applied_seq >= target, timeout)
+
+    # --- 写线程 ---
+    def _writer_loop(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.time() + JOURNAL_BATCH_WAIT_MS / 1000.0
+            stop = False
+            while True:
+                try:
+                    record = self._queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write_batch(batch)
+            if stop:
+                break
+        if self._unapplied:
+            self._apply_pending(self._unapplied_seq)  # 关闭前最后重试一次
+
+    def _write_batch(self, batch):
+        try:
+            self._file.write(b"".join(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n" for record in batch))
+            self._file.flush()
+            if time.time() - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.time()
+        except Exception as e:
+            logging.error("[对话日志] 写入日志文件出错: %s", e)
+
+        for record in batch:
+            if record["op"] == "delta":
+                self._active_streams.add(record["chat_id"])
+            elif record["op"] == "stream_end":
+                self._active_streams.discard(record["chat_id"])
+        self._unapplied.extend(r for r in batch if r["op"] in ("create_chat", "append"))
+        if self._apply_pending(batch[-1]["seq"]) and not self._active_streams and self._file.tell() >= JOURNAL_ROTATE_BYTES:
+            self._truncate()
+
+    def _apply_pending(self, last_seq):
+        """
+        在一个事务中把待写记录（包括此前写入失败的）写入数据库，成功后 journal_seq 才前进到 last_seq。
+        失败时记录全部保留，与下一批一起重试；日志文件不会截断，崩溃后也能重放。
+        返回:
+            bool: 是否写入成功
+        """
+        try:
+            self.chat_store.apply_journal_batch(self._unapplied, last_seq)
+        except Exception as e:
+            self._unapplied_seq = last_seq
+            logging.error("[对话日志] 写入数据库出错，%d 条记录留待与下一批一起重试: %s", len(self._unapplied), e)
+            return False
+        count = len(self._unapplied)
+        self._unapplied = []
+        self._unapplied_seq = None
+        with self._applied:
+            self._applied_seq = last_seq
+            self._applied.notify_all()
+        logging.debug("[对话日志] 已写入 %d 条记录 (seq <= %d)", count, last_seq)
+        return True
+
+    def _truncate(self):
+        """所有记录都已写入数据库时清空日志文件"""
+        try:
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+            logging.info("[对话日志] 日志已截断")
+        except Exception as e:
+            logging.warning("[对话日志] 截断日志出错: %s", e)
+
+    # --- 启动重放 ---
+    def _replay(self):
+        """重放上次运行中未写入数据库的记录，并恢复未完成的流式回答，然后清空日志"""
+        if not os.path.exists(self.journal_path):
+            return
+        applied_seq = self.chat_store.get_journal_seq()
+        pending = []
+        partial_streams = {}  # 对话 id -> 增量文本列表
+        max_seq = applied_seq
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning("[对话日志] 跳过不完整的日志行（可能是崩溃时写了一半）")
+                    continue
+                max_seq = max(max_seq, record["seq"])
+                op = record["op"]
+                if op == "delta":
+                    partial_streams.setdefault(record["chat_id"], []).append(record["text"])
+                elif op == "stream_end":
+                    partial_streams.pop(record["chat_id"], None)
+                elif record["seq"] > applied_seq:
+                    pending.append(record)
+
+        for chat_id, parts in partial_streams.items():
+            max_seq += 1
+            pending.append({"seq": max_seq, "op": "append", "chat_id": chat_id, "role": "assistant",
+                            "content": "".join(parts) + RECOVERED_SUFFIX, "ts": time.time()})
+        if pending or max_seq > applied_seq:
+            self.chat_store.apply_journal_batch(pending, max_seq)
+        self._applied_seq = self._next_seq = max_seq
+        os.remove(self.journal_path)
+        logging.info("[对话日志] 重放完成：补写 %d 条记录，恢复 %d 个未完成的回答", len(pending), len(partial_streams))
+
+    # --- 关闭 ---
+    def close(self):
+        """写完队列中的剩余记录、fsync 并关闭日志；全部写入数据库后删除日志文件"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        try:
+            os.fsync(self._file.fileno())
+            fully_applied = self._applied_seq >= self._next_seq and not self._active_streams
+            self._file.close()
+            if fully_applied:
+                os.remove(self.journal_path)
+            logging.info("[对话日志] 已关闭 (全部写入数据库: %s)", fully_applied)
+        except Exception as e:
+            logging.warning("[对话日志] 关闭日志时出错: %s", e)
@@ -1,9 +1,13 @@
 # chat_manager.py
 import threading
+import uuid
 from pathlib import Path
 from utils import get_data_dir
 import json
 import logging
+from chat_store import ChatStore, default_chat_title
+from chat_journal import ChatJournal
+from chat_history import Message, HistorySnapshot
 
 # 导入硬编码的提示词
 from prompts import PROMPT_DEFAULT, PROMPT_NETWORKING, PROMPT_ARTIFACTS, PROMPT_ATRI, PROMPT_TRANSLATE
@@ -22,82 +26,154 @@ def load_prompts_from_config():
             "PROMPT_TRANSLATE": PROMPT_TRANSLATE
         }
 
+# 模式位掩码
+MODE_ATRI = 1 << 0
+MODE_ARTIFACTS = 1 << 1
+MODE_SEARCH = 1 << 2
+MODE_TRANSLATE = 1 << 3
+# 会改变系统提示词的模式（联网提示词在发送时动态添加，不在其中）
+PROMPT_MODE_MASK = MODE_ATRI | MODE_ARTIFACTS | MODE_TRANSLATE
+
 class ChatManager:
-    def __init__(self):
-        self.current_history = []
-        self.search_mode = False   # 搜索模式状态
-        self.atri_mode = False     # ATRI模式状态
-        self.artifacts_mode = False  # 新增Artifacts模式状态
-        self.translate_mode = False  # 新增翻译模式状态
+    def __init__(self, chat_store=None):
+        # 对话历史：系统消息单独存放，其余消息为只追加的 Message 列表（新建/切换对话时换成新列表）
+        self.system_message = None
+        self.messages = []
+        self.chat_store = chat_store or ChatStore()  # 持久化存储（SQLite）
+        self.journal = ChatJournal(self.chat_store)  # 写入先入队，由日志写线程落盘并写入数据库
+        self.current_chat_id = None  # 当前对话 id，首条消息写入时才在存储中创建
+        self.mode_flags = 0  # 各模式开关的位掩码 (MODE_*)
         self.custom_atri_prompt = None  # 存储用户自定义的ATRI提示词
         self.custom_prompts = load_prompts_from_config()  # 从配置文件加载提示词
+        self.prompt_version = 0  # 提示词内容每次修改加一，作为缓存键的一部分
+        self._system_message_cache = {}  # (模式位掩码, 提示词版本) -> 系统消息
         self._lock = threading.Lock() # 使用实例锁
         self._initialize_history()
         print("--- ChatManager 初始化完成 ---")
 
-    def _load_system_prompt(self):
+    # --- 模式状态（由位掩码派生） ---
+    search_mode = property(lambda self: bool(self.mode_flags & MODE_SEARCH))
+    atri_mode = property(lambda self: bool(self.mode_flags & MODE_ATRI))
+    artifacts_mode = property(lambda self: bool(self.mode_flags & MODE_ARTIFACTS))
+    translate_mode = property(lambda self: bool(self.mode_flags & MODE_TRANSLATE))
+
+    def _compose_system_prompt(self, flags):
         """
-        根据当前启用的模式组合系统提示词，按优先级顺序：ATRI > Artifacts > 联网 > 翻译 > 默认。
+        根据模式位掩码组合系统提示词，按优先级顺序：ATRI > Artifacts > 联网 > 翻译 > 默认。
         如果多个模式启用，则组合多个提示词内容；如果无模式启用，则使用默认提示词。
+        联网提示词在发送消息时动态添加，不参与组合。
         """
         try:
             prompt_parts = []
-            
-            # 优先级 1: ATRI 模式（角色扮演）
-            if self.atri_mode:
-                if self.custom_atri_prompt:
-                    prompt_parts.append(self.custom_atri_prompt)
-                    print("=== 加载用户自定义的 ATRI 提示词 ===")
-                else:
-                    prompt_parts.append(PROMPT_ATRI)
-                    print("=== 加载默认的 ATRI 提示词 ===")
-            
-            # 优先级 2: Artifacts 模式
-            if self.artifacts_mode:
+            if flags & MODE_ATRI:
+                prompt_parts.append(self.custom_atri_prompt or PROMPT_ATRI)
+            if flags & MODE_ARTIFACTS:
                 prompt_parts.append(PROMPT_ARTIFACTS)
-                print("--- 添加 Artifacts 模式提示词 ---")
-            
-            # 优先级 3: 联网模式（注意：联网提示词在发送消息时动态处理，此处仅占位）
-            if self.search_mode:
-                print("--- 联网模式已启用，提示词将在消息发送时动态添加 ---")
-                # 联网提示词 PROMPT_NETWORKING 会在 message_handler.py 中动态格式化并插入，此处不添加
-            
-            # 优先级 4: 翻译模式
-            if self.translate_mode:
+            if flags & MODE_TRANSLATE:
                 prompt_parts.append(PROMPT_TRANSLATE)
-                print("--- 添加翻译模式提示词 ---")
-            
-            # 如果有模式启用，组合提示词；否则使用默认提示词
+
             if prompt_parts:
-                combined_prompt = "\n\n--- 分隔线 ---\n\n".join(prompt_parts)
                 print(f"--- 组合了 {len(prompt_parts)} 个模式的提示词 ---")
-                return combined_prompt
-            else:
-                print("--- 无模式启用，使用默认提示词 ---")
-                return PROMPT_DEFAULT
-                
+                return "\n\n--- 分隔线 ---\n\n".join(prompt_parts)
+            print("--- 无模式启用，使用默认提示词 ---")
+            return PROMPT_DEFAULT
         except Exception as e:
             print(f"!!! 组合提示词时出错: {e} !!!")
             return PROMPT_DEFAULT  # 出错时返回默认提示词
 
+    def _get_system_message(self):
+        """按 (模式位掩码, 提示词版本) 取缓存的系统消息，未命中时才重新组合"""
+        key = (self.mode_flags & PROMPT_MODE_MASK, self.prompt_version)
+        message = self._system_message_cache.get(key)
+        if message is None:
+            message = Message("system", self._compose_system_prompt(key[0]))
+            self._system_message_cache[key] = message
+        return message
+
+    def _load_system_prompt(self):
+        """返回当前模式组合对应的系统提示词"""
+        return self._get_system_message().content
+
+    def _refresh_system_message(self, reason):
+        """把系统消息槽替换为当前模式对应的（缓存的）系统消息，保留聊天历史"""
+        message = self._get_system_message()
+        with self._lock:
+            self.system_message = message
+        print(f"--- 由于{reason}，已更新系统提示词，但保留聊天历史 ---")
+
+    def _bump_prompt_version(self):
+        """提示词内容变化：版本加一，丢弃旧版本的缓存"""
+        self.prompt_version += 1
+        self._system_message_cache.clear()
+
     def _initialize_history(self):
         """初始化对话历史（带系统提示词）"""
-        system_prompt = self._load_system_prompt()
+        system_message = self._get_system_message()
         with self._lock:
-            self.current_history = [{"role": "system", "content": system_prompt}]
+            self.system_message = system_message
+            self.messages = []
 
     def get_current_history(self):
-        """获取当前对话历史的副本"""
+        """
+        获取当前对话历史的只读快照（O(1)，不复制消息）。
+        快照与 ChatManager 共享消息对象，之后追加的消息对已取得的快照不可见。
+        """
         with self._lock:
-            # 返回副本以防止外部修改影响内部状态
-            return [msg.copy() for msg in self.current_history]
+            return HistorySnapshot(self.system_message, self.messages, len(self.messages))
 
     def create_new_chat(self):
         """新建对话（重新加载提示词）"""
         print("--- 新建对话 ---")
         self._initialize_history() # 会根据当前 atri_mode 或 artifacts_mode 加载正确的 prompt
+        with self._lock:
+            self.current_chat_id = None  # 空对话不落盘，首条消息时再创建
         return True
 
+    def read_chat(self, chat_id):
+        """
+        按 id 从存储中读取一个已保存对话的消息（在后台线程调用：会等待日志写入数据库）。
+        返回:
+            list | None: 消息列表；对话不存在时为 None
+        """
+        self.journal.flush()
+        if not self.chat_store.get_chat(chat_id):
+            print(f"--- [ChatManager] 对话 {chat_id} 不存在 ---")
+            return None
+        return [Message(msg["role"], msg["content"]) for msg in self.chat_store.load_messages(chat_id)]
+
+    def load_chat(self, chat_id, messages):
+        """把 read_chat 读取的对话设为当前对话（系统提示词按当前模式重新生成），不做磁盘 I/O"""
+        system_message = self._get_system_message()
+        with self._lock:
+            self.system_message = system_message
+            self.messages = messages
+            self.current_chat_id = chat_id
+        print(f"--- 已加载对话 {chat_id}，共 {len(messages)} 条消息 ---")
+
+    def list_chats(self, limit=50, offset=0):
+        """按最近修改时间列出已保存的对话"""
+        return self.chat_store.list_chats(limit, offset)
+
+    def search_chats(self, query, limit=50):
+        """在所有已保存对话中全文检索消息，返回带高亮片段的结果（在后台线程调用）"""
+        self.journal.flush()
+        return self.chat_store.search_messages(query, limit)
+
+    def record_stream_chunk(self, chunk):
+        """记录当前对话中流式回答的增量，程序崩溃后可恢复已生成的部分"""
+        if self.current_chat_id and chunk:
+            self.journal.stream_delta(self.current_chat_id, chunk)
+
+    def end_stream(self):
+        """流式回答结束，之后不再需要恢复该回答的增量"""
+        if self.current_chat_id:
+            self.journal.stream_end(self.current_chat_id)
+
+    def close(self):
+        """写完日志并关闭持久化存储"""
+        self.journal.close()
+        self.chat_store.close()
+
     def add_message_to_current_chat(self, role, content):
         """添加消息到当前对话"""
         if not content or not role:
@@ -110,75 +186,55 @@ class ChatManager:
              return
 
         with self._lock:
-            self.current_history.append({"role": role, "content": content_str})
+            self.messages.append(Message(role, content_str))
+            if self.current_chat_id is None:
+                self.current_chat_id = str(uuid.uuid4())
+                self.journal.create_chat(self.current_chat_id, default_chat_title())
+            # 只入队，不在调用线程（可能是 Tk 主线程）做磁盘 I/O
+            self.journal.append_message(self.current_chat_id, role, content_str)
+
+    def add_message_to_chat(self, chat_id, role, content):
+        """添加消息到指定对话（如后台下载完成的图像）；该对话仍是当前对话时同时追加到内存中的历史"""
+        content_str = str(content).strip() if content else ""
+        if not chat_id or not role or not content_str:
+            print(f"--- [ChatManager] 尝试向对话 {chat_id} 添加空消息 ({role})，已忽略 ---")
+            return
+        with self._lock:
+            if chat_id == self.current_chat_id:
+                self.messages.append(Message(role, content_str))
+            self.journal.append_message(chat_id, role, content_str)
 
     # --- 模式切换方法 ---
+    def _set_mode(self, flag, enabled, name):
+        """
+        设置一个模式开关。
+        返回:
+            bool: 状态是否发生变化
+        """
+        new_flags = self.mode_flags | flag if enabled else self.mode_flags & ~flag
+        if new_flags == self.mode_flags:
+            return False
+        self.mode_flags = new_flags
+        print(f"--- {name}已{'启用' if enabled else '禁用'} ---")
+        if flag & PROMPT_MODE_MASK:
+            self._refresh_system_message(f"{name}更改")
+        return True
+
     def set_search_mode(self, enabled):
-        """设置搜索模式状态"""
-        if self.search_mode != enabled:
-            self.search_mode = enabled
-            print(f"--- 搜索模式已{'启用' if enabled else '禁用'} ---")
+        """设置搜索模式状态（不影响系统提示词）"""
+        self._set_mode(MODE_SEARCH, enabled, "搜索模式")
 
     def set_atri_mode(self, enabled):
         """设置ATRI模式状态"""
-        if self.atri_mode != enabled:
-            previously_enabled = self.atri_mode
-            self.atri_mode = enabled
-            print(f"--- ATRI模式已{'启用' if enabled else '禁用'} ---")
-
-            # 更新系统提示词，但保留聊天历史
-            system_prompt = self._load_system_prompt()
-            with self._lock:
-                # 检查历史中是否有系统消息，如果有则更新，否则添加
-                found_system = False
-                for i, msg in enumerate(self.current_history):
-                    if msg.get("role") == "system":
-                        self.current_history[i]["content"] = system_prompt
-                        found_system = True
-                        break
-                if not found_system:
-                    self.current_history.insert(0, {"role": "system", "content": system_prompt})
-                print("--- 由于 ATRI 模式更改，已更新系统提示词，但保留聊天历史 ---")
+        self._set_mode(MODE_ATRI, enabled, "ATRI模式")
 
     def set_artifacts_mode(self, enabled):
         """设置Artifacts模式状态"""
-        if self.artifacts_mode != enabled:
-            previously_enabled = self.artifacts_mode
-            self.artifacts_mode = enabled
-            print(f"--- Artifacts模式已{'启用' if enabled else '禁用'} ---")
-
-            # 更新系统提示词，但保留聊天历史
-            system_prompt = self._load_system_prompt()
-            with self._lock:
-                found_system = False
-                for i, msg in enumerate(self.current_history):
-                    if msg.get("role") == "system":
-                        self.current_history[i]["content"] = system_prompt
-                        found_system = True
-                        break
-                if not found_system:
-                    self.current_history.insert(0, {"role": "system", "content": system_prompt})
-                print("--- 由于 Artifacts 模式更改，已更新系统提示词，但保留聊天历史 ---")
+        self._set_mode(MODE_ARTIFACTS, enabled, "Artifacts模式")
 
     def set_translate_mode(self, enabled):
         """设置翻译模式状态"""
-        if self.translate_mode != enabled:
-            previously_enabled = self.translate_mode
-            self.translate_mode = enabled
-            print(f"--- 翻译模式已{'启用' if enabled else '禁用'} ---")
-
-            # 更新系统提示词，但保留聊天历史
-            system_prompt = self._load_system_prompt()
-            with self._lock:
-                found_system = False
-                for i, msg in enumerate(self.current_history):
-                    if msg.get("role") == "system":
-                        self.current_history[i]["content"] = system_prompt
-                        found_system = True
-                        break
-                if not found_system:
-                    self.current_history.insert(0, {"role": "system", "content": system_prompt})
-                print("--- 由于翻译模式更改，已更新系统提示词，但保留聊天历史 ---")
+        self._set_mode(MODE_TRANSLATE, enabled, "翻译模式")
 
     def is_search_mode_enabled(self):
         """返回搜索模式状态"""
@@ -198,20 +254,12 @@ class ChatManager:
 
     def set_custom_atri_prompt(self, custom_prompt):
         """设置用户自定义的ATRI提示词"""
+        if custom_prompt == self.custom_atri_prompt:
+            return
         self.custom_atri_prompt = custom_prompt
         print("--- 已设置用户自定义的 ATRI 提示词 ---")
-        # 更新系统提示词
-        system_prompt = self._load_system_prompt()
-        with self._lock:
-            found_system = False
-            for i, msg in enumerate(self.current_history):
-                if msg.get("role") == "system":
-                    self.current_history[i]["content"] = system_prompt
-                    found_system = True
-                    break
-            if not found_system:
-                self.current_history.insert(0, {"role": "system", "content": system_prompt})
-            print("--- 由于自定义 ATRI 提示词更改，已更新系统提示词，但保留聊天历史 ---")
+        self._bump_prompt_version()
+        self._refresh_system_message("自定义 ATRI 提示词更改")
 
     def get_custom_atri_prompt(self):
         """获取用户自定义的ATRI提示词，如果没有则返回默认值"""
@@ -226,18 +274,8 @@ class ChatManager:
         if prompt_name in self.custom_prompts:
             self.custom_prompts[prompt_name] = content
             print(f"--- 已设置提示词 {prompt_name} ---")
-            # 更新系统提示词
-            system_prompt = self._load_system_prompt()
-            with self._lock:
-                found_system = False
-                for i, msg in enumerate(self.current_history):
-                    if msg.get("role") == "system":
-                        self.current_history[i]["content"] = system_prompt
-                        found_system = True
-                        break
-                if not found_system:
-                    self.current_history.insert(0, {"role": "system", "content": system_prompt})
-                print("--- 由于提示词更改，已更新系统提示词，但保留聊天历史 ---")
+            self._bump_prompt_version()
+            self._refresh_system_message("提示词更改")
 
     def get_all_prompts(self):
         """获取所有提示词的字典"""
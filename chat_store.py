@@ -0,0 +1,326 @@
+# chat_store.py (v1.1 - SQLite 持久化对话存储：WAL 模式，逐条追加消息，按 id 延迟加载，导入 chats_manifest.json，FTS5 全文检索)
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from utils import get_data_dir
+from text_index import split_cjk, join_cjk, split_words
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created TEXT NOT NULL,
+    last_modified REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chats_last_modified ON chats(last_modified DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages(chat_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 全文索引：内容为按汉字切分后的文本，rowid 与 messages.id 一致
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, tokenize = 'unicode61 remove_diacritics 2');
+"""
+FTS_VERSION = "1"
+
+# 检索片段中的高亮标记（界面据此加粗显示命中词）
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+def build_fts_query(query):
+    """
+    把用户输入转换为 FTS5 查询：中文连续字符作为短语（逐字相邻匹配），英文/数字单词做前缀匹配，各部分为 AND 关系。
+    返回:
+        str: FTS5 MATCH 表达式，没有可检索内容时返回空字符串
+    """
+    parts = []
+    for cjk_run, word in split_words(query):
+        if cjk_run:
+            parts.append('"' + " ".join(cjk_run) + '"')
+        else:
+            parts.append(f'"{word}"*')
+    return " ".join(parts)
+
+def default_chat_title():
+    """与 chats_manifest.json 中一致的默认标题格式：新对话 MM-DD HH:MM"""
+    return f"新对话 {datetime.now().strftime('%m-%d %H:%M')}"
+
+class ChatStore:
+    """
+    以 SQLite（WAL 模式）保存所有对话。
+    - 每条消息单独插入一行，不会整文件重写。
+    - 启动时只打开数据库，对话内容在 load_messages 时按 id 读取，启动耗时与对话数量无关。
+    - chats_manifest.json 仅在其修改时间变化时导入一次。
+    """
+
+    DB_FILE_NAME = "chats.db"
+    MANIFEST_FILE_NAME = "chats_manifest.json"
+
+    def __init__(self, db_path=None, manifest_path=None):
+        data_dir = get_data_dir()
+        self.db_path = db_path or data_dir / self.DB_FILE_NAME
+        self.manifest_path = manifest_path or data_dir / self.MANIFEST_FILE_NAME
+        self._lock = threading.Lock()
+        # 连接会被 Tk 主线程和后台线程共用，由 self._lock 串行化
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._conn.executescript(FTS_SCHEMA)
+        self.import_manifest()
+        self._ensure_fts_index()
+        logging.info("[对话存储] 初始化完成，数据库: %s", self.db_path)
+
+    # --- 元数据 ---
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _ensure_fts_index(self):
+        """索引版本变化（或首次启用全文检索）时为已有消息重建索引，其余情况下启动时不做任何工作"""
+        with self._lock:
+            if self._get_meta("fts_version") == FTS_VERSION:
+                return
+            started = time.time()
+            with self._conn:
+                self._conn.execute("DELETE FROM messages_fts")
+                rows = self._conn.execute("SELECT id, content FROM messages")
+                self._conn.executemany(
+                    "INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+                    ((row["id"], split_cjk(row["content"])) for row in rows.fetchall()),
+                )
+                self._set_meta("fts_version", FTS_VERSION)
+        logging.info("[对话存储] 已重建全文索引，耗时 %.2f 秒", time.time() - started)
+
+    # --- 导入 ---
+    def import_manifest(self):
+        """
+        导入 chats_manifest.json 中的对话 id、标题和时间。
+        如果旧版本在 chats/<id>.json 中保存了消息列表，也一并导入。
+        只比较清单文件的修改时间，未变化时不读取文件。
+        """
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return 0
+        with self._lock:
+            if self._get_meta("manifest_mtime") == str(mtime):
+                return 0
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            logging.error("[对话存储] 读取 %s 出错: %s", self.manifest_path, e)
+            return 0
+
+        legacy_dir = os.path.join(os.path.dirname(self.manifest_path), "chats")
+        imported = 0
+        with self._lock, self._conn:
+            for chat_id, info in manifest.items():
+                # 单个条目格式错误时跳过或使用默认值，不影响其余对话的导入和程序启动
+                if not isinstance(info, dict):
+                    logging.warning("[对话存储] 清单中的对话 %s 格式无效，已跳过", chat_id)
+                    continue
+                try:
+                    last_modified = float(info.get("last_modified") or time.time())
+                except (TypeError, ValueError):
+                    logging.warning("[对话存储] 清单中的对话 %s 的 last_modified 无效 (%r)，使用当前时间", chat_id, info.get("last_modified"))
+                    last_modified = time.time()
+                self._conn.execute("SAVEPOINT import_entry")
+                try:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO chats (id, title, created, last_modified) VALUES (?, ?, ?, ?)",
+                        (chat_id, str(info.get("title") or default_chat_title()), str(info.get("created") or ""), last_modified),
+                    )
+                    if cursor.rowcount:
+                        for message in self._read_legacy_messages(legacy_dir, chat_id):
+                            self._insert_message(chat_id, message["role"], message["content"], last_modified)
+                        imported += 1
+                except Exception as e:
+                    self._conn.execute("ROLLBACK TO import_entry")
+                    logging.error("[对话存储] 导入清单中的对话 %s 出错，已跳过: %s", chat_id, e)
+                self._conn.execute("RELEASE import_entry")
+            self._set_meta("manifest_mtime", mtime)
+        logging.info("[对话存储] 已从清单导入 %d 个对话 (清单共 %d 个)", imported, len(manifest))
+        return imported
+
+    def _read_legacy_messages(self, legacy_dir, chat_id):
+        """读取旧版本单个对话文件中的非系统消息，不存在时返回空列表"""
+        path = os.path.join(legacy_dir, f"{chat_id}.json")
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            messages = data.get("messages", []) if isinstance(data, dict) else data
+            return [m for m in messages if isinstance(m, dict) and m.get("role") != "system" and m.get("content")]
+        except Exception as e:
+            logging.warning("[对话存储] 读取旧对话文件 %s 出错: %s", path, e)
+            return []
+
+    # --- 对话 ---
+    def create_chat(self, title=None, chat_id=None):
+        """新建对话并返回其 id"""
+        chat_id = chat_id or str(uuid.uuid4())
+        with self._lock, self._conn:
+            self._insert_chat(chat_id, title, time.time())
+        logging.info("[对话存储] 新建对话: %s", chat_id)
+        return chat_id
+
+    def _insert_chat(self, chat_id, title, created):
+        """插入对话记录，已存在时忽略（调用方需持有锁并处于事务中）"""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO chats (id, title, created, last_modified) VALUES (?, ?, ?, ?)",
+            (chat_id, title or default_chat_title(), datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S"), created),
+        )
+
+    def list_chats(self, limit=50, offset=0):
+        """按最近修改时间分页列出对话（不含消息）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, created, last_modified FROM chats ORDER BY last_modified DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_chat(self, chat_id):
+        """返回对话元数据，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT id, title, created, last_modified FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return dict(row) if row else None
+
+    def rename_chat(self, chat_id, title):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
+
+    def delete_chat(self, chat_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages_fts WHERE rowid IN (SELECT id FROM messages WHERE chat_id = ?)", (chat_id,))
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+        logging.info("[对话存储] 已删除对话: %s", chat_id)
+
+    # --- 消息 ---
+    def append_message(self, chat_id, role, content):
+        """
+        追加一条消息（单行插入），同时更新对话的修改时间。
+        返回:
+            int: 消息 id
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            message_id = self._insert_message(chat_id, role, content, now)
+            self._conn.execute("UPDATE chats SET last_modified = ? WHERE id = ?", (now, chat_id))
+        return message_id
+
+    def _insert_message(self, chat_id, role, content, created):
+        """插入消息并同步写入全文索引（调用方需持有锁并处于事务中）"""
+        cursor = self._conn.execute(
+            "INSERT INTO messages (chat_id, role, content, created) VALUES (?, ?, ?, ?)",
+            (chat_id, role, content, created),
+        )
+        self._conn.execute("INSERT INTO messages_fts (rowid, content) VALUES (?, ?)", (cursor.lastrowid, split_cjk(content)))
+        return cursor.lastrowid
+
+    # --- 日志写入 ---
+    def get_journal_seq(self):
+        """返回已写入数据库的最后一条日志记录序号"""
+        with self._lock:
+            return int(self._get_meta("journal_seq") or 0)
+
+    def apply_journal_batch(self, records, last_seq):
+        """
+        在一个事务中写入一批日志记录（create_chat / append），并记录已写入的序号，
+        保证崩溃重放时既不丢失也不重复。
+        """
+        with self._lock, self._conn:
+            touched = {}
+            for record in records:
+                if record["op"] == "create_chat":
+                    self._insert_chat(record["chat_id"], record.get("title"), record["ts"])
+                elif record["op"] == "append":
+                    self._insert_chat(record["chat_id"], None, record["ts"])
+                    self._insert_message(record["chat_id"], record["role"], record["content"], record["ts"])
+                    touched[record["chat_id"]] = record["ts"]
+            for chat_id, ts in touched.items():
+                self._conn.execute("UPDATE chats SET last_modified = ? WHERE id = ?", (ts, chat_id))
+            self._set_meta("journal_seq", last_seq)
+
+    def load_messages(self, chat_id):
+        """按插入顺序读取对话中的全部消息，返回 [{"role", "content"}]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [{"role": row["role"], "content": row["content"]} for row in rows]
+
+    # --- 全文检索 ---
+    def search_messages(self, query, limit=50, snippet_tokens=48):
+        """
+        在所有对话中检索消息。
+        参数:
+            query (str): 检索词（支持中英文混合）
+            limit (int): 最多返回的条数
+            snippet_tokens (int): 片段长度（以词项计，一个汉字为一个词项）
+        返回:
+            list: 按相关度排序的结果 {"message_id", "chat_id", "title", "role", "created", "snippet"}，
+                  snippet 中命中部分以 HIGHLIGHT_START / HIGHLIGHT_END 包围
+        """
+        fts_query = build_fts_query(query)
+        if not fts_query:
+            return []
+        started = time.time()
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT m.id AS message_id, m.chat_id, c.title, m.role, m.created,
+                           snippet(messages_fts, 0, ?, ?, '…', ?) AS snippet
+                    FROM messages_fts
+                    JOIN messages m ON m.id = messages_fts.rowid
+                    JOIN chats c ON c.id = m.chat_id
+                    WHERE messages_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                    """,
+                    (HIGHLIGHT_START, HIGHLIGHT_END, snippet_tokens, fts_query, limit),
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                logging.warning("[对话存储] 全文检索查询无效 (%s): %s", fts_query, e)
+                return []
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["snippet"] = join_cjk(result["snippet"], HIGHLIGHT_START + HIGHLIGHT_END).replace(HIGHLIGHT_END + HIGHLIGHT_START, "").strip()
+            results.append(result)
+        logging.info("[对话存储] 检索 '%s' 命中 %d 条，耗时 %.1f ms", query, len(results), (time.time() - started) * 1000)
+        return results
+
+    def close(self):
+        """关闭数据库连接（WAL 内容会在关闭时合并回主库）"""
+        with self._lock:
+            try:
+                self._conn.close()
+                logging.info("[对话存储] 数据库已关闭")
+            except Exception as e:
+                logging.warning("[对话存储] 关闭数据库时出错: %s", e)
@@ -0,0 +1,293 @@
+# document_ingest.py (v1.0 - 后台文档解析：进程池流式提取 PDF/DOCX/Markdown/CSV/代码/日志文本，自动识别编码并回报进度)
+import os
+import codecs
+import hashlib
+import zipfile
+import logging
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import estimate_tokens
+
+# 纯文本类文件：按字节流读取并解码
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".markdown", ".rst", ".csv", ".tsv", ".log", ".json", ".jsonl", ".xml", ".yaml", ".yml",
+    ".ini", ".cfg", ".toml", ".html", ".htm", ".css", ".sql",
+    ".py", ".js", ".ts", ".jsx", ".tsx", ".java", ".c", ".h", ".cpp", ".hpp", ".cs", ".go", ".rs", ".rb",
+    ".php", ".swift", ".kt", ".scala", ".lua", ".sh", ".bat", ".ps1", ".r", ".m",
+}
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | {".pdf", ".docx"}
+
+# 供 filedialog 使用的文件类型列表
+FILE_DIALOG_TYPES = [
+    ("支持的文档", " ".join(f"*{ext}" for ext in sorted(SUPPORTED_EXTENSIONS))),
+    ("PDF 文档", "*.pdf"),
+    ("Word 文档", "*.docx"),
+    ("文本/Markdown/CSV/日志", "*.txt *.md *.csv *.log"),
+    ("所有文件", "*.*"),
+]
+
+READ_BLOCK_SIZE = 1024 * 1024  # 每次读取 1MB
+ENCODING_SAMPLE_SIZE = 64 * 1024  # 编码检测采样大小
+PROGRESS_STEP = 0.02  # 进度变化超过 2% 才回报，避免进度消息过多
+
+_WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# --- 进程池（主进程内共享） ---
+_process_pool = None
+_progress_manager = None
+_progress_queue = None
+
+def get_process_pool():
+    """获取共享的解析进程池（延迟创建）"""
+    global _process_pool
+    if _process_pool is None:
+        max_workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        _process_pool = ProcessPoolExecutor(max_workers=max_workers)
+        logging.info("[文档解析] 已创建进程池，进程数: %d", max_workers)
+    return _process_pool
+
+def get_progress_queue():
+    """获取跨进程的进度队列（延迟创建，由 Manager 进程托管）"""
+    global _progress_manager, _progress_queue
+    if _progress_queue is None:
+        _progress_manager = multiprocessing.Manager()
+        _progress_queue = _progress_manager.Queue()
+    return _progress_queue
+
+def shutdown_process_pool():
+    """关闭进程池与进度队列，取消尚未开始的任务"""
+    global _process_pool, _progress_manager, _progress_queue
+    if _process_pool is not None:
+        try:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            logging.info("[文档解析] 进程池已关闭")
+        except Exception as e:
+            logging.warning("[文档解析] 关闭进程池时出错: %s", e)
+        _process_pool = None
+    if _progress_manager is not None:
+        try:
+            _progress_manager.shutdown()
+        except Exception as e:
+            logging.warning("[文档解析] 关闭进度队列时出错: %s", e)
+        _progress_manager = None
+        _progress_queue = None
+
+# --- 编码检测 ---
+def detect_encoding(sample):
+    """
+    检测字节样本的编码。
+    依次检查 BOM、UTF-8、GB18030（中文内容），再交给 charset_normalizer 判断，失败时回退到 gb18030。
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    try:
+        # 采样可能在多字节字符中间截断，使用增量解码器忽略末尾不完整的字节
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if _looks_like_gb18030(sample):
+        return "gb18030"
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best and best.encoding:
+            return best.encoding
+    except Exception as e:
+        logging.warning("[文档解析] charset_normalizer 检测编码失败: %s", e)
+    return "gb18030"
+
+def _looks_like_gb18030(sample):
+    """中文 Windows 环境下最常见的非 UTF-8 编码：能按 GB18030 解码且非 ASCII 字符基本都是汉字或全角标点"""
+    try:
+        text = codecs.getincrementaldecoder("gb18030")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    non_ascii = [ch for ch in text if ord(ch) > 0x7F]
+    if not non_ascii:
+        return False
+    cjk = sum(1 for ch in non_ascii if '\u4e00' <= ch <= '\u9fff' or '\u3000' <= ch <= '\u303f' or '\uff00' <= ch <= '\uffef')
+    return cjk / len(non_ascii) >= 0.9
+
+# --- 各类型提取器（均为生成器，产出 (文本片段, 进度 0~1)） ---
+def _iter_text_file(path):
+    total = os.path.getsize(path) or 1
+    with open(path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+        encoding = detect_encoding(sample)
+        yield None, encoding  # 首个产出用于告知编码
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        read_bytes = len(sample)
+        block = sample
+        while block:
+            yield decoder.decode(block), read_bytes / total
+            block = f.read(READ_BLOCK_SIZE)
+            read_bytes += len(block)
+        yield decoder.decode(b"", final=True), 1.0
+
+class _CountingReader:
+    """包装文件对象，统计已读取的字节数以计算进度"""
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+def _iter_docx(path):
+    yield None, "docx"
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo("word/document.xml")
+        total = info.file_size or 1
+        with archive.open(info) as raw:
+            reader = _CountingReader(raw)
+            parts = []
+            for event, elem in ET.iterparse(reader, events=("end",)):
+                tag = elem.tag
+                if tag == _WORD_NAMESPACE + "t" and elem.text:
+                    parts.append(elem.text)
+                elif tag == _WORD_NAMESPACE + "tab":
+                    parts.append("\t")
+                elif tag in (_WORD_NAMESPACE + "br", _WORD_NAMESPACE + "cr"):
+                    parts.append("\n")
+                elif tag == _WORD_NAMESPACE + "p":
+                    parts.append("\n")
+                    yield "".join(parts), reader.count / total
+                    parts = []
+                    elem.clear()  # 释放已处理的段落，保持内存平稳
+            if parts:
+                yield "".join(parts), 1.0
+
+def _iter_pdf(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("解析 PDF 需要安装 pypdf（pip install pypdf）")
+    yield None, "pdf"
+    reader = PdfReader(path)
+    page_count = len(reader.pages) or 1
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        yield f"{text}\n\n", page_number / page_count
+
+def _iter_document(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return _iter_pdf(path)
+    if ext == ".docx":
+        return _iter_docx(path)
+    return _iter_text_file(path)
+
+# --- 子进程入口 ---
+def extract_to_file(source_path, output_path, progress_queue=None, job_id=None):
+    """
+    在子进程中运行：流式提取文档文本并写入 output_path（UTF-8），同时计算哈希和统计信息。
+    返回:
+        dict: digest、size、chars、lines、tokens、encoding
+    """
+    hasher = hashlib.sha256()
+    size = chars = lines = tokens = 0
+    encoding = None
+    last_reported = 0.0
+    last_char = ""
+    with open(output_path, 'wb') as out:
+        pieces = _iter_document(source_path)
+        for text, progress in pieces:
+            if text is None:
+                encoding = progress
+                continue
+            if text:
+                data = text.encode('utf-8')
+                out.write(data)
+                hasher.update(data)
+                size += len(data)
+                chars += len(text)
+                lines += text.count("\n")
+                tokens += estimate_tokens(text)
+                last_char = text[-1]
+            if progress_queue is not None and progress - last_reported >= PROGRESS_STEP:
+                progress_queue.put((job_id, progress))
+                last_reported = progress
+    if chars and last_char != "\n":
+        lines += 1
+    if progress_queue is not None:
+        progress_queue.put((job_id, 1.0))
+    return {"digest": hasher.hexdigest(), "size": size, "chars": chars, "lines": lines, "tokens": tokens, "encoding": encoding}
+
+# --- 主进程侧接口 ---
+class DocumentIngestor:
+    """在进程池中解析上传的文档，并把结果并入附件存储"""
+
+    def __init__(self, attachment_store):
+        self.attachment_store = attachment_store
+        self.jobs = {}  # job_id -> 任务信息
+        self._next_job_id = 0
+
+    def is_supported(self, path):
+        return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+    def submit(self, path):
+        """
+        提交一个解析任务。
+        返回:
+            int: 任务编号
+        """
+        self._next_job_id += 1
+        job_id = self._next_job_id
+        staging_path = self.attachment_store.new_staging_path()
+        future = get_process_pool().submit(extract_to_file, path, str(staging_path), get_progress_queue(), job_id)
+        self.jobs[job_id] = {
+            "path": path,
+            "name": os.path.basename(path),
+            "staging_path": staging_path,
+            "future": future,
+            "progress": 0.0,
+        }
+        logging.info("[文档解析] 已提交解析任务 #%d: %s", job_id, path)
+        return job_id
+
+    def drain_progress(self):
+        """取出进度队列中的所有更新（非阻塞），更新各任务的进度"""
+        if _progress_queue is None:
+            return
+        while True:
+            try:
+                job_id, progress = _progress_queue.get_nowait()
+            except Exception:
+                break
+            if job_id in self.jobs:
+                self.jobs[job_id]["progress"] = progress
+
+    def collect_finished(self):
+        """
+        收集已完成的任务，成功的结果并入附件存储。
+        返回:
+            list: (job, record, error) 列表，成功时 error 为 None
+        """
+        finished = []
+        for job_id in [jid for jid, job in self.jobs.items() if job["future"].done()]:
+            job = self.jobs.pop(job_id)
+            try:
+                meta = job["future"].result()
+                record, is_new = self.attachment_store.adopt(job["staging_path"], meta, job["name"])
+                record["encoding"] = meta.get("encoding")
+                logging.info("[文档解析] 任务 #%d 完成: %s (编码: %s, %d 字符)", job_id, job["name"], meta.get("encoding"), meta["chars"])
+                finished.append((job, record, None))
+            except Exception as e:
+                logging.error("[文档解析] 任务 #%d 失败: %s", job_id, e)
+                try:
+                    if os.path.exists(job["staging_path"]):
+                        os.remove(job["staging_path"])
+                except OSError:
+                    pass
+                finished.append((job, None, e))
+        return finished
+
+    def has_pending_jobs(self):
+        return bool(self.jobs)
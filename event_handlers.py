@@ -1,29 +1,33 @@
-# event_handlers.py (v3.46 - 修正 SettingsWindow 调用参数)
+# event_handlers.py (v3.53 - 修正 SettingsWindow 调用参数，聊天区内嵌图像预览，Artifacts 由本地服务器推送到同一页面，Chart.js 与共用样式离线打包，Artifacts 统一由预编译模板在后台线程流式渲染，临时页面由统一临时目录管理，图像预览使用图像库缩略图，发布 Artifacts 时不再复制页面，打开已保存对话时在后台线程读取)
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import threading
+import time
 import os
 import sys
 from pathlib import Path
 import webbrowser
 import requests
-import tempfile
-import datetime
 from PIL import Image, ImageTk
-import json
 import logging
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 # 导入其他需要的模块 (从项目中)
 import api_client
 import grok_client
 import web_search
-from ui_components import SettingsWindow
+from ui_components import SettingsWindow, ChatSearchWindow
 from ui_formatter import apply_simple_formatting
 from ui_builder import get_theme_colors
 from message_handler import MessageHandler
 from image_handler import ImageHandler
+from image_preview import InlineImagePreviews
+from image_library import get_image_library
+from artifact_server import get_artifact_server
+from artifact_renderer import render_artifact, write_chunks, encode_chunks
+from temp_manager import get_temp_manager
 from prompts import PROMPT_DEFAULT
 
 class AppController:
@@ -47,8 +51,9 @@ class AppController:
         self.is_streaming = False
         self.accumulated_stream_text = ""
         self.settings_window = None
-        self.image_references = []  # 存储图像引用以防止垃圾回收
-        self.current_image_label = None  # 存储当前显示的图像标签引用
+        self.chat_search_window = None
+        self.image_previews = None  # 聊天区内嵌图像预览（PhotoImage 由按字节限额的 LRU 缓存持有）
+        self._artifact_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-render")  # 按提交顺序渲染 Artifacts
 
         # --- 获取后端配置列表 ---
         self.backend_configs = config.get('backend_configs', [])  # 只包含 API
@@ -95,6 +100,8 @@ class AppController:
         """设置 UI 控件的引用"""
         self.status_label = self.ui.get('status_label')
         self.chat_display = self.ui.get('chat_display')  # 使用固定的 Textbox
+        # 图像库中的图像预览时解码缩略图，不解码原图
+        self.image_previews = InlineImagePreviews(self.app, self.chat_display, source_for=lambda path: get_image_library().preview_path(path))
         self.input_entry = self.ui.get('input_entry')
         self.search_button = self.ui.get('search_button')
         self.search_var = self.ui.get('search_var')
@@ -177,6 +184,50 @@ class AppController:
             self.settings_window.set_intermediate_model(self.image_handler.intermediate_model)
         self.settings_window.grab_set()
 
+    def open_chat_search_window(self):
+        """打开对话搜索窗口"""
+        if self.chat_search_window is not None and self.chat_search_window.winfo_exists():
+            self.chat_search_window.focus()
+            return
+        logging.info("打开对话搜索窗口")
+        self.chat_search_window = ChatSearchWindow(
+            master=self.app,
+            chat_manager_ref=self.chat_manager,
+            open_chat_func=self.handle_open_chat
+        )
+
+    def handle_open_chat(self, chat_id):
+        """打开一个已保存的对话"""
+        if self.is_streaming:
+            messagebox.showwarning("操作冲突", "正在处理消息，请等待完成后再切换对话。")
+            return
+        logging.info("用户打开对话: %s", chat_id)
+        if self.status_label: self.status_label.configure(text="正在打开对话...")
+        # 读取前要等待日志写入数据库（可能需要几秒），在后台线程中完成
+        threading.Thread(target=self._read_chat_thread, args=(chat_id,), daemon=True).start()
+
+    def _read_chat_thread(self, chat_id):
+        """后台线程：读取对话消息，回到主线程切换"""
+        try:
+            messages = self.chat_manager.read_chat(chat_id)
+        except Exception as e:
+            logging.error("读取对话 %s 时出错: %s", chat_id, e)
+            messages = None
+        self.app.after(0, self._finish_open_chat, chat_id, messages)
+
+    def _finish_open_chat(self, chat_id, messages):
+        """主线程：切换到读取好的对话并显示"""
+        if self.status_label: self.status_label.configure(text="")
+        if messages is None:
+            messagebox.showerror("错误", "无法打开该对话，它可能已被删除。")
+            return
+        if self.is_streaming:
+            logging.info("读取对话 %s 期间开始了新的消息处理，不再切换", chat_id)
+            return
+        self.chat_manager.load_chat(chat_id, messages)
+        self.message_handler.reset_sent_attachments()
+        self.display_full_history()
+
     # --- 新增函数：更新所有按钮的外观 ---
     def update_button_appearance(self):
         """根据当前模式状态更新所有按钮的外观"""
@@ -401,12 +452,9 @@ class AppController:
             logging.error("[错误] chat_display 未初始化，无法显示历史")
             return
 
-        # 清除之前的图像控件
-        if self.current_image_label:
-            self.current_image_label.destroy()
-            self.current_image_label = None
-            self.image_references.clear()
-            logging.info("[新建对话] 已清除之前的图像控件")
+        # 清除之前的图像预览（聊天区内容随后被清空）
+        if self.image_previews:
+            self.image_previews.clear()
 
         self.chat_display.configure(state="normal")
         self.chat_display.delete("1.0", "end")
@@ -434,6 +482,7 @@ class AppController:
             return
         logging.info("用户请求新对话")
         if self.chat_manager.create_new_chat():
+            self.message_handler.reset_sent_attachments()
             self.display_full_history()
             logging.info("成功创建新对话")
         else:
@@ -479,551 +528,106 @@ class AppController:
                 pass
             return False
 
-    # --- 新增处理Artifacts内容函数 ---
-    def handle_artifacts_content(self, content):
-        """将AI生成的纯文本内容保存为HTML文件并在浏览器中打开"""
+    # --- Artifacts 统一渲染与显示路径 ---
+    def show_artifact(self, kind, payload, label):
+        """
+        显示一个 Artifact 页面。解析数据、渲染模板和发布都在渲染线程中进行，Tk 主线程只提交任务。
+        优先发布到本地 Artifacts 服务器：已打开的页面通过 SSE 原地更新，只有没有页面连接时才打开浏览器；
+        服务器不可用时退回到流式写入临时文件并打开。
+        参数:
+            kind (str): 类型（text/chart/table/html/image），决定使用的模板
+            payload: AI 返回的数据（dict 或 JSON 字符串；text 为纯文本，image 为图片路径）
+            label (str): 在聊天区提示中使用的中文名称
+        """
+        self._artifact_executor.submit(self._render_and_publish_artifact, kind, payload, label)
+
+    def _render_and_publish_artifact(self, kind, payload, label):
+        """渲染线程：渲染页面并发布到服务器或写入临时文件，结果回到主线程显示"""
+        started = time.time()
+        server = get_artifact_server()
         try:
-            # 生成包含纯文本的HTML文件，使用<pre>标签保留格式
-            html_content = f"""
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>Artifacts 内容</title>
-            </head>
-            <body>
-                <h1>Artifacts 内容</h1>
-                <pre>{content}</pre>
-            </body>
-            </html>
-            """
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"artifacts_text_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logging.info("[Artifacts] 纯文本内容已保存到临时文件: %s", temp_file)
-            
-            # --- 修改后的打开逻辑 ---
-            success = False
-            logging.info("[Artifacts] 尝试自动打开文件: %s", temp_file)
-            print("--- [强制调试] 尝试自动打开文件: %s" % temp_file)
-
-            # 方法1 (Windows 优先): 使用 os.startfile()
-            if sys.platform.startswith('win'):
-                try:
-                    os.startfile(temp_file)
-                    logging.info("[Artifacts] 文件已通过 os.startfile() 打开")
-                    print("--- [强制调试] 文件已通过 os.startfile() 打开")
-                    self.display_message("assistant", f"已生成内容，并在默认应用中打开。")
-                    success = True
-                except Exception as os_err:
-                    logging.error("[Artifacts] 使用 os.startfile 打开文件时出错: %s", os_err)
-                    print("--- [强制调试] 使用 os.startfile 打开文件时出错: %s" % os_err)
-
-            # 方法2 (Windows 次选): 使用 subprocess Popen start
-            # 注意：Popen会立即返回，不会等待进程结束
-            if not success and sys.platform.startswith('win'):
-                try:
-                    import subprocess
-                    subprocess.Popen(['start', '', temp_file], shell=True)
-                    logging.info("[Artifacts] 文件已通过 subprocess Popen start 打开")
-                    print("--- [强制调试] 文件已通过 subprocess Popen start 打开")
-                    self.display_message("assistant", f"已生成内容，并在默认应用中打开。")
-                    success = True
-                except Exception as sub_err:
-                    logging.error("[Artifacts] 使用 subprocess Popen start 打开文件时出错: %s", sub_err)
-                    print("--- [强制调试] 使用 subprocess Popen start 打开文件时出错: %s" % sub_err)
-
-            # 方法3 (备选/跨平台): 使用 webbrowser.open()
-            # 放在最后，因为在当前系统上行为异常
-            if not success:
-                try:
-                    file_url = Path(temp_file).as_uri()
-                    webbrowser.open(file_url)
-                    logging.info("[Artifacts] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    print("--- [强制调试] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    # 即使可能被重定向，也告知用户尝试了
-                    self.display_message("assistant", f"已生成内容，尝试在默认浏览器中打开。")
-                    success = True # 标记为尝试过
-                except Exception as wb_err:
-                    logging.error("[Artifacts] 使用 webbrowser 打开文件时出错: %s", wb_err)
-                    print("--- [强制调试] 使用 webbrowser 打开文件时出错: %s" % wb_err)
-
-            # 如果所有方法都失败，显示文件路径供手动打开
-            if not success:
-                logging.info("[Artifacts] 所有自动打开方法均失败，直接显示文件路径: %s", temp_file)
-                print("--- [强制调试] 所有自动打开方法均失败，直接显示文件路径: %s" % temp_file)
-                self.display_message("assistant", f"已生成内容，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}")
-            # --- 结束修改后的打开逻辑 ---
+            title, chunks = render_artifact(kind, payload, server, file_url=self.artifact_file_url)
+            if server is None:
+                self._open_artifact_file(chunks, kind, label)
+                return
+            server.publish(encode_chunks(chunks), title, kind)
         except Exception as e:
-            logging.error("[Artifacts] 处理纯文本内容时出错: %s", e)
-            self.display_message("assistant", f"抱歉，处理内容时遇到错误：{e}")
-
-    # --- 新增处理Artifacts图表渲染函数 (修改版) ---
-    def render_artifacts_chart(self, chart_data):
-        """将图表数据转换为HTML文件并在浏览器中渲染 (使用在线 Chart.js CDN)"""
+            logging.exception("[Artifacts] 渲染%s时出错", label)
+            self.app.after(0, self.display_message, "assistant", f"抱歉，渲染{label}时遇到错误：{e}")
+            return
+        logging.info("[Artifacts] %s渲染完成，耗时 %.2f 秒", label, time.time() - started)
+        if server.needs_viewer():
+            server.mark_viewer_opened()
+            if self._open_in_browser(server.url):
+                message = f"已生成{label}，已在浏览器的 Artifacts 页面中打开。"
+            else:
+                message = f"已生成{label}，但自动打开浏览器失败。请手动访问：\n{server.url}"
+        else:
+            logging.info("[Artifacts] %s已推送到已打开的 Artifacts 页面", label)
+            message = f"已生成{label}，已在 Artifacts 页面中更新。"
+        self.app.after(0, self.display_message, "assistant", message)
+
+    def artifact_file_url(self, path):
+        """Artifact 页面中引用本地文件（图片等）使用的 URL"""
+        server = get_artifact_server()
+        return server.file_url(path) if server else Path(path).as_uri()
+
+    def _open_in_browser(self, target):
+        """打开文件或 URL：Windows 上依次尝试 os.startfile 与 start 命令，最后使用 webbrowser"""
+        if sys.platform.startswith('win'):
+            try:
+                os.startfile(target)
+                logging.info("[Artifacts] 已通过 os.startfile() 打开: %s", target)
+                return True
+            except Exception as os_err:
+                logging.error("[Artifacts] 使用 os.startfile 打开时出错: %s", os_err)
+            try:
+                import subprocess
+                subprocess.Popen(['start', '', target], shell=True)
+                logging.info("[Artifacts] 已通过 subprocess Popen start 打开: %s", target)
+                return True
+            except Exception as sub_err:
+                logging.error("[Artifacts] 使用 subprocess Popen start 打开时出错: %s", sub_err)
         try:
-            import json
-            if isinstance(chart_data, str):
-                # 提取JSON部分
-                start_idx = chart_data.find("{")
-                end_idx = chart_data.rfind("}")
-                if start_idx >= 0 and end_idx > start_idx:
-                    chart_data = chart_data[start_idx:end_idx+1]
-                    try:
-                        chart_data = json.loads(chart_data)
-                    except json.JSONDecodeError as json_err:
-                        logging.error("[Artifacts] 解析图表 JSON 数据时出错: %s", json_err)
-                        logging.error("[Artifacts] 原始数据: %s", chart_data)
-                        self.display_message("assistant", f"抱歉，解析图表数据时出错: {json_err}")
-                        return # 解析失败则不继续
-                else:
-                    logging.error("[Artifacts] 无法从字符串中提取有效的JSON图表数据: %s", chart_data[:100])
-                    self.display_message("assistant", "抱歉，无法从AI响应中提取有效的图表数据。")
-                    return
-
-            chart_type = chart_data.get("type", "bar")
-            chart_title = chart_data.get("title", "图表")
-            labels = chart_data.get("data", {}).get("labels", [])
-            datasets = chart_data.get("data", {}).get("datasets", [])
-            options = chart_data.get("options", {})
-            xlabel = options.get("xlabel", "X轴")
-            ylabel = options.get("ylabel", "Y轴")
-
-            # 构建datasets的JavaScript代码 (确保标签是字符串)
-            datasets_js = []
-            for ds in datasets:
-                label = str(ds.get("label", "数据集")).replace("'", "\\'") # 转义单引号
-                values = ds.get("values", [])
-                # 确保 labels 和 values 是有效的 JSON 格式列表
-                datasets_js.append(f"{{ label: '{label}', data: {json.dumps(values)} }}")
-            datasets_str = ", ".join(datasets_js)
-            labels_str = json.dumps(labels) # 确保 labels 是有效的 JSON 数组字符串
-
-            # 使用在线 Chart.js CDN 而不是本地文件
-            chart_js_url = "https://cdn.jsdelivr.net/npm/chart.js"
-            logging.info("[Artifacts] 使用在线 Chart.js CDN: %s", chart_js_url)
-            print("--- [强制调试] 使用在线 Chart.js CDN: %s" % chart_js_url)
-
-            # 生成包含Chart.js的HTML文件 (使用在线 CDN)
-            html_content = f"""
-            <!DOCTYPE html>
-            <html lang="zh-CN">
-            <head>
-                <meta charset="UTF-8">
-                <title>{chart_title}</title>
-                <!-- 使用在线 Chart.js CDN -->
-                <script src="{chart_js_url}"></script>
-                <style>
-                    body {{ font-family: sans-serif; margin: 20px; }}
-                    canvas {{ max-width: 100%; height: auto; border: 1px solid #ccc; margin-top: 10px; }}
-                    #errorMessage {{ color: red; font-weight: bold; border: 1px solid red; padding: 10px; margin-bottom: 10px; display: none; }}
-                </style>
-            </head>
-            <body>
-                <h1>{chart_title}</h1>
-                <!-- 用于显示错误的 Div -->
-                <div id="errorMessage"></div>
-                <canvas id="myChart"></canvas>
-                <script>
-                    // 使用 try-catch 块捕获错误
-                    try {{
-                        const ctx = document.getElementById('myChart').getContext('2d');
-                        // 确保 labels 和 datasets 数据是有效的
-                        const chartLabels = {labels_str};
-                        const chartDatasets = [{datasets_str}];
-
-                        console.log("Chart Labels:", chartLabels);
-                        console.log("Chart Datasets:", chartDatasets);
-
-                        if (!Array.isArray(chartLabels) || chartDatasets.some(ds => !Array.isArray(ds.data))) {{
-                            throw new Error("图表数据格式无效 (标签或数据集数据不是数组)");
-                        }}
-
-                        const myChart = new Chart(ctx, {{
-                            type: '{chart_type}',
-                            data: {{
-                                labels: chartLabels,
-                                datasets: chartDatasets
-                            }},
-                            options: {{
-                                responsive: true,
-                                maintainAspectRatio: true, // 可以尝试设为 false 看看效果
-                                scales: {{
-                                    x: {{
-                                        title: {{ display: true, text: '{xlabel}' }}
-                                    }},
-                                    y: {{
-                                        title: {{ display: true, text: '{ylabel}' }},
-                                        beginAtZero: true // 通常 Y 轴从 0 开始
-                                    }}
-                                }},
-                                plugins: {{
-                                    title: {{ // 添加图表标题插件
-                                        display: true,
-                                        text: '{chart_title}'
-                                    }}
-                                }}
-                            }}
-                        }});
-                        console.log("图表已成功创建");
-                    }} catch (error) {{
-                        // 如果发生错误，显示错误信息
-                        console.error('图表渲染错误:', error);
-                        const errorDiv = document.getElementById('errorMessage');
-                        errorDiv.style.display = 'block'; // 显示错误区域
-                        errorDiv.innerText = '图表渲染失败: ' + error.message + '\\n请检查控制台获取详细信息。';
-                        // 可以在这里添加更多调试信息
-                        errorDiv.innerText += '\\n\\n原始数据 (部分):\\nLabels: ' + JSON.stringify({labels_str}).substring(0, 200) + '...\\nDatasets: ' + JSON.stringify([{datasets_str}]).substring(0, 300) + '...';
-                    }}
-                </script>
-            </body>
-            </html>
-            """
-            temp_dir = tempfile.gettempdir()
-            # 文件名中避免特殊字符
-            safe_title = "".join(c if c.isalnum() else "_" for c in chart_title)
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            temp_file_name = f"artifacts_chart_{safe_title}_{timestamp}.html"
-            temp_file = os.path.join(temp_dir, temp_file_name)
-
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logging.info("[Artifacts] 图表HTML页面已保存到临时文件: %s", temp_file)
-
-            # --- 修改后的打开逻辑 ---
-            success = False
-            logging.info("[Artifacts] 尝试自动打开文件: %s", temp_file)
-            print("--- [强制调试] 尝试自动打开文件: %s" % temp_file)
-
-            # 方法1 (Windows 优先): 使用 os.startfile()
-            if sys.platform.startswith('win'):
-                try:
-                    os.startfile(temp_file)
-                    logging.info("[Artifacts] 文件已通过 os.startfile() 打开")
-                    print("--- [强制调试] 文件已通过 os.startfile() 打开")
-                    self.display_message("assistant", f"已生成图表，并在默认应用中打开。")
-                    success = True
-                except Exception as os_err:
-                    logging.error("[Artifacts] 使用 os.startfile 打开文件时出错: %s", os_err)
-                    print("--- [强制调试] 使用 os.startfile 打开文件时出错: %s" % os_err)
-
-            # 方法2 (Windows 次选): 使用 subprocess Popen start
-            # 注意：Popen会立即返回，不会等待进程结束
-            if not success and sys.platform.startswith('win'):
-                try:
-                    import subprocess
-                    subprocess.Popen(['start', '', temp_file], shell=True)
-                    logging.info("[Artifacts] 文件已通过 subprocess Popen start 打开")
-                    print("--- [强制调试] 文件已通过 subprocess Popen start 打开")
-                    self.display_message("assistant", f"已生成图表，并在默认应用中打开。")
-                    success = True
-                except Exception as sub_err:
-                    logging.error("[Artifacts] 使用 subprocess Popen start 打开文件时出错: %s", sub_err)
-                    print("--- [强制调试] 使用 subprocess Popen start 打开文件时出错: %s" % sub_err)
-
-            # 方法3 (备选/跨平台): 使用 webbrowser.open()
-            # 放在最后，因为在当前系统上行为异常
-            if not success:
-                try:
-                    file_url = Path(temp_file).as_uri()
-                    webbrowser.open(file_url)
-                    logging.info("[Artifacts] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    print("--- [强制调试] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    # 即使可能被重定向，也告知用户尝试了
-                    self.display_message("assistant", f"已生成图表，尝试在默认浏览器中打开。")
-                    success = True # 标记为尝试过
-                except Exception as wb_err:
-                    logging.error("[Artifacts] 使用 webbrowser 打开文件时出错: %s", wb_err)
-                    print("--- [强制调试] 使用 webbrowser 打开文件时出错: %s" % wb_err)
-
-            # 如果所有方法都失败，显示文件路径供手动打开
-            if not success:
-                logging.info("[Artifacts] 所有自动打开方法均失败，直接显示文件路径: %s", temp_file)
-                print("--- [强制调试] 所有自动打开方法均失败，直接显示文件路径: %s" % temp_file)
-                self.display_message("assistant", f"已生成图表，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}")
-            # --- 结束修改后的打开逻辑 ---
+            url = target if "://" in target else Path(target).as_uri()
+            webbrowser.open(url)
+            logging.info("[Artifacts] 已通过 webbrowser.open() 打开 (可能被重定向): %s", url)
+            return True
+        except Exception as wb_err:
+            logging.error("[Artifacts] 使用 webbrowser 打开时出错: %s", wb_err)
+            return False
 
-        except Exception as e:
-            logging.exception("[Artifacts] 渲染图表时发生未预料的错误") # 使用 exception 记录完整回溯
-            self.display_message("assistant", f"抱歉，渲染图表时遇到严重错误：{e}")
+    def _open_artifact_file(self, chunks, kind, label):
+        """渲染线程：Artifacts 服务器不可用时的旧做法，把页面流式写入临时 HTML 文件并在浏览器中打开"""
+        temp_manager = get_temp_manager()
+        temp_file = str(temp_manager.new_path("artifacts", f"artifacts_{kind}_", ".html"))
+        with open(temp_file, 'wb') as f:
+            size = write_chunks(chunks, f)
+        temp_manager.register(temp_file)
+        logging.info("[Artifacts] %s页面已保存到临时文件: %s (%d 字节)", label, temp_file, size)
+        if self._open_in_browser(temp_file):
+            message = f"已生成{label}，尝试在默认浏览器中打开。"
+        else:
+            message = f"已生成{label}，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}"
+        self.app.after(0, self.display_message, "assistant", message)
+
+    # --- 各类 Artifacts 的入口（由流结束处理调用，均走 show_artifact） ---
+    def handle_artifacts_content(self, content):
+        """将AI生成的纯文本内容包装为 HTML 并在 Artifacts 页面中显示"""
+        self.show_artifact("text", content, "内容")
+
+    def render_artifacts_chart(self, chart_data):
+        """将图表数据（dict 或 JSON 字符串）渲染为 Chart.js 页面"""
+        self.show_artifact("chart", chart_data, "图表")
 
-    # --- 新增处理Artifacts表格渲染函数 ---
     def render_artifacts_table(self, table_data):
-        """将表格数据转换为HTML文件并在浏览器中渲染"""
-        try:
-            import json
-            if isinstance(table_data, str):
-                # 提取JSON部分，假设table_data是字符串格式
-                start_idx = table_data.find("{")
-                end_idx = table_data.rfind("}")
-                if start_idx >= 0 and end_idx > start_idx:
-                    table_data = table_data[start_idx:end_idx+1]
-                    table_data = json.loads(table_data)
-                else:
-                    raise ValueError("无法从字符串中提取有效的JSON表格数据")
-            
-            table_title = table_data.get("title", "表格")
-            headers = table_data.get("data", {}).get("headers", [])
-            rows = table_data.get("data", {}).get("rows", [])
-            
-            # 构建表头HTML
-            headers_html = "".join(f"<th>{header}</th>" for header in headers)
-            headers_row = f"<tr>{headers_html}</tr>"
-            
-            # 构建数据行HTML
-            rows_html = []
-            for row in rows:
-                cells_html = "".join(f"<td>{cell}</td>" for cell in row)
-                rows_html.append(f"<tr>{cells_html}</tr>")
-            rows_str = "\n".join(rows_html)
-            
-            # 生成包含表格的HTML文件
-            html_content = f"""
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>{table_title}</title>
-                <style>
-                    table {{ border-collapse: collapse; width: 100%; max-width: 800px; margin: 20px 0; font-family: Arial, sans-serif; }}
-                    th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                    th {{ background-color: #f2f2f2; }}
-                    tr:nth-child(even) {{ background-color: #f9f9f9; }}
-                    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                </style>
-            </head>
-            <body>
-                <h1>{table_title}</h1>
-                <table>
-                    {headers_row}
-                    {rows_str}
-                </table>
-            </body>
-            </html>
-            """
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"artifacts_table_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logging.info("[Artifacts] 表格HTML页面已保存到临时文件: %s", temp_file)
-            
-            # --- 修改后的打开逻辑 ---
-            success = False
-            logging.info("[Artifacts] 尝试自动打开文件: %s", temp_file)
-            print("--- [强制调试] 尝试自动打开文件: %s" % temp_file)
-
-            # 方法1 (Windows 优先): 使用 os.startfile()
-            if sys.platform.startswith('win'):
-                try:
-                    os.startfile(temp_file)
-                    logging.info("[Artifacts] 文件已通过 os.startfile() 打开")
-                    print("--- [强制调试] 文件已通过 os.startfile() 打开")
-                    self.display_message("assistant", f"已生成表格，并在默认应用中打开。")
-                    success = True
-                except Exception as os_err:
-                    logging.error("[Artifacts] 使用 os.startfile 打开文件时出错: %s", os_err)
-                    print("--- [强制调试] 使用 os.startfile 打开文件时出错: %s" % os_err)
-
-            # 方法2 (Windows 次选): 使用 subprocess Popen start
-            # 注意：Popen会立即返回，不会等待进程结束
-            if not success and sys.platform.startswith('win'):
-                try:
-                    import subprocess
-                    subprocess.Popen(['start', '', temp_file], shell=True)
-                    logging.info("[Artifacts] 文件已通过 subprocess Popen start 打开")
-                    print("--- [强制调试] 文件已通过 subprocess Popen start 打开")
-                    self.display_message("assistant", f"已生成表格，并在默认应用中打开。")
-                    success = True
-                except Exception as sub_err:
-                    logging.error("[Artifacts] 使用 subprocess Popen start 打开文件时出错: %s", sub_err)
-                    print("--- [强制调试] 使用 subprocess Popen start 打开文件时出错: %s" % sub_err)
-
-            # 方法3 (备选/跨平台): 使用 webbrowser.open()
-            # 放在最后，因为在当前系统上行为异常
-            if not success:
-                try:
-                    file_url = Path(temp_file).as_uri()
-                    webbrowser.open(file_url)
-                    logging.info("[Artifacts] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    print("--- [强制调试] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    # 即使可能被重定向，也告知用户尝试了
-                    self.display_message("assistant", f"已生成表格，尝试在默认浏览器中打开。")
-                    success = True # 标记为尝试过
-                except Exception as wb_err:
-                    logging.error("[Artifacts] 使用 webbrowser 打开文件时出错: %s", wb_err)
-                    print("--- [强制调试] 使用 webbrowser 打开文件时出错: %s" % wb_err)
-
-            # 如果所有方法都失败，显示文件路径供手动打开
-            if not success:
-                logging.info("[Artifacts] 所有自动打开方法均失败，直接显示文件路径: %s", temp_file)
-                print("--- [强制调试] 所有自动打开方法均失败，直接显示文件路径: %s" % temp_file)
-                self.display_message("assistant", f"已生成表格，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}")
-            # --- 结束修改后的打开逻辑 ---
-        except Exception as e:
-            logging.error("[Artifacts] 渲染表格时出错: %s", e)
-            self.display_message("assistant", f"抱歉，渲染表格时遇到错误：{e}")
+        """将表格数据（dict 或 JSON 字符串）渲染为表格页面"""
+        self.show_artifact("table", table_data, "表格")
 
-    # --- 新增渲染网页内容函数 ---
     def render_artifacts_html(self, html_data):
-        """将HTML内容保存为临时文件并在浏览器中打开"""
-        try:
-            import json
-            if isinstance(html_data, str):
-                # 提取JSON部分，假设html_data是字符串格式
-                start_idx = html_data.find("{")
-                end_idx = html_data.rfind("}")
-                if start_idx >= 0 and end_idx > start_idx:
-                    html_data = html_data[start_idx:end_idx+1]
-                    html_data = json.loads(html_data)
-                else:
-                    raise ValueError("无法从字符串中提取有效的JSON HTML数据")
-            
-            html_content = html_data.get("html", "<h1>错误</h1><p>无网页内容</p>")
-
-            logging.info("[Artifacts] 开始处理HTML内容，内容长度: %d", len(html_content))
-            
-            # 保存HTML内容到临时文件
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"artifacts_html_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logging.info("[Artifacts] HTML内容已保存到临时文件: %s", temp_file)
-            
-            # --- 修改后的打开逻辑 ---
-            success = False
-            logging.info("[Artifacts] 尝试自动打开文件: %s", temp_file)
-            print("--- [强制调试] 尝试自动打开文件: %s" % temp_file)
-
-            # 方法1 (Windows 优先): 使用 os.startfile()
-            if sys.platform.startswith('win'):
-                try:
-                    os.startfile(temp_file)
-                    logging.info("[Artifacts] 文件已通过 os.startfile() 打开")
-                    print("--- [强制调试] 文件已通过 os.startfile() 打开")
-                    self.display_message("assistant", f"已生成网页内容，并在默认应用中打开。")
-                    success = True
-                except Exception as os_err:
-                    logging.error("[Artifacts] 使用 os.startfile 打开文件时出错: %s", os_err)
-                    print("--- [强制调试] 使用 os.startfile 打开文件时出错: %s" % os_err)
-
-            # 方法2 (Windows 次选): 使用 subprocess Popen start
-            # 注意：Popen会立即返回，不会等待进程结束
-            if not success and sys.platform.startswith('win'):
-                try:
-                    import subprocess
-                    subprocess.Popen(['start', '', temp_file], shell=True)
-                    logging.info("[Artifacts] 文件已通过 subprocess Popen start 打开")
-                    print("--- [强制调试] 文件已通过 subprocess Popen start 打开")
-                    self.display_message("assistant", f"已生成网页内容，并在默认应用中打开。")
-                    success = True
-                except Exception as sub_err:
-                    logging.error("[Artifacts] 使用 subprocess Popen start 打开文件时出错: %s", sub_err)
-                    print("--- [强制调试] 使用 subprocess Popen start 打开文件时出错: %s" % sub_err)
-
-            # 方法3 (备选/跨平台): 使用 webbrowser.open()
-            # 放在最后，因为在当前系统上行为异常
-            if not success:
-                try:
-                    file_url = Path(temp_file).as_uri()
-                    webbrowser.open(file_url)
-                    logging.info("[Artifacts] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    print("--- [强制调试] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    # 即使可能被重定向，也告知用户尝试了
-                    self.display_message("assistant", f"已生成网页内容，尝试在默认浏览器中打开。")
-                    success = True # 标记为尝试过
-                except Exception as wb_err:
-                    logging.error("[Artifacts] 使用 webbrowser 打开文件时出错: %s", wb_err)
-                    print("--- [强制调试] 使用 webbrowser 打开文件时出错: %s" % wb_err)
-
-            # 如果所有方法都失败，显示文件路径供手动打开
-            if not success:
-                logging.info("[Artifacts] 所有自动打开方法均失败，直接显示文件路径: %s", temp_file)
-                print("--- [强制调试] 所有自动打开方法均失败，直接显示文件路径: %s" % temp_file)
-                self.display_message("assistant", f"已生成网页内容，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}")
-            # --- 结束修改后的打开逻辑 ---
-        except Exception as e:
-            logging.error("[Artifacts] 处理网页内容时出错: %s", e)
-            self.display_message("assistant", f"抱歉，处理网页内容时遇到错误：{e}")
+        """在 Artifacts 页面中显示 HTML 内容（dict 或 JSON 字符串）"""
+        self.show_artifact("html", html_data, "网页内容")
 
-    # --- 新增渲染图片到Artifacts区域函数 ---
     def render_artifacts_image(self, image_path):
-        """将图片路径嵌入HTML文件并在浏览器中打开"""
-        try:
-            # 生成简单的HTML文件显示图片
-            html_content = f"""
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>生成的图片</title>
-                <style>
-                    img {{ max-width: 100%; height: auto; }}
-                    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                </style>
-            </head>
-            <body>
-                <h1>生成的图片</h1>
-                <img src="file://{image_path}" alt="Generated Image">
-                <p>图片路径: {image_path}</p>
-            </body>
-            </html>
-            """
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"artifacts_image_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logging.info("[Artifacts] 图片HTML页面已保存到临时文件: %s", temp_file)
-            
-            # --- 修改后的打开逻辑 ---
-            success = False
-            logging.info("[Artifacts] 尝试自动打开文件: %s", temp_file)
-            print("--- [强制调试] 尝试自动打开文件: %s" % temp_file)
-
-            # 方法1 (Windows 优先): 使用 os.startfile()
-            if sys.platform.startswith('win'):
-                try:
-                    os.startfile(temp_file)
-                    logging.info("[Artifacts] 文件已通过 os.startfile() 打开")
-                    print("--- [强制调试] 文件已通过 os.startfile() 打开")
-                    self.display_message("assistant", f"已生成图片，并在默认应用中打开。")
-                    success = True
-                except Exception as os_err:
-                    logging.error("[Artifacts] 使用 os.startfile 打开文件时出错: %s", os_err)
-                    print("--- [强制调试] 使用 os.startfile 打开文件时出错: %s" % os_err)
-
-            # 方法2 (Windows 次选): 使用 subprocess Popen start
-            # 注意：Popen会立即返回，不会等待进程结束
-            if not success and sys.platform.startswith('win'):
-                try:
-                    import subprocess
-                    subprocess.Popen(['start', '', temp_file], shell=True)
-                    logging.info("[Artifacts] 文件已通过 subprocess Popen start 打开")
-                    print("--- [强制调试] 文件已通过 subprocess Popen start 打开")
-                    self.display_message("assistant", f"已生成图片，并在默认应用中打开。")
-                    success = True
-                except Exception as sub_err:
-                    logging.error("[Artifacts] 使用 subprocess Popen start 打开文件时出错: %s", sub_err)
-                    print("--- [强制调试] 使用 subprocess Popen start 打开文件时出错: %s" % sub_err)
-
-            # 方法3 (备选/跨平台): 使用 webbrowser.open()
-            # 放在最后，因为在当前系统上行为异常
-            if not success:
-                try:
-                    file_url = Path(temp_file).as_uri()
-                    webbrowser.open(file_url)
-                    logging.info("[Artifacts] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    print("--- [强制调试] 文件已通过 webbrowser.open() 打开 (可能被重定向)")
-                    # 即使可能被重定向，也告知用户尝试了
-                    self.display_message("assistant", f"已生成图片，尝试在默认浏览器中打开。")
-                    success = True # 标记为尝试过
-                except Exception as wb_err:
-                    logging.error("[Artifacts] 使用 webbrowser 打开文件时出错: %s", wb_err)
-                    print("--- [强制调试] 使用 webbrowser 打开文件时出错: %s" % wb_err)
-
-            # 如果所有方法都失败，显示文件路径供手动打开
-            if not success:
-                logging.info("[Artifacts] 所有自动打开方法均失败，直接显示文件路径: %s", temp_file)
-                print("--- [强制调试] 所有自动打开方法均失败，直接显示文件路径: %s" % temp_file)
-                self.display_message("assistant", f"已生成图片，但自动打开浏览器/应用失败。请手动打开以下文件查看：\n{temp_file}")
-            # --- 结束修改后的打开逻辑 ---
-        except Exception as e:
-            logging.error("[Artifacts] 渲染图片时出错: %s", e)
-            self.display_message("assistant", f"抱歉，渲染图片时遇到错误：{e}")
\ No newline at end of file
+        """将图片嵌入 HTML 页面并在 Artifacts 页面中显示"""
+        self.show_artifact("image", image_path, "图片")
@@ -1,4 +1,4 @@
-# grok_client.py (v1.7 - 增强错误处理)
+# grok_client.py (v1.8 - 增强错误处理，批量生成图像)
 import os
 from openai import OpenAI, RateLimitError, AuthenticationError
 import time
@@ -26,7 +26,7 @@ def initialize_grok_client():
         grok_client = None
         return None
 
-def get_grok_response_stream(messages, chunk_callback, model=DEFAULT_GROK_MODEL):
+def get_grok_response_stream(messages, chunk_callback, model=DEFAULT_GROK_MODEL, usage_callback=None):
     """
     调用 Grok API 获取流式回复（适用于文本模型）。
     参数:
@@ -35,6 +35,7 @@ def get_grok_response_stream(messages, chunk_callback, model=DEFAULT_GROK_MODEL)
                                    回调函数接收一个参数：收到的文本块 (str)。
                                    如果回调函数返回 False，则停止接收。
         model (str): 指定使用的模型，默认为 DEFAULT_GROK_MODEL。
+        usage_callback (function): 可选，流结束时以最后一个数据块的 usage 对象调用（含缓存命中 token 数）。
     返回:
         str: 累积的完整回复文本。
     异常:
@@ -57,10 +58,17 @@ def get_grok_response_stream(messages, chunk_callback, model=DEFAULT_GROK_MODEL)
             messages=messages,
             stream=True,
             temperature=0.7,  # 设置温度参数，控制生成文本的创造性
-            max_tokens=4096  # 设置最大 token 数，限制响应长度
+            max_tokens=4096,  # 设置最大 token 数，限制响应长度
+            stream_options={"include_usage": True}  # 最后一个数据块附带 usage（含缓存命中 token 数）
         )
 
         for chunk in stream:
+            if getattr(chunk, "usage", None):
+                # 只携带 usage 的收尾数据块
+                if usage_callback:
+                    usage_callback(chunk.usage)
+                if not chunk.choices:
+                    continue
             if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
                 content_piece = chunk.choices[0].delta.content
                 accumulated_text += content_piece
@@ -163,3 +171,39 @@ def get_grok_image_response(messages, model="grok-2-image-latest"):
         error_msg = f"Grok API 图像生成过程中发生未知错误: {str(e)}"
         print(f"!!! [Grok Client] 图像生成 API 调用出错: {e} !!!")
         raise Exception(error_msg)
+
+def generate_grok_images(prompt, model="grok-2-image-latest", n=1):
+    """
+    调用 Grok 图像生成 API，一次请求生成 n 张图像（批量生成使用）。
+    参数:
+        prompt (str): 图像提示词。
+        model (str): 图像生成模型。
+        n (int): 生成数量（API 单次最多 10 张）。
+    返回:
+        list: 图像 URL 列表。
+    异常:
+        RateLimitError: 限流时原样抛出，由调用方退避重试。
+        Exception: 其他错误。
+    """
+    global grok_client
+    if not grok_client:
+        print("--- [Grok Client] 客户端未初始化，尝试重新初始化... ---")
+        if not initialize_grok_client():
+            raise ConnectionError("Grok 客户端未初始化或初始化失败")
+
+    n = max(1, min(n, 10))
+    print(f"--- [Grok Client] 准备批量生成图像 (模型: {model}, 数量: {n}) ---")
+    start_time = time.time()
+    try:
+        response = grok_client.images.generate(model=model, prompt=prompt, n=n)
+    except RateLimitError:
+        raise
+    except AuthenticationError as ae:
+        print(f"!!! [Grok Client] 批量图像生成出错 - 认证失败: {ae} !!!")
+        raise Exception("Grok API 认证失败。请检查您的API密钥是否正确。")
+    except Exception as e:
+        print(f"!!! [Grok Client] 批量图像生成出错: {e} !!!")
+        raise Exception(f"Grok API 图像生成过程中发生未知错误: {str(e)}")
+    urls = [item.url for item in (response.data or []) if getattr(item, 'url', None)]
+    print(f"--- [Grok Client] 批量图像生成完成，耗时: {time.time() - start_time:.2f} 秒，得到 {len(urls)} 个 URL ---")
+    return urls
@@ -0,0 +1,151 @@
+# image_batch.py (v1.0 - 批量图像生成：多条提示词/多张变体在限流范围内并发生成，逐张回调显示，最后汇总为一个页面)
+import os
+import re
+import html
+import time
+import logging
+import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from openai import RateLimitError
+
+import grok_client
+from image_downloader import get_image_downloader
+from image_library import get_image_library
+
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "3"))  # 同时进行的生成请求数（受 API 限流约束）
+IMAGE_BATCH_VARIANTS = int(os.getenv("IMAGE_BATCH_VARIANTS", "4"))  # 只有一条提示词时默认生成的变体数
+IMAGE_BATCH_MAX_IMAGES = 20  # 单次批量最多生成的图像数
+RATE_LIMIT_RETRIES = 3
+
+# 行首的列表标记（"1." "2)" "-" "*" "•"）
+_LIST_MARKER_PATTERN = re.compile(r"^\s*(?:\d+[.、)）]|[-*•])\s*")
+# 行尾的数量后缀（"x4" "×4" "*4"）
+_COUNT_SUFFIX_PATTERN = re.compile(r"\s*[xX×*]\s*(\d{1,2})\s*$")
+
+def parse_batch_prompts(text, default_variants=IMAGE_BATCH_VARIANTS):
+    """
+    把批量请求拆分为 (提示词, 数量) 列表。
+    - 每个非空行是一条提示词，行首的列表标记会被去掉；
+    - 行尾 "x3" / "×3" 指定这一条的变体数；
+    - 只有一行且没有指定数量时，生成 default_variants 张变体；多行时每行默认 1 张。
+    总数超过 IMAGE_BATCH_MAX_IMAGES 时截断。
+    """
+    jobs = []
+    lines = [line for line in (text or "").splitlines() if line.strip()]
+    for line in lines:
+        line = _LIST_MARKER_PATTERN.sub("", line).strip()
+        count = None
+        match = _COUNT_SUFFIX_PATTERN.search(line)
+        if match:
+            count = int(match.group(1))
+            line = line[:match.start()].strip()
+        if line:
+            jobs.append([line, count])
+    for job in jobs:
+        if job[1] is None:
+            job[1] = default_variants if len(jobs) == 1 else 1
+    limited = []
+    remaining = IMAGE_BATCH_MAX_IMAGES
+    for prompt, count in jobs:
+        if remaining <= 0:
+            break
+        count = max(1, min(count, remaining, 10))
+        limited.append((prompt, count))
+        remaining -= count
+    return limited
+
+def _generate_with_backoff(prompt, model, n):
+    """限流时指数退避重试"""
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            return grok_client.generate_grok_images(prompt, model=model, n=n)
+        except RateLimitError:
+            if attempt >= RATE_LIMIT_RETRIES:
+                raise Exception("请求频率过高，Grok API 限流。请稍后再试或检查您的API配额。")
+            delay = 2 ** attempt * 2
+            logging.warning("[批量图像] 被限流，%d 秒后重试: '%s'", delay, prompt[:30])
+            time.sleep(delay)
+
+def run_batch(jobs, model, on_image, use_library=True, is_cancelled=lambda: False):
+    """
+    并发执行批量生成。每张图像下载并收入图像库后立即调用 on_image(prompt, path)（在工作线程中调用）。
+    参数:
+        jobs (list): parse_batch_prompts 的结果
+        use_library (bool): 为 True 时只需 1 张的提示词先查图像库
+        is_cancelled (function): 返回 True 时不再处理尚未开始的请求
+    返回:
+        tuple: ([(提示词, 路径)], [(提示词, 错误信息)])
+    """
+    library = get_image_library()
+    downloader = get_image_downloader()
+
+    def run_job(prompt, count):
+        if is_cancelled():
+            return [], [(prompt, "已取消")]
+        if use_library and count == 1:
+            record = library.lookup(prompt, model)
+            if record:
+                path = library.path_for(record)
+                on_image(prompt, path)
+                return [(prompt, path)], []
+        urls = _generate_with_backoff(prompt, model, count)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        downloads = [downloader.submit(url, f"grok_image_{timestamp}_{i}") for i, url in enumerate(urls)]
+        images, errors = [], []
+        for url, future in zip(urls, downloads):
+            try:
+                result = future.result()
+                path = library.path_for(library.add(result.path, result.sha256, prompt, model, source_url=url))
+            except Exception as e:
+                errors.append((prompt, f"下载失败: {e}"))
+                continue
+            images.append((prompt, path))
+            on_image(prompt, path)
+        return images, errors
+
+    images, errors = [], []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=IMAGE_BATCH_CONCURRENCY, thread_name_prefix="image-batch") as executor:
+        futures = {executor.submit(run_job, prompt, count): prompt for prompt, count in jobs}
+        for future in as_completed(futures):
+            try:
+                job_images, job_errors = future.result()
+            except Exception as e:
+                logging.error("[批量图像] 生成 '%s' 出错: %s", futures[future][:30], e)
+                job_errors, job_images = [(futures[future], str(e))], []
+            images.extend(job_images)
+            errors.extend(job_errors)
+    logging.info("[批量图像] %d 个请求完成，得到 %d 张图像，%d 个错误，耗时 %.1f 秒",
+                 len(jobs), len(images), len(errors), time.time() - started)
+    return images, errors
+
+def build_gallery_html(images, errors=(), url_for=lambda path: Path(path).as_uri()):
+    """把批量结果汇总为一个网页（按提示词分组的图像网格），url_for 把本地路径转换为页面中引用的 URL"""
+    groups = {}
+    for prompt, path in images:
+        groups.setdefault(prompt, []).append(path)
+    sections = []
+    for prompt, paths in groups.items():
+        figures = "".join(
+            f'<a href="{url_for(path)}"><img src="{url_for(path)}" alt="{html.escape(prompt)}"></a>' for path in paths)
+        sections.append(f"<section><h2>{html.escape(prompt)}</h2><div class=\"grid\">{figures}</div></section>")
+    if errors:
+        items = "".join(f"<li>{html.escape(prompt)}: {html.escape(message)}</li>" for prompt, message in errors)
+        sections.append(f"<section><h2>失败</h2><ul>{items}</ul></section>")
+    return f"""<html>
+<head>
+    <meta charset="UTF-8">
+    <title>批量生成的图片</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 20px; }}
+        .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 12px; }}
+        .grid img {{ width: 100%; height: auto; border-radius: 6px; }}
+    </style>
+</head>
+<body>
+    <h1>批量生成的图片（{len(images)} 张）</h1>
+    {"".join(sections)}
+</body>
+</html>"""
@@ -0,0 +1,150 @@
+# image_downloader.py (v1.1 - 图像下载（默认保存到统一临时目录）：连接池复用、大块流式写入、失败后用 Range 断点续传、边下载边计算校验和，在专用线程池中并行执行)
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from temp_manager import TEMP_CACHE_DIR
+
+IMAGE_SAVE_DIR = os.getenv("IMAGE_SAVE_DIR", os.path.join(TEMP_CACHE_DIR, "images"))  # 指定到临时目录之外时，图像库不登记到临时文件管理器，不会被容量淘汰
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS", "4"))  # 同时下载的图像数（也是连接池大小）
+IMAGE_DOWNLOAD_RETRIES = int(os.getenv("IMAGE_DOWNLOAD_RETRIES", "3"))  # 连接中断后续传的最多次数
+IMAGE_DOWNLOAD_TIMEOUT = (5, 30)  # (连接超时, 两次读取之间的超时)，单位秒
+DOWNLOAD_CHUNK_SIZE = 256 * 1024  # 每次读取并写入 256KB
+
+class ImageDownloadError(Exception):
+    """下载在重试后仍然失败"""
+
+class DownloadResult:
+    """下载完成的文件：路径、SHA-256 校验和、字节数"""
+    __slots__ = ("path", "sha256", "size")
+
+    def __init__(self, path, sha256, size):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+def guess_extension(url, content_type=None):
+    """根据 Content-Type 或 URL 路径推断扩展名，失败时默认为 .png"""
+    if content_type:
+        subtype = content_type.split(";")[0].strip().lower()
+        known = {"image/png": ".png", "image/jpeg": ".jpg", "image/jpg": ".jpg", "image/webp": ".webp", "image/gif": ".gif"}
+        if subtype in known:
+            return known[subtype]
+    try:
+        extension = os.path.splitext(url.split('?')[0])[-1]  # 处理可能的URL参数
+        if extension and len(extension) <= 5:
+            return extension.lower()
+    except Exception:
+        pass
+    return '.png'
+
+class ImageDownloader:
+    """
+    共享 requests.Session（HTTPAdapter 连接池）下载图像：
+    - 以 DOWNLOAD_CHUNK_SIZE 为单位流式写入 .part 临时文件，同时计算 SHA-256；
+    - 连接中断或超时后带 Range 头从已下载的位置续传，服务器不支持 Range（返回 200）时从头开始；
+    - 完成后校验长度并原子重命名为目标文件；
+    - submit 把下载放到专用线程池，多张图像并行下载，不占用聊天的工作线程。
+    """
+
+    def __init__(self, save_dir=IMAGE_SAVE_DIR, workers=IMAGE_DOWNLOAD_WORKERS, retries=IMAGE_DOWNLOAD_RETRIES, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+        self.save_dir = save_dir
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-download")
+
+    def submit(self, url, file_stem):
+        """在下载线程池中执行 download，返回 Future（结果为 DownloadResult，失败时抛出 ImageDownloadError）"""
+        return self._executor.submit(self.download, url, file_stem)
+
+    def download(self, url, file_stem):
+        """
+        下载图像到 save_dir/<file_stem><扩展名>。
+        返回:
+            DownloadResult
+        """
+        os.makedirs(self.save_dir, exist_ok=True)
+        part_path = os.path.join(self.save_dir, f"{file_stem}.{threading.get_ident()}.part")
+        hasher = hashlib.sha256()
+        received = 0
+        total = None
+        content_type = None
+        started = time.time()
+        last_error = None
+        try:
+            with open(part_path, 'wb') as f:
+                for attempt in range(self.retries + 1):
+                    headers = {"Range": f"bytes={received}-"} if received else {}
+                    try:
+                        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                            if received and response.status_code == 200:
+                                # 服务器忽略了 Range，从头开始
+                                logging.info("[图像下载] 服务器不支持断点续传，重新下载: %s", url[:80])
+                                f.seek(0)
+                                f.truncate()
+                                hasher = hashlib.sha256()
+                                received = 0
+                            elif response.status_code not in (200, 206):
+                                raise ImageDownloadError(f"状态码 {response.status_code}")
+                            content_type = content_type or response.headers.get("Content-Type")
+                            if total is None:
+                                total = _expected_total(response, received)
+                            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                                f.write(chunk)
+                                hasher.update(chunk)
+                                received += len(chunk)
+                        if total is not None and received < total:
+                            raise requests.exceptions.ChunkedEncodingError(f"连接提前关闭 ({received}/{total} 字节)")
+                        break
+                    except ImageDownloadError:
+                        raise
+                    except requests.exceptions.RequestException as e:
+                        last_error = e
+                        if attempt >= self.retries:
+                            raise ImageDownloadError(f"重试 {self.retries} 次后仍失败: {e}") from e
+                        logging.warning("[图像下载] 第 %d 次下载中断（已收到 %d 字节），将续传: %s", attempt + 1, received, e)
+                        time.sleep(min(2 ** attempt * 0.5, 4))
+            final_path = os.path.join(self.save_dir, f"{file_stem}{guess_extension(url, content_type)}")
+            os.replace(part_path, final_path)
+        except Exception:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            raise
+        digest = hasher.hexdigest()
+        logging.info("[图像下载] 已保存 %s (%d 字节, %.2f 秒, sha256 %s)%s", final_path, received, time.time() - started,
+                     digest[:12], f"，期间续传过（{last_error}）" if last_error else "")
+        return DownloadResult(final_path, digest, received)
+
+def _expected_total(response, offset):
+    """从 Content-Range（206）或 Content-Length（200）得到文件总长度，未知时返回 None"""
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range and "/" in content_range:
+        size = content_range.rsplit("/", 1)[1]
+        return int(size) if size.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length) + (offset if response.status_code == 206 else 0)
+    return None
+
+_image_downloader = None
+_image_downloader_lock = threading.Lock()
+
+def get_image_downloader():
+    """获取共享的图像下载器（延迟创建）"""
+    global _image_downloader
+    with _image_downloader_lock:
+        if _image_downloader is None:
+            _image_downloader = ImageDownloader()
+        return _image_downloader
@@ -1,18 +1,22 @@
-# image_handler.py (v1.5 - 修复图像模型提示问题并支持Artifacts渲染)
+# image_handler.py (v1.9 - 修复图像模型提示问题并支持Artifacts渲染，图像在下载线程池中并行下载并支持断点续传，图像库去重与相同提示词复用，批量生成，聊天区内嵌预览，收到图像链接即结束本轮，下载完成后再附上图像)
 import threading
 import customtkinter as ctk
 import tkinter as tk
 import os
 import sys
 import datetime
-import requests
+import itertools
 from PIL import Image
 import grok_client
 from prompts import PROMPT_NETWORKING, PROMPT_ARTIFACTS # 导入 PROMPT_ARTIFACTS 用于识别
 import web_search
 import logging
 import api_client  # 导入DeepSeek客户端
-import tempfile
+from image_downloader import get_image_downloader
+from image_library import get_image_library
+from image_batch import parse_batch_prompts, run_batch, build_gallery_html
+
+IMAGE_ATTACH_RETRY_MS = 500  # 下载完成时正在生成下一条回复，等待多久后再尝试附上图像（毫秒）
 
 class ImageHandler:
     def __init__(self, controller, app, ui_elements):
@@ -29,8 +33,11 @@ class ImageHandler:
         self.chat_display = self.ui.get('chat_display')  # 使用固定的 Textbox
         self.status_label = self.ui.get('status_label')
 
-    def send_grok_image_message_thread(self, user_input, message_history, model):
-        """处理图像生成模型的请求，移除中转模型逻辑"""
+    def send_grok_image_message_thread(self, user_input, message_history, model, directives=frozenset(), raw_input=""):
+        """
+        处理图像生成模型的请求，移除中转模型逻辑。相同提示词生成过的图像直接从图像库返回，消息带 !fresh 指令时重新生成。
+        带 !batch 指令时按行拆分 raw_input（用户的原始输入，已去掉指令），不使用历史中组装过的用户消息。
+        """
         try:
             if not self.controller.is_streaming:
                 logging.info("[Grok 图像线程] 开始时 is_streaming 为 False，中止。")
@@ -79,6 +86,21 @@ class ImageHandler:
                  
             # --- 结束关键修改 ---
 
+            # 与 grok_client 一致：最后一条用户消息即图像提示词
+            prompt = next((msg["content"] for msg in reversed(image_model_history) if msg["role"] == "user"), user_input)
+            if "batch" in directives:
+                self.run_image_batch(raw_input, user_input, model, directives)
+                return
+            library = get_image_library()
+            if "fresh" not in directives:
+                record = library.lookup(prompt, model)
+                if record:
+                    logging.info("[Grok 图像线程] 图像库中已有相同提示词的图像，直接使用: %s", record["file"])
+                    self.app.after(0, self.show_generated_image, library.path_for(record), user_input)
+                    return
+            else:
+                logging.info("[Grok 图像线程] 收到 !fresh 指令，忽略图像库重新生成")
+
             logging.info("[Grok 图像线程] 准备调用 Grok 图像生成 API (模型: %s) 使用过滤后的历史记录", model)
             # 使用过滤后的历史记录调用API
             image_url = grok_client.get_grok_image_response(image_model_history, model=model)
@@ -86,51 +108,13 @@ class ImageHandler:
 
             if self.controller.is_streaming:
                 if image_url and image_url.startswith("http"):
-                    # 尝试下载图像并保存到指定目录
-                    try:
-                        response = requests.get(image_url, stream=True, timeout=10)
-                        if response.status_code == 200:
-                            # 指定保存目录，使用环境变量或默认路径
-                            save_dir = os.getenv("IMAGE_SAVE_DIR", os.path.join(tempfile.gettempdir(), "grok_images"))
-                            # 确保目录存在
-                            os.makedirs(save_dir, exist_ok=True)
-                            # 使用时间戳生成唯一文件名
-                            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                            # 尝试从URL获取文件扩展名，如果失败则默认为.png
-                            try:
-                                file_extension = os.path.splitext(image_url.split('?')[0])[-1] # 处理可能的URL参数
-                                if not file_extension or len(file_extension) > 5: # 简单检查扩展名有效性
-                                    file_extension = '.png'
-                            except Exception:
-                                file_extension = '.png'
-                                
-                            save_file = os.path.join(save_dir, f"grok_image_{timestamp}{file_extension}")
-                            with open(save_file, 'wb') as f:
-                                for chunk in response.iter_content(1024):
-                                    f.write(chunk)
-                            logging.info("[Grok 图像线程] 图像已保存到: %s", save_file)
-                            
-                            # --- 关键修改：根据 Artifacts 模式决定显示方式 ---
-                            if self.controller.chat_manager.is_artifacts_mode_enabled():
-                                logging.info("[Grok 图像线程] Artifacts模式启用，渲染图片到浏览器")
-                                # 移除思考中消息（如果存在）
-                                self.controller._remove_thinking_message()
-                                # 调用渲染方法
-                                self.app.after(0, self.controller.render_artifacts_image, save_file)
-                                # 因为图片显示在浏览器，主聊天区可以显示一个简单的提示
-                                self.app.after(10, self.controller.display_message, "assistant", "图像已生成，请查看浏览器。")
-                                # 结束流处理，并传递 save_file 作为 full_response
-                                self.app.after(20, self.controller.message_handler.handle_stream_end, None, user_input, save_file, "Grok")
-                            else:
-                                logging.info("[Grok 图像线程] Artifacts模式禁用，在聊天区域显示图片路径")
-                                # 否则只显示本地路径，不显示图片
-                                self.app.after(0, self.display_image_path, save_file)
-                        else:
-                            logging.error("[Grok 图像线程] 下载图像失败，状态码: %d", response.status_code)
-                            self.app.after(0, self.controller.message_handler.handle_stream_end, None, user_input, f"图像生成成功，但下载失败 (状态码: {response.status_code}): {image_url}\n请手动访问链接查看。", "Grok")
-                    except Exception as download_err:
-                        logging.error("[Grok 图像线程] 下载图像时出错: %s", download_err)
-                        self.app.after(0, self.controller.message_handler.handle_stream_end, None, user_input, f"图像生成成功，但无法下载: {image_url}\n请手动访问链接查看。", "Grok")
+                    # 收到链接即结束本轮（恢复输入），下载交给专用的下载线程池（连接池 + 断点续传），
+                    # 收入图像库后再回到主线程附上图像。先调度结束本轮，保证它在附上图像之前执行
+                    self.app.after(0, self.end_turn_before_download, image_url, user_input)
+                    chat_id = self.controller.chat_manager.current_chat_id  # 下载期间可能切换对话，结果只属于发起时的对话
+                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                    future = get_image_downloader().submit(image_url, f"grok_image_{timestamp}")
+                    future.add_done_callback(lambda f: self.collect_downloaded_image(f, image_url, user_input, prompt, model, chat_id))
                 elif image_url: # 如果返回的不是URL，可能是错误信息
                      logging.warning("[Grok 图像线程] API 返回的不是有效的 URL: %s", image_url)
                      self.app.after(0, self.controller.message_handler.handle_stream_end, None, user_input, image_url, "Grok")
@@ -147,8 +131,122 @@ class ImageHandler:
             logging.error("[Grok 图像线程] 发送消息线程出错: %s", e, exc_info=True) # 添加 exc_info=True 获取更详细的回溯信息
             if self.controller.is_streaming: self.app.after(0, self.controller.message_handler.handle_stream_end, e, user_input, None, "Grok")
 
-    def display_image_path(self, image_path):
-        """在聊天流中显示图像的本地文件路径，仅在非Artifacts模式下调用"""
+    def run_image_batch(self, prompt_text, user_input, model, directives):
+        """批量生成（工作线程）：并发生成，每张图像完成后立即显示路径，全部完成后汇总为一个网页"""
+        jobs = parse_batch_prompts(prompt_text)
+        if not jobs:
+            self.app.after(0, self.controller.message_handler.handle_stream_end, ValueError("批量生成没有有效的提示词"), user_input, None, "Grok")
+            return
+        total = sum(count for _, count in jobs)
+        logging.info("[Grok 图像线程] 批量生成: %d 条提示词，共 %d 张", len(jobs), total)
+        counter = itertools.count(1)  # on_image 在多个生成线程中调用，next() 是原子操作
+
+        def on_image(prompt, path):
+            self.app.after(0, self.display_batch_progress, next(counter), total, prompt, path)
+
+        images, errors = run_batch(jobs, model, on_image, use_library="fresh" not in directives,
+                                   is_cancelled=lambda: not self.controller.is_streaming)
+        self.app.after(0, self.finish_image_batch, images, errors, user_input)
+
+    def display_batch_progress(self, done, total, prompt, path):
+        """逐张显示批量生成的结果（主线程）"""
+        if not self.controller.is_streaming:
+            return
+        if done == 1:
+            self.controller._remove_thinking_message()
+        if self.status_label:
+            self.status_label.configure(text=f"批量生成中 {done}/{total}")
+        self.controller.display_message("assistant", f"[{done}/{total}] {prompt[:60]}\n{path}")
+        self.controller.image_previews.insert(path)
+
+    def finish_image_batch(self, images, errors, user_input):
+        """批量生成全部完成（主线程）：汇总页面交给 render_artifacts_html 打开，然后结束流处理"""
+        if not self.controller.is_streaming:
+            logging.info("[Grok 图像线程] 批量生成完成，但 is_streaming 已为 False，不再显示")
+            return
+        if not images:
+            self.controller._remove_thinking_message()
+        if errors:
+            self.controller.display_message("assistant", "以下图像生成失败:\n" + "\n".join(f"- {prompt[:60]}: {message}" for prompt, message in errors))
+        if images:
+            gallery = build_gallery_html(images, errors, url_for=self.controller.artifact_file_url)
+            self.controller.render_artifacts_html({"html": gallery, "title": f"批量生成的图片（{len(images)} 张）"})
+        # 图像已逐张显示，汇总页面也已打开，流结束时不再按单张图像处理
+        self.controller.message_handler.handle_stream_end(None, user_input, None, "Grok 批量")
+
+    def end_turn_before_download(self, image_url, user_input):
+        """收到图像链接（主线程）：提示正在下载并结束本轮，下载期间可以继续对话"""
+        if not self.controller.is_streaming:
+            logging.info("[Grok 图像线程] 收到图像链接，但 is_streaming 已为 False，图像仍在后台下载")
+            return
+        self.controller._remove_thinking_message()
+        self.controller.display_message("assistant", f"图像已生成，正在后台下载，完成后显示在这里：\n{image_url}")
+        # 不使用 "Grok" 作为来源：Artifacts 模式下 handle_stream_end 会把 full_response 当作图片路径处理
+        self.controller.message_handler.handle_stream_end(None, user_input, None, "Grok 图像")
+
+    def collect_downloaded_image(self, future, image_url, user_input, prompt, model, chat_id):
+        """
+        下载线程中调用：把下载好的文件收入图像库（按内容去重），图像路径作为助手消息写入发起下载的对话，
+        再回到主线程附上图像；下载失败时提示原始链接。
+        """
+        try:
+            result = future.result()
+            record = get_image_library().add(result.path, result.sha256, prompt, model, source_url=image_url)
+            save_file = get_image_library().path_for(record)
+        except Exception as download_err:
+            logging.error("[Grok 图像线程] 下载图像时出错: %s", download_err)
+            message = f"图像生成成功，但无法下载: {image_url}\n请手动访问链接查看。"
+            self.controller.chat_manager.add_message_to_chat(chat_id, "assistant", message)
+            self.app.after(0, self.attach_when_idle, chat_id, self.controller.display_message, "assistant", message)
+            return
+        self.controller.chat_manager.add_message_to_chat(chat_id, "assistant", f"生成的图像已保存到本地：\n{save_file}")
+        self.app.after(0, self.attach_when_idle, chat_id, self.show_generated_image, save_file, user_input, False)
+
+    def attach_when_idle(self, chat_id, callback, *args):
+        """
+        下载完成后附上结果（主线程）：正在生成下一条回复时稍后再试，避免与流式文本交错；
+        聊天区已切换到其他对话时不再显示（结果已写入发起下载的对话，打开该对话时可以看到）。
+        """
+        if self.controller.is_streaming:
+            self.app.after(IMAGE_ATTACH_RETRY_MS, self.attach_when_idle, chat_id, callback, *args)
+            return
+        if self.controller.chat_manager.current_chat_id != chat_id:
+            logging.info("[Grok 图像线程] 图像下载完成，但已切换到其他对话，不在当前聊天区显示")
+            return
+        callback(*args)
+
+    def show_generated_image(self, save_file, user_input, end_turn=True):
+        """
+        显示生成的图像（主线程）：根据 Artifacts 模式决定显示方式。
+        参数:
+            end_turn (bool): 图像库直接命中时为 True，显示后结束本轮；下载完成后附上图像时为 False（本轮已结束）
+        """
+        if end_turn and not self.controller.is_streaming:
+            logging.info("[Grok 图像线程] 图像已就绪，但 is_streaming 已为 False，不再显示")
+            return
+
+        # --- 关键修改：根据 Artifacts 模式决定显示方式 ---
+        if self.controller.chat_manager.is_artifacts_mode_enabled() and not end_turn:
+            logging.info("[Grok 图像线程] 图像下载完成，渲染到浏览器")
+            self.controller.render_artifacts_image(save_file)
+            self.controller.display_message("assistant", "图像已下载，请查看浏览器。")
+        elif self.controller.chat_manager.is_artifacts_mode_enabled():
+            logging.info("[Grok 图像线程] Artifacts模式启用，渲染图片到浏览器")
+            # 移除思考中消息（如果存在）
+            self.controller._remove_thinking_message()
+            # 调用渲染方法
+            self.app.after(0, self.controller.render_artifacts_image, save_file)
+            # 因为图片显示在浏览器，主聊天区可以显示一个简单的提示
+            self.app.after(10, self.controller.display_message, "assistant", "图像已生成，请查看浏览器。")
+            # 结束流处理，并传递 save_file 作为 full_response
+            self.app.after(20, self.controller.message_handler.handle_stream_end, None, user_input, save_file, "Grok")
+        else:
+            logging.info("[Grok 图像线程] Artifacts模式禁用，在聊天区域显示图片路径")
+            # 否则只显示本地路径，不显示图片
+            self.display_image_path(save_file, end_turn)
+
+    def display_image_path(self, image_path, end_turn=True):
+        """在聊天流中显示图像的本地文件路径，仅在非Artifacts模式下调用；end_turn 为 False 时本轮已结束，只附上路径与预览"""
         try:
             # 移除"思考中..."消息
             self.controller._remove_thinking_message()
@@ -156,7 +254,7 @@ class ImageHandler:
             # 确保 chat_display 存在
             if not self.chat_display:
                 logging.error("[错误] chat_display 未初始化，无法显示图像路径")
-                self.app.after(0, self.controller.message_handler.handle_stream_end, None, None, f"图像生成成功，但无法显示路径: chat_display 未初始化", "Grok")
+                if end_turn: self.app.after(0, self.controller.message_handler.handle_stream_end, None, None, f"图像生成成功，但无法显示路径: chat_display 未初始化", "Grok")
                 return
 
             # 插入 AI 标题和文件路径
@@ -167,13 +265,17 @@ class ImageHandler:
             # 准备要插入的消息内容
             message_content = f"生成的图像已保存到本地（点击路径打开文件）：\n{image_path}\n\n"
             self.chat_display.insert("end", message_content)
-            self.chat_display.see("end")
             self.chat_display.configure(state="disabled")
+            # 缩小后的预览在可见时由后台线程解码
+            self.controller.image_previews.insert(image_path)
+            self.chat_display.see("end")
 
             logging.info("图像本地路径已显示在聊天流中")
+            if not end_turn:
+                return
             # 结束流处理，并将图片路径消息保存到历史记录
             self.app.after(0, self.controller.message_handler.handle_stream_end, None, None, message_content.strip(), "Grok")
             
         except Exception as e:
             logging.error("显示图像路径时出错: %s", e)
-            self.app.after(0, self.controller.message_handler.handle_stream_end, None, None, f"图像生成成功，但无法显示路径: {e}", "Grok")
+            if end_turn: self.app.after(0, self.controller.message_handler.handle_stream_end, None, None, f"图像生成成功，但无法显示路径: {e}", "Grok")
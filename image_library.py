@@ -0,0 +1,189 @@
+# image_library.py (v1.3 - 图像库：按内容哈希去重保存生成的图像，索引记录提示词/模型/尺寸，后台生成缩略图，相同提示词直接复用；保存在统一临时目录下时登记到临时文件管理器（指定的 IMAGE_SAVE_DIR 不受容量淘汰），缩略图被淘汰后重新生成，聊天区预览优先使用缩略图)
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_downloader import IMAGE_SAVE_DIR
+from image_preview import PREVIEW_MAX_SIZE
+from search_cache import normalize_query
+from temp_manager import TEMP_CACHE_DIR, get_temp_manager
+
+THUMBNAIL_SIZE = PREVIEW_MAX_SIZE  # 与聊天区预览同尺寸，预览直接使用缩略图
+
+def prompt_key(prompt, model):
+    """提示词归一化（大小写、全半角、空白、句末标点）后与模型一起作为复用的键"""
+    return hashlib.sha1(f"{model}\x00{normalize_query(prompt)}".encode('utf-8')).hexdigest()
+
+class ImageLibrary:
+    """
+    以内容 SHA-256 命名保存图像（<digest><扩展名>），相同内容只保存一份。
+    - 索引文件 index.json 记录每张图像的提示词、模型、字节数、尺寸和缩略图文件名；
+    - 缩略图在后台线程中用 Pillow 生成，保存在 thumbs/ 下；缩略图与图像一样可能被临时目录淘汰，
+      使用前检查文件是否存在，不存在时清除记录并重新生成；
+    - lookup 按 (归一化提示词, 模型) 查找最近一次生成的图像。
+    """
+
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, root_dir=None):
+        self.root_dir = Path(root_dir) if root_dir else Path(IMAGE_SAVE_DIR)
+        self.thumb_dir = self.root_dir / "thumbs"
+        self.thumb_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root_dir / self.INDEX_FILE_NAME
+        self._lock = threading.Lock()
+        # 只有保存在统一临时目录下的图像参与容量淘汰；用户通过 IMAGE_SAVE_DIR 指定的目录由用户自己管理
+        self.temp_manager = get_temp_manager() if self.root_dir.resolve().is_relative_to(Path(TEMP_CACHE_DIR).resolve()) else None
+        self._index = self._load_index()
+        self._prompts = {}  # 提示词键 -> digest（最近一次生成的图像）
+        for digest, record in sorted(self._index.items(), key=lambda item: item[1].get("created_at", 0)):
+            for key in record.get("prompt_keys", []):
+                self._prompts[key] = digest
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-thumbnail")
+        missing = [digest for digest, record in self._index.items()
+                   if not record.get("thumbnail") or not (self.thumb_dir / record["thumbnail"]).exists()]
+        for digest in missing:
+            self._executor.submit(self._build_thumbnail, digest)
+        logging.info("[图像库] 初始化完成，目录: %s（%s），已索引 %d 张图像", self.root_dir,
+                     "临时目录，超出容量时淘汰" if self.temp_manager else "不参与临时目录淘汰", len(self._index))
+
+    # --- 索引 ---
+    def _load_index(self):
+        """读取索引文件，丢弃对应文件已不存在的记录"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning("[图像库] 索引文件损坏，将重新建立: %s", e)
+            return {}
+        return {digest: record for digest, record in index.items() if (self.root_dir / record["file"]).exists()}
+
+    def _save_index(self):
+        """原子地写回索引文件（调用方需持有锁）"""
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logging.error("[图像库] 写入索引文件出错: %s", e)
+
+    def path_for(self, record):
+        return str(self.root_dir / record["file"])
+
+    def thumbnail_path_for(self, digest):
+        """
+        图像的缩略图路径。缩略图尚未生成时返回 None；已被临时目录淘汰时清除记录并在后台重新生成，同样返回 None。
+        """
+        with self._lock:
+            record = self._index.get(digest)
+            thumbnail = record.get("thumbnail") if record else None
+        if not thumbnail:
+            return None
+        path = self.thumb_dir / thumbnail
+        if path.exists():
+            if self.temp_manager: self.temp_manager.touch(path)
+            return str(path)
+        logging.info("[图像库] 缩略图 %s 已被淘汰，重新生成", thumbnail)
+        with self._lock:
+            if record.get("thumbnail") == thumbnail:
+                record["thumbnail"] = None
+                self._save_index()
+        self._executor.submit(self._build_thumbnail, digest)
+        return None
+
+    def preview_path(self, path):
+        """聊天区预览使用的文件（工作线程调用）：图像库中的图像返回其缩略图，其他图像或缩略图不可用时返回原路径"""
+        path = Path(path)
+        if path.parent != self.root_dir:
+            return str(path)
+        return self.thumbnail_path_for(path.stem) or str(path)
+
+    # --- 查找与写入 ---
+    def lookup(self, prompt, model):
+        """
+        查找相同提示词和模型生成过的图像。
+        返回:
+            dict | None: 图像记录（文件仍存在时）
+        """
+        with self._lock:
+            digest = self._prompts.get(prompt_key(prompt, model))
+            record = self._index.get(digest) if digest else None
+        if record and (self.root_dir / record["file"]).exists():
+            if self.temp_manager: self.temp_manager.touch(self.root_dir / record["file"])
+            return record
+        return None
+
+    def add(self, file_path, digest, prompt, model, source_url=None):
+        """
+        把下载好的文件收入图像库。内容已存在时删除新文件，只在记录中追加提示词。
+        参数:
+            file_path (str): 下载的文件路径（收入后会被移动或删除）
+            digest (str): 文件内容的 SHA-256
+        返回:
+            dict: 图像记录
+        """
+        extension = os.path.splitext(file_path)[1] or ".png"
+        key = prompt_key(prompt, model)
+        with self._lock:
+            record = self._index.get(digest)
+            if record is not None and (self.root_dir / record["file"]).exists():
+                os.remove(file_path)
+                logging.info("[图像库] 内容与已有图像 %s 相同，不再重复保存", record["file"])
+            else:
+                target = self.root_dir / f"{digest}{extension}"
+                os.replace(file_path, target)
+                if self.temp_manager: self.temp_manager.register(target)
+                record = {"file": target.name, "size": target.stat().st_size, "width": None, "height": None,
+                          "model": model, "prompts": [], "prompt_keys": [], "source_url": source_url,
+                          "thumbnail": None, "created_at": time.time()}
+                self._index[digest] = record
+            if key not in record["prompt_keys"]:
+                record["prompt_keys"].append(key)
+                record["prompts"].append(prompt[:500])
+            self._prompts[key] = digest
+            self._save_index()
+        if not record.get("thumbnail") or not (self.thumb_dir / record["thumbnail"]).exists():
+            self._executor.submit(self._build_thumbnail, digest)
+        return record
+
+    # --- 缩略图 ---
+    def _build_thumbnail(self, digest):
+        """后台线程：读取尺寸并生成缩略图，写回索引"""
+        with self._lock:
+            record = self._index.get(digest)
+        if record is None:
+            return
+        thumbnail_name = f"{digest}.png"
+        try:
+            with Image.open(self.root_dir / record["file"]) as image:
+                width, height = image.size
+                image.thumbnail(THUMBNAIL_SIZE)
+                image.save(self.thumb_dir / thumbnail_name, "PNG")
+            if self.temp_manager: self.temp_manager.register(self.thumb_dir / thumbnail_name)
+        except Exception as e:
+            logging.warning("[图像库] 生成缩略图失败 %s: %s", record["file"], e)
+            return
+        with self._lock:
+            record.update(width=width, height=height, thumbnail=thumbnail_name)
+            self._save_index()
+        logging.info("[图像库] 已生成缩略图 %s (%dx%d)", thumbnail_name, width, height)
+
+_image_library = None
+_image_library_lock = threading.Lock()
+
+def get_image_library():
+    """获取共享的图像库（延迟创建）"""
+    global _image_library
+    with _image_library_lock:
+        if _image_library is None:
+            _image_library = ImageLibrary()
+        return _image_library
@@ -0,0 +1,185 @@
+# image_preview.py (v1.1 - 聊天区内嵌图像预览：按字节限额的 LRU 缓存缩小后的 PhotoImage，滚动到可见时才在后台线程解码缩放，有缩略图时解码缩略图)
+import os
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageTk
+
+IMAGE_PREVIEW_CACHE_MB = float(os.getenv("IMAGE_PREVIEW_CACHE_MB", "48"))  # 预览缓存的内存上限（MB）
+PREVIEW_MAX_SIZE = (360, 360)  # 预览的最大宽高（像素）
+VISIBILITY_POLL_MS = 400  # 有预览时检查可见性的间隔（毫秒），覆盖拖动滚动条等没有事件的滚动
+VISIBILITY_DEBOUNCE_MS = 80
+
+class PreviewCache:
+    """
+    以字节计量的 LRU 缓存（值为 PhotoImage）。每个条目按 宽 × 高 × 4 字节估算内存，
+    总量超过 max_bytes 时淘汰最久未使用的条目，并调用 on_evict(key)。
+    """
+
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # 键 -> (PhotoImage, 字节数)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, photo, nbytes):
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (photo, nbytes)
+        self.total_bytes += nbytes
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_key, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_bytes
+            if self.on_evict:
+                self.on_evict(evicted_key)
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+def load_preview(path, max_size=PREVIEW_MAX_SIZE):
+    """工作线程：解码并缩小图像，返回 RGB/RGBA 的 PIL 图像（PhotoImage 只能在 Tk 主线程创建）"""
+    with Image.open(path) as image:
+        image.draft("RGB", max_size)  # JPEG 解码时直接按比例缩小，减少解码量
+        image.thumbnail(max_size)
+        return image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+class InlineImagePreviews:
+    """
+    在聊天区（CTkTextbox 内部的 tk.Text）中嵌入图像预览。
+    - insert 只插入一个空的嵌入图像占位，不解码；
+    - 占位滚动到可见区域时，在后台线程解码缩放（source_for 给出缩略图时解码缩略图），回到主线程创建 PhotoImage 并放入 PreviewCache；
+    - 缓存超出字节上限时淘汰最久未看的预览，占位清空，再次滚动到可见时重新解码。
+    """
+
+    def __init__(self, app, chat_display, max_bytes=int(IMAGE_PREVIEW_CACHE_MB * 1024 * 1024), source_for=None):
+        """
+        参数:
+            source_for (function): source_for(图像路径) -> 实际解码的文件路径（如图像库的缩略图），在工作线程中调用
+        """
+        self.app = app
+        self.source_for = source_for
+        # CTkTextbox 禁止 image_create（与缩放不兼容），预览嵌入到内部的 tk.Text 中
+        self.text = getattr(chat_display, "_textbox", chat_display) if chat_display else None
+        self.cache = PreviewCache(max_bytes, on_evict=self._on_evict)
+        self._previews = {}  # 占位名 -> 图像路径
+        self._pending = set()  # 正在后台解码的占位名
+        self._generation = 0  # clear() 后丢弃之前提交的解码结果
+        self._counter = 0
+        self._refresh_after_id = None
+        self._poll_after_id = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-preview")
+        if self.text is not None:
+            for sequence in ("<Configure>", "<MouseWheel>", "<Button-4>", "<Button-5>", "<KeyRelease>"):
+                self.text.bind(sequence, self.schedule_refresh, add="+")
+
+    def insert(self, path):
+        """在聊天区末尾插入一张图像的预览占位（主线程）"""
+        if self.text is None or not os.path.exists(path):
+            return
+        self._counter += 1
+        name = f"preview_{self._counter}"
+        state = self.text.cget("state")
+        self.text.configure(state="normal")
+        try:
+            self.text.image_create("end", name=name, padx=4, pady=4)
+            self.text.insert("end", "\n\n")
+        finally:
+            self.text.configure(state=state)
+        self._previews[name] = path
+        self.schedule_refresh()
+        self._ensure_polling()
+
+    def clear(self):
+        """清空对话或切换对话时调用：丢弃所有预览与缓存（聊天区内容由调用方清除）"""
+        self._generation += 1
+        self._previews.clear()
+        self._pending.clear()
+        self.cache.clear()
+        if self._poll_after_id is not None:
+            self.app.after_cancel(self._poll_after_id)
+            self._poll_after_id = None
+
+    # --- 可见性 ---
+    def schedule_refresh(self, event=None):
+        if self._refresh_after_id is None and self._previews:
+            self._refresh_after_id = self.app.after(VISIBILITY_DEBOUNCE_MS, self._refresh_visible)
+
+    def _ensure_polling(self):
+        if self._poll_after_id is None:
+            self._poll_after_id = self.app.after(VISIBILITY_POLL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_after_id = None
+        if not self._previews:
+            return
+        self._refresh_visible()
+        self._ensure_polling()
+
+    def _refresh_visible(self):
+        self._refresh_after_id = None
+        for name, path in list(self._previews.items()):
+            try:
+                visible = self.text.bbox(name) is not None
+            except Exception:
+                self._previews.pop(name, None)  # 占位已随聊天区内容删除
+                continue
+            if not visible:
+                continue
+            if self.cache.get(name) is not None or name in self._pending:
+                continue
+            self._pending.add(name)
+            future = self._executor.submit(self._load, path)
+            generation = self._generation
+            future.add_done_callback(lambda f, name=name, generation=generation: self.app.after(0, self._on_loaded, name, generation, f))
+
+    def _load(self, path):
+        """工作线程：有缩略图时解码缩略图，否则解码原图"""
+        source = path
+        if self.source_for is not None:
+            try:
+                source = self.source_for(path)
+            except Exception as e:
+                logging.warning("[图像预览] 查找缩略图失败 %s: %s", path, e)
+        return load_preview(source)
+
+    def _on_loaded(self, name, generation, future):
+        """主线程：把解码好的图像转换为 PhotoImage，放入缓存并显示"""
+        if generation != self._generation or name not in self._previews:
+            return
+        self._pending.discard(name)
+        try:
+            image = future.result()
+        except Exception as e:
+            logging.warning("[图像预览] 加载预览失败 %s: %s", self._previews.get(name), e)
+            self._previews.pop(name, None)
+            return
+        photo = ImageTk.PhotoImage(image, master=self.text)
+        self.cache.put(name, photo, image.width * image.height * 4)
+        try:
+            self.text.image_configure(name, image=photo)
+        except Exception as e:
+            logging.warning("[图像预览] 显示预览失败: %s", e)
+        logging.debug("[图像预览] 已解码 %s，缓存 %d 张 / %.1f MB", name, len(self.cache), self.cache.total_bytes / 1048576)
+
+    def _on_evict(self, name):
+        """缓存淘汰时清空占位中的图像，PhotoImage 随之释放"""
+        try:
+            self.text.image_configure(name, image="")
+        except Exception:
+            pass
+        logging.info("[图像预览] 缓存已满，释放预览 %s", name)
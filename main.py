@@ -11,6 +11,11 @@ import sys
 import ctypes  # 用于设置线程模式
 import logging  # 引入 logging 模块
 import traceback
+import multiprocessing  # 文档解析进程池需要
+
+if __name__ == "__main__":
+    # 打包后的进程池子进程会重新执行本入口，freeze_support 会直接运行任务并退出，必须在创建任何 UI 之前调用
+    multiprocessing.freeze_support()
 
 # 设置日志配置
 def setup_logging():
@@ -56,33 +61,53 @@ from event_handlers import AppController
 from config_manager import load_environment_variables, build_backend_configs, get_config_for_controller
 from ui_builder import build_ui, get_theme_colors
 from ui_builder import build_ui
+import document_ingest
+from artifact_server import shutdown_artifact_server
+from temp_manager import get_temp_manager, shutdown_temp_manager
 
 # --- 全局变量定义 ---
 app = None
+app_controller = None
+ui_elements = None
+config_for_controller = None
 
 # --- 初始化 ---
-# 加载环境变量
-load_environment_variables()
+def initialize_application():
+    """
+    加载配置并构建 UI。
+    放在函数中而不是模块顶层执行，这样进程池子进程（以 __mp_main__ 身份导入本模块）不会创建窗口。
+    """
+    global app, app_controller, ui_elements, config_for_controller, chat_manager, backend_display_names
+    # 加载环境变量
+    load_environment_variables()
+
+    # 构建后端配置列表 & 获取显示名称
+    backend_display_names = build_backend_configs()
 
-# 构建后端配置列表 & 获取显示名称
-backend_display_names = build_backend_configs()
+    # Chat Manager 初始化
+    chat_manager = ChatManager()
 
-# Chat Manager 初始化
-chat_manager = ChatManager()
+    # 临时文件目录：后台执行一次启动清理（失效索引、旧版遗留文件、超出容量的部分）
+    get_temp_manager().start_cleanup()
 
-# --- UI 设置 ---
-app = ctk.CTk()
+    # --- UI 设置 ---
+    app = ctk.CTk()
 
-# 构建 UI 并获取 UI 元素
-ui_elements = build_ui(app)  # 不传递 app_controller
+    # 构建 UI 并获取 UI 元素
+    ui_elements = build_ui(app)  # 不传递 app_controller
 
-# --- 创建 AppController 实例 ---
-utils_functions = {}  # 移除对 ensure_prompt_file 的引用
-config_for_controller = get_config_for_controller()
-app_controller = AppController(app, ui_elements, chat_manager, utils_functions, config_for_controller)
+    # --- 创建 AppController 实例 ---
+    utils_functions = {}  # 移除对 ensure_prompt_file 的引用
+    config_for_controller = get_config_for_controller()
+    app_controller = AppController(app, ui_elements, chat_manager, utils_functions, config_for_controller)
 
-# 确保 app_controller 绑定到 app 对象
-app.app_controller = app_controller  # 新增：将 app_controller 绑定到 app 对象
+    # 确保 app_controller 绑定到 app 对象
+    app.app_controller = app_controller  # 新增：将 app_controller 绑定到 app 对象
+
+    # 调用事件绑定函数
+    bind_ui_events(ui_elements, app_controller)
+
+    app.protocol("WM_DELETE_WINDOW", on_closing)
 
 # 更新 UI 控件的 command 和绑定
 def bind_ui_events(ui_elements, app_controller):
@@ -93,6 +118,7 @@ def bind_ui_events(ui_elements, app_controller):
     ui_elements['translate_button'].configure(command=lambda: toggle_translate_mode(ui_elements['translate_var']))  # 新增翻译按钮绑定
     ui_elements['input_entry'].bind("<Return>", lambda event: app_controller.handle_send_message())
     ui_elements['settings_button'].configure(command=app_controller.open_settings_window)
+    ui_elements['history_search_button'].configure(command=app_controller.open_chat_search_window)
     ui_elements['heart_new_chat_button'].configure(command=app_controller.handle_create_new_chat)
     # 新增取消按钮绑定
     ui_elements['cancel_button'].configure(command=app_controller.cancel_streaming)
@@ -101,9 +127,6 @@ def bind_ui_events(ui_elements, app_controller):
     # 确保上传按钮绑定已在 MessageHandler 中完成
     # 确保模型选择器绑定已在 AppController 中完成
 
-# 调用事件绑定函数
-bind_ui_events(ui_elements, app_controller)
-
 def toggle_search_mode(search_var):
     """切换搜索模式状态"""
     search_var.set(1 if search_var.get() == 0 else 0)
@@ -144,6 +167,18 @@ def on_closing():
     
     # 清理所有未完成的 after 任务
     cleanup_after_tasks()
+
+    # 停止文档解析进程池，取消尚未开始的解析任务
+    document_ingest.shutdown_process_pool()
+
+    # 关闭对话数据库
+    chat_manager.close()
+
+    # 停止 Artifacts 服务器（断开已打开页面的事件流）
+    shutdown_artifact_server()
+
+    # 写回临时文件索引
+    shutdown_temp_manager()
     
     # 尝试销毁所有子窗口和组件
     try:
@@ -174,8 +209,6 @@ def on_closing():
     # 确保程序退出
     sys.exit(0)
 
-app.protocol("WM_DELETE_WINDOW", on_closing)
-
 def start_application():
     """启动应用程序，执行初始设置和检查"""
     def initial_switch():
@@ -217,5 +250,6 @@ sys.excepthook = handle_global_exception
 
 # --- 启动应用 ---
 if __name__ == "__main__":
+    initialize_application()
     start_application()
     app.mainloop()
\ No newline at end of file
@@ -1,15 +1,22 @@
-# message_handler.py (v1.27 - 优化流式传输性能，减少UI更新频率，限制输出长度，修复Artifacts后聊天记录消失，隐藏Artifacts指令代码，修复模型回复出现两次，支持输入超长转为附件)
+# message_handler.py (v1.30 - 优化流式传输性能，减少UI更新频率，限制输出长度，修复Artifacts后聊天记录消失，隐藏Artifacts指令代码，修复模型回复出现两次，支持输入超长转为附件，搜索前本地判断，输入时预测搜索，超长回复写入统一临时目录，搜索查询使用不含附件说明的原始输入)
 import threading
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import os
-import tempfile
 from pathlib import Path
 import api_client
 import grok_client
 import web_search
 from prompts import PROMPT_NETWORKING
+from attachment_store import AttachmentStore
+from document_ingest import DocumentIngestor, FILE_DIALOG_TYPES
+from attachment_retrieval import AttachmentRetriever
+from prompt_layout import build_request_messages, summarize_usage, log_usage
+from search_gate import decide_search
+from speculative_search import SpeculativeSearch
+from temp_manager import get_temp_manager
+from utils import parse_message_directives
 import logging
 import datetime
 import re
@@ -32,19 +39,32 @@ class MessageHandler:
         self.status_label = self.ui.get('status_label')
         self.chat_display = self.ui.get('chat_display')
         self.upload_button = self.ui.get('upload_button')
-        # 新增：存储临时附件的列表
+        # 新增：存储待发送附件的列表（元素为附件存储中的元数据）
         self.temp_attachments = []
+        # 内容寻址的附件存储，以及当前对话中已发送过的附件哈希
+        self.attachment_store = AttachmentStore()
+        self.sent_attachment_digests = set()
+        # 大附件在本地检索，只发送与最终输入相关的片段；force_full_attachments 为 True 时始终发送全文
+        self.attachment_retriever = AttachmentRetriever(self.attachment_store)
+        self.force_full_attachments = os.getenv("ATTACHMENT_FULL_INCLUSION", "0") == "1"
+        # 上传文档在进程池中解析，解析结果直接写入附件存储
+        self.document_ingestor = DocumentIngestor(self.attachment_store)
+        self.ingest_poll_interval = 100  # 解析进度轮询间隔（毫秒）
+        self.is_polling_ingestion = False
         # 绑定上传按钮事件
         if self.upload_button:
             self.upload_button.configure(command=self.handle_file_upload)
         # 新增：绑定输入框的粘贴事件（通过绑定 <Control-v>）
         if self.input_entry:
             self.input_entry.bind("<Control-v>", self.handle_paste_event)
+        # 搜索模式下输入停顿时提前在后台搜索草稿
+        self.speculative_search = SpeculativeSearch(self.app, self.input_entry, self.can_speculate_search)
         # 新增：用于分批更新UI的队列和标志
         self.chunk_queue = []
         self.is_processing_queue = False
         # 新增：用于累积流式传输数据的缓冲区和计时器
         self.stream_buffer = ""
+        self.last_request_usage = None  # 最近一次请求的 token 用量（含前缀缓存命中）
         self.buffer_size_limit = 500  # 缓冲区大小限制，超过此大小更新UI
         self.buffer_time_limit = 500  # 缓冲区时间限制（毫秒），超过此时间更新UI
         self.last_buffer_flush = 0  # 上次清空缓冲区的时间戳
@@ -52,23 +72,53 @@ class MessageHandler:
         self.has_displayed_streaming_content = False
 
     def handle_file_upload(self):
-        """处理文件上传"""
-        file_path = filedialog.askopenfilename(
-            title="选择TXT文件",
-            filetypes=[("Text files", "*.txt")]
+        """处理文件上传：提交到后台进程池解析，不在 UI 线程读取文件"""
+        file_paths = filedialog.askopenfilenames(
+            title="选择文件",
+            filetypes=FILE_DIALOG_TYPES
         )
-        if not file_path:
+        if not file_paths:
             logging.info("[文件上传] 用户取消了文件选择")
             return
 
+        for file_path in file_paths:
+            if not self.document_ingestor.is_supported(file_path):
+                logging.warning("[文件上传] 不支持的文件类型: %s", file_path)
+                messagebox.showerror("文件类型不支持", f"暂不支持该文件类型：{os.path.basename(file_path)}")
+                continue
+            try:
+                self.document_ingestor.submit(file_path)
+            except Exception as e:
+                logging.error("[文件上传] 提交解析任务出错: %s", e)
+                messagebox.showerror("文件读取错误", f"无法读取文件：{e}")
+
+        if self.document_ingestor.has_pending_jobs() and not self.is_polling_ingestion:
+            self.is_polling_ingestion = True
+            self.app.after(self.ingest_poll_interval, self.poll_ingestion)
+
+    def poll_ingestion(self):
+        """在主线程中轮询解析进度，更新状态栏并登记完成的附件"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            logging.info("[文件上传] 成功读取文件: %s, 长度: %d 字符", file_path, len(content))
-            self.save_as_attachment(content, source=os.path.basename(file_path))
+            self.document_ingestor.drain_progress()
+            for job, record, error in self.document_ingestor.collect_finished():
+                if error:
+                    messagebox.showerror("文件读取错误", f"无法读取文件 {job['name']}：{error}")
+                else:
+                    self.add_pending_attachment(record, job['name'])
+            if self.status_label and not self.controller.is_streaming:
+                jobs = list(self.document_ingestor.jobs.values())
+                if jobs:
+                    progress_text = "，".join(f"{job['name']} {int(job['progress'] * 100)}%" for job in jobs)
+                    self.status_label.configure(text=f"正在解析: {progress_text}")
+                else:
+                    self.status_label.configure(text="")
         except Exception as e:
-            logging.error("[文件上传] 读取文件出错: %s", e)
-            messagebox.showerror("文件读取错误", f"无法读取文件：{e}")
+            logging.error("[文件上传] 轮询解析进度时出错: %s", e)
+
+        if self.document_ingestor.has_pending_jobs():
+            self.app.after(self.ingest_poll_interval, self.poll_ingestion)
+        else:
+            self.is_polling_ingestion = False
 
     def handle_paste_event(self, event):
         """处理粘贴事件，检查内容长度并转为附件"""
@@ -89,21 +139,47 @@ class MessageHandler:
             logging.error("[粘贴事件] 处理出错: %s", e)
 
     def save_as_attachment(self, content, source="用户输入"):
-        """将长内容保存为临时附件"""
+        """将长内容保存到附件存储（按内容哈希去重）"""
         try:
-            # 创建临时文件
-            temp_dir = tempfile.gettempdir()
-            temp_file = os.path.join(temp_dir, f"copilot_attachment_{len(self.temp_attachments)}_{id(content)}_{source.replace(' ', '_')}.txt")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            self.temp_attachments.append({"file_path": temp_file, "source": source, "length": len(content)})
-            logging.info("[附件保存] 已保存内容到临时文件: %s, 来源: %s, 长度: %d", temp_file, source, len(content))
-            # 在UI中显示附件信息
-            self.controller.display_message("user", f"已保存附件（来源：{source}，长度：{len(content)}字符）")
+            record, is_new = self.attachment_store.put(content, source)
+            self.add_pending_attachment(record, source)
         except Exception as e:
-            logging.error("[附件保存] 保存临时文件出错: %s", e)
+            logging.error("[附件保存] 保存附件出错: %s", e)
             messagebox.showerror("处理错误", f"无法保存附件：{e}")
 
+    def add_pending_attachment(self, record, source):
+        """将附件存储中的记录加入待发送列表，同一内容只加入一次"""
+        digest = record["digest"]
+        if any(att["digest"] == digest for att in self.temp_attachments):
+            logging.info("[附件保存] 附件 %s... 已在待发送列表中，忽略重复内容", digest[:12])
+            self.controller.display_message("user", f"附件内容与已添加的附件相同（来源：{source}），已忽略")
+            return
+        self.temp_attachments.append({
+            "digest": digest,
+            "source": source,
+            "length": record["chars"],
+            "lines": record["lines"],
+            "tokens": record["tokens"],
+        })
+        logging.info("[附件保存] 已加入待发送附件: %s..., 来源: %s, 长度: %d", digest[:12], source, record["chars"])
+        if record["tokens"] > self.attachment_retriever.token_budget:
+            # 大附件提前在后台建立检索索引
+            self.attachment_retriever.prepare_async(digest)
+        # 在UI中显示附件信息
+        self.controller.display_message("user", f"已保存附件（来源：{source}，长度：{record['chars']}字符，约 {record['tokens']} tokens）")
+
+    def reset_sent_attachments(self):
+        """新建或切换对话时清空已发送附件记录"""
+        self.sent_attachment_digests.clear()
+
+    def can_speculate_search(self):
+        """当前是否适合预测搜索：搜索模式已开启、选中 Grok 对话模型、配置了 Tavily Key 且没有在生成回复"""
+        config = self.controller.selected_backend_config
+        return (not self.controller.is_streaming
+                and self.chat_manager.is_search_mode_enabled()
+                and bool(config) and config.get('provider') == "Grok" and config.get('model') != "grok-2-image-latest"
+                and bool(os.getenv("TAVILY_API_KEY")))
+
     def handle_send_message(self, event=None):
         """处理发送消息的事件，调用 message_handler"""
         if self.controller.is_streaming:
@@ -118,6 +194,11 @@ class MessageHandler:
 
         # 获取输入内容
         user_input = self.input_entry.get("1.0", tk.END).strip()
+        # 取出单条消息指令（如 !search / !nosearch），不发送给模型
+        user_input, directives = parse_message_directives(user_input)
+        if directives:
+            logging.info("[输入处理] 本条消息指令: %s", ", ".join(sorted(directives)))
+        self.speculative_search.on_message_sent()
         final_input = user_input if user_input else ""
         display_text = final_input
 
@@ -133,7 +214,7 @@ class MessageHandler:
 
         # 检查是否有附件
         if self.temp_attachments:
-            attachments_info = "\n".join([f"附件 {i+1}: 来源 {att['source']}, 长度 {att['length']} 字符" for i, att in enumerate(self.temp_attachments)])
+            attachments_info = "\n".join([f"附件 {i+1}: 来源 {att['source']}, 长度 {att['length']} 字符 (约 {att['tokens']} tokens)" for i, att in enumerate(self.temp_attachments)])
             if final_input and len(final_input) <= input_length_threshold:
                 display_text = f"最终输入: {final_input}\n已上传附件:\n{attachments_info}"
             else:
@@ -146,24 +227,10 @@ class MessageHandler:
 
         self.input_entry.delete("1.0", tk.END)
         self.controller.display_message("user", display_text)
-        logging.info("[处理流程] 添加用户消息到 ChatManager")
 
-        # 构建完整用户输入（包括附件内容）
-        full_content_parts = []
-        if self.temp_attachments:
-            for i, att in enumerate(self.temp_attachments):
-                try:
-                    with open(att['file_path'], 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    full_content_parts.append(f"附件 {i+1} (来源: {att['source']}, 长度: {att['length']} 字符):\n{content}")
-                except Exception as e:
-                    logging.error("[读取附件] 读取附件 %s 出错: %s", att['file_path'], e)
-                    full_content_parts.append(f"附件 {i+1} (来源: {att['source']}, 长度: {att['length']} 字符): 读取失败，无法包含内容")
-        if final_input and len(final_input) <= input_length_threshold:
-            full_content_parts.append(f"最终输入:\n{final_input}")
-
-        full_content = "\n\n---\n\n".join(full_content_parts) if full_content_parts else ""
-        self.chat_manager.add_message_to_current_chat("user", full_content if full_content else final_input)
+        # 附件内容在工作线程中读取并组装，这里只记录待发送的附件元数据
+        pending_attachments = list(self.temp_attachments)
+        short_input = final_input if final_input and len(final_input) <= input_length_threshold else ""
         self.controller.display_thinking_message()
 
         self.controller.is_streaming = True
@@ -181,15 +248,12 @@ class MessageHandler:
         thread = None
 
         try:
-            logging.info("[处理流程] 获取包含最新用户消息的历史记录副本")
-            message_history_copy = self.chat_manager.get_current_history()
-
             if backend_type == "API":
                 if provider == "DeepSeek":
                     if not api_client.client:
                         self.app.after(0, self.handle_stream_end, ConnectionError("DeepSeek API 未初始化"), display_text, None, "DeepSeek")
                         return
-                    thread = threading.Thread(target=self.send_deepseek_message_thread, args=(display_text, message_history_copy), daemon=True)
+                    target, extra_args = self.send_deepseek_message_thread, ()
                 elif provider == "Grok":
                     if not grok_client.grok_client:
                         self.app.after(0, self.handle_stream_end, ConnectionError("Grok API 未初始化"), display_text, None, "Grok")
@@ -198,9 +262,10 @@ class MessageHandler:
                     if model == "grok-2-image-latest":
                         from image_handler import ImageHandler
                         image_handler = ImageHandler(self.controller, self.app, self.ui)
-                        thread = threading.Thread(target=image_handler.send_grok_image_message_thread, args=(display_text, message_history_copy, model), daemon=True)
+                        # 批量生成按行拆分用户的原始输入（可能超过转为附件的阈值）
+                        target, extra_args = image_handler.send_grok_image_message_thread, (model, directives, final_input)
                     else:
-                        thread = threading.Thread(target=self.send_grok_message_thread, args=(display_text, message_history_copy, model), daemon=True)
+                        target, extra_args = self.send_grok_message_thread, (model, directives, short_input)
                 else:
                     self.app.after(0, self.handle_stream_end, ValueError(f"未知 API Provider: {provider}"), display_text, None, "未知API")
                     return
@@ -208,13 +273,14 @@ class MessageHandler:
                 self.app.after(0, self.handle_stream_end, ValueError(f"不支持的后端类型: {backend_type}"), display_text, None, "系统错误")
                 return
 
+            thread = threading.Thread(target=self.prepare_and_dispatch_thread, args=(target, extra_args, display_text, short_input, pending_attachments, provider), daemon=True)
             if thread:
                 logging.info("[处理流程] 准备启动 %s 处理线程", provider)
                 thread.start()
             else:
                 self.app.after(0, self.handle_stream_end, RuntimeError("未能创建处理线程"), display_text, None, "系统错误")
 
-            # 发送后清理临时附件
+            # 发送后清空待发送附件列表
             self.cleanup_attachments()
 
         except Exception as e_start_thread:
@@ -223,16 +289,61 @@ class MessageHandler:
             self.cleanup_attachments()
 
     def cleanup_attachments(self):
-        """清理临时附件文件"""
-        for att in self.temp_attachments:
+        """清空待发送附件列表（附件文件保留在内容寻址存储中，供重复内容复用）"""
+        self.temp_attachments = []
+        logging.info("[清理附件] 已清空待发送附件列表")
+
+    def prepare_and_dispatch_thread(self, target, extra_args, display_text, short_input, attachments, backend_name):
+        """
+        工作线程：读取附件并组装完整用户消息，写入 ChatManager 后调用对应后端的处理函数。
+        附件读取在附件存储的线程池中并行完成，Tk 主线程不做任何磁盘 I/O。
+        """
+        try:
+            full_content = self.build_user_content(short_input, attachments)
+            logging.info("[处理流程] 添加用户消息到 ChatManager")
+            self.chat_manager.add_message_to_current_chat("user", full_content if full_content else short_input)
+            logging.info("[处理流程] 获取包含最新用户消息的历史记录副本")
+            message_history_copy = self.chat_manager.get_current_history()
+        except Exception as e:
+            logging.error("[处理流程] 组装用户消息时出错: %s", e)
+            if self.controller.is_streaming: self.app.after(0, self.handle_stream_end, e, display_text, None, backend_name)
+            return
+        target(display_text, message_history_copy, *extra_args)
+
+    def build_user_content(self, short_input, attachments):
+        """
+        读取附件内容并与最终输入组装为一条用户消息。
+        当前对话中已发送过全文的附件不再重复附上；附件总量超出 token 预算时只附上与最终输入最相关的片段，
+        这样的附件再次附上时按新的最终输入重新检索。
+        """
+        full_content_parts = []
+        new_attachments = [att for att in attachments if att['digest'] not in self.sent_attachment_digests]
+        futures = dict(zip((att['digest'] for att in new_attachments), self.attachment_store.load_async([att['digest'] for att in new_attachments])))
+        loaded = []
+        failed = set()
+        for att in new_attachments:
             try:
-                if os.path.exists(att['file_path']):
-                    os.remove(att['file_path'])
-                    logging.info("[清理附件] 已删除临时文件: %s", att['file_path'])
+                loaded.append((att, futures[att['digest']].result()))
             except Exception as e:
-                logging.error("[清理附件] 删除临时文件 %s 出错: %s", att['file_path'], e)
-        self.temp_attachments = []
-        logging.info("[清理附件] 已清理所有临时附件")
+                logging.error("[读取附件] 读取附件 %s... 出错: %s", att['digest'][:12], e)
+                failed.add(att['digest'])
+        contexts, full_digests = self.attachment_retriever.build_context(short_input, loaded, force_full=self.force_full_attachments)
+
+        for i, att in enumerate(attachments):
+            header = f"附件 {i+1} (来源: {att['source']}, 长度: {att['length']} 字符)"
+            if att['digest'] in failed:
+                full_content_parts.append(f"{header}: 读取失败，无法包含内容")
+            elif att['digest'] not in futures:
+                logging.info("[读取附件] 附件 %s... 已在当前对话中发送过，不再重复附上", att['digest'][:12])
+                full_content_parts.append(f"{header}: 内容与本对话中之前发送的附件相同，此处不再重复附上")
+            else:
+                full_content_parts.append(f"{header}:\n{contexts[att['digest']]}")
+                # 只有附上全文的附件才算已发送；只发送了片段的附件再次附上时按新的问题重新检索
+                if att['digest'] in full_digests:
+                    self.sent_attachment_digests.add(att['digest'])
+        if short_input:
+            full_content_parts.append(f"最终输入:\n{short_input}")
+        return "\n\n---\n\n".join(full_content_parts) if full_content_parts else ""
 
     def handle_stream_chunk(self, chunk):
         """处理流式响应的数据块，累积一定量后再更新UI以避免卡顿，检查并暂时隐藏Artifacts指令"""
@@ -244,6 +355,7 @@ class MessageHandler:
             # 累积数据到缓冲区
             self.stream_buffer += chunk
             self.controller.accumulated_stream_text += chunk  # 仍然累积到总文本中，用于最终保存
+            self.chat_manager.record_stream_chunk(chunk)  # 增量只入队写日志，崩溃后可恢复
             current_time = int(datetime.datetime.now().timestamp() * 1000)  # 当前时间戳（毫秒）
 
             # 检查是否包含Artifacts指令，如果包含则暂时不更新UI
@@ -390,11 +502,12 @@ class MessageHandler:
                 # 截断显示内容
                 truncated_response = final_response_to_save[:max_display_length] + "\n\n[内容过长，已截断。完整内容已保存到临时文件，请查看。]"
                 # 保存完整内容到临时文件
-                temp_dir = tempfile.gettempdir()
-                temp_file = os.path.join(temp_dir, f"full_response_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+                temp_manager = get_temp_manager()
+                temp_file = str(temp_manager.new_path("responses", "full_response_", ".txt"))
                 try:
                     with open(temp_file, 'w', encoding='utf-8') as f:
                         f.write(final_response_to_save)
+                    temp_manager.register(temp_file)
                     logging.info("[性能优化] 完整内容已保存到临时文件: %s", temp_file)
                     truncated_response += f"\n完整内容路径：{temp_file}"
                 except Exception as e:
@@ -493,11 +606,15 @@ class MessageHandler:
 
         if final_response_to_save:
             self.controller.save_chat_after_stream(final_response_to_save, user_input)  # 使用累积文本保存
+        self.chat_manager.end_stream()
 
         # UI 状态恢复
         if self.status_label:
             default_text_color = ctk.ThemeManager.theme["CTkLabel"]["text_color"]
             status_text = ""  # 初始为空，不显示对勾图标
+            usage, self.last_request_usage = self.last_request_usage, None
+            if usage and usage["prompt_tokens"]:
+                status_text = f"输入 {usage['prompt_tokens']} tokens，缓存命中 {usage['cached_tokens']} ({usage['cache_hit_ratio']:.0%})"
             if error:
                 status_text = f"错误 ({backend_name})"
                 default_text_color = ("#FF0000", "#FF6666")
@@ -519,6 +636,15 @@ class MessageHandler:
 
         logging.info("[主线程] 流结束处理完成 (来自 %s)", backend_name)
 
+    def make_usage_callback(self, backend_name):
+        """生成 usage 回调：记录本次请求的 token 用量与前缀缓存命中，流结束时显示在状态栏"""
+        def usage_callback(usage):
+            summary = summarize_usage(usage)
+            log_usage(backend_name, summary)
+            self.last_request_usage = summary
+        self.last_request_usage = None
+        return usage_callback
+
     def send_deepseek_message_thread(self, user_input, message_history):
         try:
             if not self.controller.is_streaming:
@@ -533,7 +659,7 @@ class MessageHandler:
                 # 回调返回 handle_stream_chunk 的结果 (通常是 True)
                 return self.app.after(0, self.handle_stream_chunk, chunk)
 
-            api_client.get_deepseek_response_stream(message_history, deepseek_chunk_callback)
+            api_client.get_deepseek_response_stream(build_request_messages(message_history), deepseek_chunk_callback, usage_callback=self.make_usage_callback("DeepSeek"))
             logging.info("[DeepSeek 线程] API 调用完成 (累积文本在主线程处理)")
 
             if self.controller.is_streaming:
@@ -548,24 +674,36 @@ class MessageHandler:
             logging.error("[DeepSeek 线程] 发送消息线程出错: %s", e)
             if self.controller.is_streaming: self.app.after(0, self.handle_stream_end, e, user_input, None, "DeepSeek")
 
-    def send_grok_message_thread(self, user_input, message_history, model):
-        processed_history = message_history
+    def send_grok_message_thread(self, user_input, message_history, model, directives=frozenset(), raw_input=""):
+        """
+        参数:
+            user_input (str): 聊天区显示的文本（可能带有附件说明），用于结束时的回调
+            raw_input (str): 用户的最终输入（已去掉指令，不含附件说明），用于拆分搜索查询
+        """
+        volatile_context = None  # 本次请求专用的联网搜索内容
         try:
             if not self.controller.is_streaming:
                 logging.info("[Grok 线程] 开始时 is_streaming 为 False，中止。")
                 return
 
             logging.info("[Grok 线程] 开始处理历史记录和可能的搜索")
+            should_search = False
+            search_query = raw_input
             if self.chat_manager.is_search_mode_enabled():
-                # ... (搜索逻辑保持不变) ...
+                # 与输入时的预测查询相同或近似时改用预测查询，结果已在缓存中
+                search_query = self.speculative_search.resolve_query(raw_input)
+                # 寒暄、追问等不需要搜索的消息在本地判断后跳过，省去 Tavily 往返；
+                # 判断的是用户自己的输入，附件说明不参与分类（只有附件时不搜索）
+                should_search, _ = decide_search(search_query, message_history, directives, web_search.is_cached)
+            if should_search:
                 search_results_text = "搜索失败或未找到结果。"
                 try:
-                    logging.info("[搜索] [Grok 线程] 正在进行网络搜索: '%s...'", user_input[:50])
+                    logging.info("[搜索] [Grok 线程] 正在进行网络搜索: '%s...'", search_query[:50])
                     if not os.getenv("TAVILY_API_KEY"):
                         logging.warning("[搜索] [Grok 线程] 警告: 未找到 TAVILY_API_KEY，跳过网络搜索")
                         search_results_text = "由于缺少 TAVILY API Key，未执行网络搜索。"
                     else:
-                        search_results = web_search.perform_search(user_input)
+                        search_results = web_search.perform_multi_search(search_query)
                         if search_results:
                             search_results_text = search_results
                             logging.info("[搜索] [Grok 线程] 成功获取搜索结果 (%d 字符)", len(search_results))
@@ -577,21 +715,7 @@ class MessageHandler:
                     search_results_text = f"尝试进行网络搜索时出错: {search_err}."
 
                 formatted_prompt = PROMPT_NETWORKING.format(search_results_placeholder=search_results_text)
-                processed_history = [msg.copy() for msg in message_history]
-                if processed_history:
-                    found_system = False
-                    for i, msg in enumerate(processed_history):
-                        if msg.get("role") == "system":
-                            logging.info("[搜索] [Grok 线程] 找到原始系统提示，内容: '%s...' 将联网提示追加到现有提示中。", msg.get('content', '')[:50])
-                            processed_history[i]["content"] = processed_history[i]["content"] + "\n\n--- 分隔线 ---\n\n" + formatted_prompt
-                            found_system = True
-                            break
-                    if not found_system:
-                        logging.info("[搜索] [Grok 线程] 原始历史无系统提示，在开头插入联网搜索提示")
-                        processed_history.insert(0, {"role": "system", "content": formatted_prompt})
-                else:
-                    logging.warning("[搜索] [Grok 线程] 警告：消息历史为空，无法替换/插入系统消息")
-                    processed_history = [{"role": "system", "content": formatted_prompt}]
+                volatile_context = formatted_prompt
                 # --- 结束搜索逻辑 ---
 
             logging.info("[Grok 线程] 准备调用 Grok API (模型: %s)", model)
@@ -602,7 +726,8 @@ class MessageHandler:
                 # 回调返回 handle_stream_chunk 的结果
                 return self.app.after(0, self.handle_stream_chunk, chunk)
 
-            grok_client.get_grok_response_stream(processed_history, grok_chunk_callback, model=model)
+            request_messages = build_request_messages(message_history, volatile_context)
+            grok_client.get_grok_response_stream(request_messages, grok_chunk_callback, model=model, usage_callback=self.make_usage_callback("Grok"))
             logging.info("[Grok 线程] API 调用完成 (累积文本在主线程处理)")
 
             if self.controller.is_streaming:
@@ -0,0 +1,248 @@
+# page_fetcher.py (v1.1 - 深度搜索：连接池并发抓取结果网页，进程池提取正文，按 URL + ETag 在磁盘（统一临时目录）缓存提取结果)
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from temp_manager import get_temp_manager
+
+DEEP_SEARCH_ENABLED = os.getenv("DEEP_SEARCH", "0") == "1"  # 是否在搜索后抓取结果网页全文
+DEEP_SEARCH_PAGES = int(os.getenv("DEEP_SEARCH_PAGES", "3"))  # 抓取排名前几的结果
+DEEP_SEARCH_TIMEOUT = float(os.getenv("DEEP_SEARCH_TIMEOUT", "4"))  # 单个请求超时，也是整个抓取阶段的截止时间（秒）
+DEEP_SEARCH_BASE_URL = os.getenv("DEEP_SEARCH_BASE_URL", "")  # 设置后把请求的协议和主机替换为该地址（离线测试用的本地替身服务器）
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "86400"))  # 缓存在该时长内直接使用，不再发请求；之后用 ETag 做条件请求
+
+MAX_PAGE_BYTES = 2 * 1024 * 1024  # 单个网页最多下载 2MB
+MAX_PAGE_CHARS = 6000  # 提取正文最多保留的字符数（之后还会按预算压缩）
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) PersonalCopilot/4.6"
+
+# --- 正文提取（在解析进程中运行，必须是模块顶层函数） ---
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe", "template", "button"}
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "table", "pre", "blockquote",
+               "h1", "h2", "h3", "h4", "h5", "h6", "dd", "dt"}
+
+class _ReadableTextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.parts = []
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self.skip_depth:
+            self.parts.append(data)
+
+def extract_readable_text(html, max_chars=MAX_PAGE_CHARS):
+    """
+    从 HTML 中提取可读正文：去掉脚本、样式、导航、页眉页脚等，保留段落结构，丢弃过短的行（菜单、按钮文字）。
+    """
+    parser = _ReadableTextParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logging.warning("[深度搜索] 解析 HTML 出错，使用已解析部分: %s", e)
+    lines = []
+    for line in "".join(parser.parts).split("\n"):
+        line = " ".join(line.split())
+        # 中文行较短也可能是正文，英文行按单词数判断
+        if len(line) >= 20 or (len(line) >= 8 and any('一' <= ch <= '鿿' for ch in line)):
+            lines.append(line)
+    return "\n".join(lines)[:max_chars]
+
+_META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+def _detect_html_encoding(body, content_type):
+    """响应头中的 charset > 页面 <meta charset> > 能否按 UTF-8 解码 > gb18030（中文网页最常见的旧编码）"""
+    match = re.search(r"charset=([\w-]+)", content_type, re.IGNORECASE)
+    if match:
+        return match.group(1)
+    match = _META_CHARSET_PATTERN.search(body[:4096])
+    if match:
+        return match.group(1).decode('ascii')
+    try:
+        body.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+# --- 抓取 ---
+class PageFetcher:
+    """
+    在有界连接池中并发抓取网页，提取后的正文按 URL 缓存在磁盘上（记录 ETag / Last-Modified）：
+    - 缓存未过期时直接返回，不发请求；
+    - 过期后带 If-None-Match / If-Modified-Since 请求，304 时沿用缓存，不重新下载和解析。
+    """
+
+    def __init__(self, cache_dir=None, pool_size=4, timeout=DEEP_SEARCH_TIMEOUT, base_url=DEEP_SEARCH_BASE_URL, extract_executor=None):
+        self.temp_manager = get_temp_manager()
+        self.cache_dir = Path(cache_dir) if cache_dir else self.temp_manager.dir_for("page_cache")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.base_url = base_url.rstrip("/") if base_url else ""
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = USER_AGENT
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="page-fetch")
+        self._extract_executor = extract_executor
+        self._cache_lock = threading.Lock()
+
+    def _request_url(self, url):
+        """设置了 base_url 时，把协议和主机替换为本地替身服务器，路径与查询保持不变"""
+        if not self.base_url:
+            return url
+        parts = urlsplit(url)
+        base = urlsplit(self.base_url)
+        return urlunsplit((base.scheme, base.netloc, base.path + parts.path, parts.query, ""))
+
+    def _cache_path(self, url):
+        return self.cache_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def _read_cache(self, url):
+        path = self._cache_path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        self.temp_manager.touch(path)
+        return entry
+
+    def _write_cache(self, url, entry):
+        path = self._cache_path(url)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with self._cache_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logging.warning("[深度搜索] 写入网页缓存出错: %s", e)
+                return
+        self.temp_manager.register(path)
+
+    def _extract(self, html):
+        if self._extract_executor is None:
+            # 默认使用文档解析的进程池，避免正文提取占用主进程的 GIL
+            from document_ingest import get_process_pool
+            self._extract_executor = get_process_pool()
+        return self._extract_executor.submit(extract_readable_text, html).result(timeout=self.timeout)
+
+    def fetch_text(self, url):
+        """
+        获取单个网页的正文（经过缓存）。
+        返回:
+            str | None: 正文，失败时返回None
+        """
+        cached = self._read_cache(url)
+        if cached and time.time() - cached["fetched_at"] < PAGE_CACHE_TTL:
+            logging.info("[深度搜索] 缓存命中: %s", url)
+            return cached["text"]
+
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            with self.session.get(self._request_url(url), headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304 and cached:
+                    logging.info("[深度搜索] 未修改 (304)，沿用缓存: %s", url)
+                    cached["fetched_at"] = time.time()
+                    self._write_cache(url, cached)
+                    return cached["text"]
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if "html" not in content_type and "text" not in content_type:
+                    logging.info("[深度搜索] 跳过非文本网页 (%s): %s", content_type, url)
+                    return None
+                blocks = []
+                size = 0
+                for block in response.iter_content(64 * 1024):
+                    blocks.append(block)
+                    size += len(block)
+                    if size >= MAX_PAGE_BYTES:
+                        break
+                body = b"".join(blocks)
+                html = body.decode(_detect_html_encoding(body, content_type), errors="replace")
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except Exception as e:
+            logging.warning("[深度搜索] 抓取失败 %s: %s", url, e)
+            return cached["text"] if cached else None
+
+        text = self._extract(html)
+        self._write_cache(url, {"url": url, "etag": etag, "last_modified": last_modified, "text": text, "fetched_at": time.time()})
+        logging.info("[深度搜索] 已抓取并提取 %s (%d 字节 -> %d 字符)", url, len(body), len(text))
+        return text
+
+    def fetch_many(self, urls, deadline=None):
+        """
+        并发获取多个网页的正文，到截止时间返回已完成的部分。
+        返回:
+            dict: url -> 正文（失败或超时的 URL 不出现）
+        """
+        futures = {self._executor.submit(self.fetch_text, url): url for url in urls}
+        done, not_done = wait(futures, timeout=deadline if deadline is not None else self.timeout * 2)
+        pages = {}
+        for future in done:
+            try:
+                text = future.result()
+            except Exception as e:
+                logging.warning("[深度搜索] 处理 %s 出错: %s", futures[future], e)
+                continue
+            if text:
+                pages[futures[future]] = text
+        logging.info("[深度搜索] %d 个网页中 %d 个在截止时间内完成", len(urls), len(pages))
+        return pages
+
+_page_fetcher = None
+_page_fetcher_lock = threading.Lock()
+
+def get_page_fetcher():
+    """获取共享的网页抓取器（延迟创建）"""
+    global _page_fetcher
+    with _page_fetcher_lock:
+        if _page_fetcher is None:
+            _page_fetcher = PageFetcher()
+        return _page_fetcher
+
+def deepen_results(results, max_pages=DEEP_SEARCH_PAGES, deadline=DEEP_SEARCH_TIMEOUT):
+    """用抓取到的网页正文替换排名前 max_pages 条结果的摘要，抓取失败的保留原摘要"""
+    urls = [r["url"] for r in results[:max_pages] if r.get("url", "").startswith(("http://", "https://"))]
+    if not urls:
+        return results
+    pages = get_page_fetcher().fetch_many(urls, deadline)
+    return [dict(r, content=pages[r["url"]]) if r.get("url") in pages else r for r in results]
@@ -0,0 +1,66 @@
+# prompt_layout.py (v1.0 - 请求消息布局：保持系统提示词与历史前缀字节稳定以命中服务端前缀缓存，并统计缓存命中 token)
+import os
+import logging
+
+from chat_history import to_api_messages
+
+# 为 True 时，搜索结果等每次请求都不同的内容放在稳定前缀之后（当前这条用户消息中），不再改写系统提示词
+PROMPT_CACHE_LAYOUT = os.getenv("PROMPT_CACHE_LAYOUT", "1") == "1"
+
+VOLATILE_SEPARATOR = "\n\n--- 分隔线 ---\n\n"
+
+def build_request_messages(history, volatile_context=None, cache_friendly=PROMPT_CACHE_LAYOUT):
+    """
+    生成发送给 API 的消息列表。
+    参数:
+        history (HistorySnapshot): 对话历史快照，最后一条为本次的用户消息
+        volatile_context (str): 本次请求专用的易变内容（如联网搜索提示词与结果），可为 None
+        cache_friendly (bool): 为 True 时把易变内容放在最后一条用户消息开头，系统提示词和之前的历史保持不变，
+                               服务端可以复用前缀缓存；为 False 时沿用旧做法，追加到系统提示词末尾
+    返回:
+        list: API 需要的字典列表
+    """
+    if not volatile_context:
+        return to_api_messages(history)
+
+    if not cache_friendly:
+        if history.system is not None:
+            return history.with_system(history.system.content + VOLATILE_SEPARATOR + volatile_context).to_api_messages()
+        return history.with_system(volatile_context).to_api_messages()
+
+    messages = to_api_messages(history)
+    if messages and messages[-1]["role"] == "user":
+        messages[-1] = {"role": "user", "content": volatile_context + VOLATILE_SEPARATOR + messages[-1]["content"]}
+    else:
+        messages.append({"role": "user", "content": volatile_context})
+    return messages
+
+def summarize_usage(usage):
+    """
+    从流式响应最后一个数据块的 usage 中提取 token 统计，兼容两种返回格式：
+    - DeepSeek: prompt_cache_hit_tokens / prompt_cache_miss_tokens
+    - OpenAI 兼容（Grok 等）: prompt_tokens_details.cached_tokens
+    返回:
+        dict: prompt_tokens、completion_tokens、cached_tokens、cache_hit_ratio；usage 为空时返回 None
+    """
+    if usage is None:
+        return None
+    data = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    prompt_tokens = data.get("prompt_tokens") or 0
+    cached_tokens = data.get("prompt_cache_hit_tokens")
+    if cached_tokens is None:
+        cached_tokens = (data.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": data.get("completion_tokens") or 0,
+        "cached_tokens": cached_tokens,
+        "cache_hit_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
+
+def log_usage(backend_name, summary):
+    """记录单次请求的 token 用量与前缀缓存命中情况"""
+    if not summary:
+        logging.info("[缓存统计] %s 未返回 usage 数据", backend_name)
+        return
+    logging.info("[缓存统计] %s 输入 %d tokens，其中缓存命中 %d (%.0f%%)，输出 %d tokens",
+                 backend_name, summary["prompt_tokens"], summary["cached_tokens"], summary["cache_hit_ratio"] * 100, summary["completion_tokens"])
@@ -0,0 +1,186 @@
+# search_cache.py (v1.1 - 联网搜索结果缓存：查询归一化为键，内存 LRU + 磁盘（统一临时目录），TTL 过期后先返回旧结果并在后台刷新)
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from collections import OrderedDict
+
+from temp_manager import get_temp_manager
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))  # 结果新鲜期（秒）
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", "86400"))  # 过期后仍可先返回旧结果的时长（秒）
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "256"))  # 内存中最多保留的条目数
+
+def normalize_query(query):
+    """
+    查询归一化：全角/半角统一（NFKC）、大小写折叠、空白折叠，并去掉首尾空白和句末标点。
+    "  Python  最新版本？" 与 "python 最新版本?" 得到相同的键。
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = " ".join(text.split())
+    return text.rstrip("?!.。？！…~ ")
+
+class SearchCache:
+    """
+    搜索结果缓存，值为结果列表（[{"title", "content", "url"}]）。
+    - 键为 (归一化查询, max_results) 的哈希；
+    - 内存 LRU 之外，每个条目保存为磁盘上的一个 JSON 文件，重启后仍然有效；
+    - 在新鲜期内直接命中；过期但仍在 stale 窗口内时先返回旧结果，同时在后台线程刷新；
+    - 统计命中率和节省的 Tavily 点数。
+    """
+
+    def __init__(self, cache_dir=None, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.temp_manager = get_temp_manager()
+        self.cache_dir = Path(cache_dir) if cache_dir else self.temp_manager.dir_for("search_cache")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # 键 -> 条目
+        self._lock = threading.Lock()
+        self._refreshing = set()  # 正在后台刷新的键
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "credits_saved": 0}
+
+    @staticmethod
+    def make_key(query, max_results):
+        return hashlib.sha1(f"{normalize_query(query)}\x00{max_results}".encode('utf-8')).hexdigest()
+
+    def _path_for(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    # --- 读写 ---
+    def _load(self, key):
+        """先查内存，再查磁盘（命中磁盘时放回内存）"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        try:
+            with open(self._path_for(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("[搜索缓存] 读取缓存文件出错，忽略: %s", e)
+            return None
+        self._remember(key, entry)
+        self.temp_manager.touch(self._path_for(key))
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, query, max_results, results, cost=1):
+        """写入一条结果（内存 + 磁盘）"""
+        key = self.make_key(query, max_results)
+        entry = {"query": normalize_query(query), "max_results": max_results, "results": results, "cost": cost, "fetched_at": time.time()}
+        self._remember(key, entry)
+        tmp_path = self._path_for(key).with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path_for(key))
+            self.temp_manager.register(self._path_for(key))
+        except Exception as e:
+            logging.warning("[搜索缓存] 写入缓存文件出错: %s", e)
+        return entry
+
+    def peek(self, query, max_results):
+        """
+        只读查询，不计入统计、不触发刷新。
+        返回:
+            tuple: (results, age_seconds)，不存在或已超出 stale 窗口时为 (None, None)
+        """
+        entry = self._load(self.make_key(query, max_results))
+        if entry is None:
+            return None, None
+        age = time.time() - entry["fetched_at"]
+        if age > self.ttl + self.stale_ttl:
+            return None, None
+        return entry["results"], age
+
+    # --- 带回源的读取 ---
+    def get_or_fetch(self, query, max_results, fetch, cost=1):
+        """
+        读取缓存，必要时调用 fetch(query, max_results) 回源。
+        参数:
+            fetch (function): 返回结果列表（失败时返回 None，不写入缓存）
+            cost (int): 一次回源消耗的 Tavily 点数，用于统计节省量
+        返回:
+            list | None: 结果列表
+        """
+        key = self.make_key(query, max_results)
+        entry = self._load(key)
+        age = time.time() - entry["fetched_at"] if entry else None
+
+        if entry is not None and age <= self.ttl:
+            self._count("hits", entry.get("cost", cost))
+            logging.info("[搜索缓存] 命中 '%s' (%.0f 秒前)", query[:30], age)
+            return entry["results"]
+
+        if entry is not None and age <= self.ttl + self.stale_ttl:
+            # 后台刷新照样消耗点数，过期命中只节省等待时间，不计入节省的点数
+            self._count("stale_hits", 0)
+            logging.info("[搜索缓存] 返回过期结果 '%s' (%.0f 秒前)，后台刷新", query[:30], age)
+            self._refresh_in_background(key, query, max_results, fetch, cost)
+            return entry["results"]
+
+        self._count("misses", 0)
+        results = fetch(query, max_results)
+        if results is not None:
+            self.put(query, max_results, results, cost)
+        return results
+
+    def _refresh_in_background(self, key, query, max_results, fetch, cost):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def worker():
+            try:
+                results = fetch(query, max_results)
+                if results is not None:
+                    self.put(query, max_results, results, cost)
+                    logging.info("[搜索缓存] 后台刷新完成 '%s'", query[:30])
+            except Exception as e:
+                logging.warning("[搜索缓存] 后台刷新 '%s' 出错: %s", query[:30], e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=worker, name="search-cache-refresh", daemon=True).start()
+
+    # --- 统计 ---
+    def _count(self, kind, credits_saved):
+        with self._lock:
+            self.stats[kind] += 1
+            self.stats["credits_saved"] += credits_saved
+        total = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        logging.info("[搜索缓存] 命中率 %.0f%% (%d/%d)，累计节省 Tavily 点数 %d",
+                     self.hit_ratio() * 100, total - self.stats["misses"], total, self.stats["credits_saved"])
+
+    def hit_ratio(self):
+        total = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["stale_hits"]) / total if total else 0.0
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache():
+    """获取共享的搜索缓存实例（延迟创建）"""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache()
+            logging.info("[搜索缓存] 初始化完成，目录: %s，TTL: %d 秒，过期可用: %d 秒", _search_cache.cache_dir, _search_cache.ttl, _search_cache.stale_ttl)
+        return _search_cache
@@ -0,0 +1,99 @@
+# search_compactor.py (v1.0 - 搜索结果压缩：MinHash 去除跨结果的近似重复段落，按查询相关度挑选句子，控制在 token 预算内并保留来源链接)
+import os
+import re
+import zlib
+import random
+import logging
+
+from text_index import BM25Index, tokenize
+from utils import estimate_tokens
+
+SEARCH_TOKEN_BUDGET = int(os.getenv("SEARCH_TOKEN_BUDGET", "1500"))  # 搜索结果正文的 token 预算
+
+SHINGLE_SIZE = 5  # 字符级 shingle 长度（对中文和英文都适用）
+MINHASH_PERMUTATIONS = 64
+NEAR_DUPLICATE_THRESHOLD = 0.7  # 估计的 Jaccard 相似度超过该值视为近似重复
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250412)  # 固定种子，保证多次运行的签名一致
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+# 句子切分：中文句末标点之后，或英文句末标点后跟空白
+_SENTENCE_PATTERN = re.compile(r"(?<=[。！？；!?;])|(?<=[.])\s+|\n+")
+
+def split_sentences(text):
+    """把段落切分为句子，去掉空白句"""
+    return [s.strip() for s in _SENTENCE_PATTERN.split(text) if s and s.strip()]
+
+def _shingles(text):
+    normalized = "".join(text.lower().split())
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def minhash_signature(text):
+    """计算文本的 MinHash 签名（字符 shingle 的 crc32 经 MINHASH_PERMUTATIONS 个线性哈希后的最小值）"""
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in _shingles(text)]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _HASH_PARAMS)
+
+def estimated_similarity(sig_a, sig_b):
+    """两个签名相同位置相等的比例即 Jaccard 相似度的估计"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / MINHASH_PERMUTATIONS
+
+def compact_results(results, query, token_budget=SEARCH_TOKEN_BUDGET):
+    """
+    压缩搜索结果。
+    1. 切分为句子，用 MinHash 去掉与之前结果（或同一结果中）近似重复的句子；
+    2. 用 BM25 对剩余句子按与查询的相关度打分，在 token 预算内从高到低挑选；
+    3. 每条结果保留标题和来源链接，被选中的句子按原文顺序输出。
+    参数:
+        results (list): [{"title", "content", "url"}]
+        query (str): 用户问题
+        token_budget (int): 正文句子的 token 预算（标题与链接不计入）
+    返回:
+        str: 与 web_search.format_results 相同格式的文本
+    """
+    sentences = []  # (结果序号, 句子序号, 文本)
+    kept_signatures = []
+    dropped = 0
+    for result_index, result in enumerate(results):
+        for sentence_index, sentence in enumerate(split_sentences(result.get("content") or "")):
+            signature = minhash_signature(sentence)
+            if signature is None:
+                continue
+            if any(estimated_similarity(signature, kept) >= NEAR_DUPLICATE_THRESHOLD for kept in kept_signatures):
+                dropped += 1
+                continue
+            kept_signatures.append(signature)
+            sentences.append((result_index, sentence_index, sentence))
+
+    index = BM25Index()
+    for _, _, sentence in sentences:
+        index.add(sentence)
+    scores = index.scores(query) if tokenize(query) else {}
+    # 相关度相同（包括都未命中）时，优先靠前结果中靠前的句子
+    order = sorted(range(len(sentences)), key=lambda i: (-scores.get(i, 0.0), sentences[i][0], sentences[i][1]))
+
+    selected = set()
+    used_tokens = 0
+    for i in order:
+        sentence_tokens = estimate_tokens(sentences[i][2])
+        if used_tokens + sentence_tokens > token_budget:
+            continue
+        selected.add(i)
+        used_tokens += sentence_tokens
+
+    per_result = {}
+    for i in sorted(selected, key=lambda i: (sentences[i][0], sentences[i][1])):
+        per_result.setdefault(sentences[i][0], []).append(sentences[i][2])
+
+    formatted = []
+    for result_index, result in enumerate(results):
+        body = " ".join(per_result.get(result_index, [])) or "（内容与其他结果重复或与问题无关，已省略）"
+        formatted.append(f"[{result_index + 1}] {result.get('title', 'N/A')}\n   {body}\n   (Source: {result.get('url', 'N/A')})")
+
+    original_tokens = sum(estimate_tokens(result.get("content") or "") for result in results)
+    logging.info("[搜索压缩] %d 条结果，正文约 %d -> %d tokens，去除近似重复句 %d 句", len(results), original_tokens, used_tokens, dropped)
+    return "\n\n".join(formatted)
@@ -0,0 +1,89 @@
+# search_gate.py (v1.0 - 搜索前的本地判断：规则 + 小型词法分类器决定本条消息是否需要联网搜索，支持单条消息指令覆盖)
+import os
+import re
+import math
+import logging
+
+SEARCH_GATE_ENABLED = os.getenv("SEARCH_GATE", "1") == "1"  # 为 False 时搜索模式下每条消息都搜索（旧行为）
+SEARCH_GATE_THRESHOLD = float(os.getenv("SEARCH_GATE_THRESHOLD", "0.5"))  # 分类器概率不低于该值时搜索
+
+# --- 规则 ---
+# 问候、致谢、确认等寒暄（整条消息只有这些内容）
+_SMALL_TALK_PATTERN = re.compile(
+    r"^(你好|您好|嗨|哈喽|早上好|晚上好|晚安|谢谢|多谢|感谢|谢了|好的|好|嗯|嗯嗯|ok|okay|收到|明白|知道了|懂了|不错|很好|太棒了|厉害|"
+    r"hi|hello|hey|thanks|thank you|thx|got it|cool|nice|great|bye|再见|拜拜)[\s,，.。!！~～]*(啊|呀|哈|啦|了)?[\s,，.。!！~～]*$",
+    re.IGNORECASE)
+# 指代前文的追问（配合较短的长度判断）
+_FOLLOW_UP_PATTERN = re.compile(
+    r"^(继续|接着|然后呢|还有呢|为什么|为啥|什么意思|展开|详细|具体|再|换|那|所以|上面|刚才|这个|那个|它|他|她|第[一二三四五六七八九十\d]+)"
+    r"|(上面|刚才|前面|你说的|这段|这个|那个|上述|以上)"
+    r"|^(continue|go on|why|explain|elaborate|more|and then|what about|how about)\b",
+    re.IGNORECASE)
+FOLLOW_UP_MAX_LENGTH = 30  # 超过该长度的消息即使带指代词也按独立问题处理
+FOLLOW_UP_SEARCH_PROBABILITY = 0.8  # 追问中带有强烈的实时信息线索（如"那最新版本呢？"）时仍然搜索
+
+# --- 词法分类器 ---
+# 手工设定权重的逻辑回归：正权重偏向需要实时/外部信息，负权重偏向可以直接生成或改写。
+# 偏置为正：用户已开启搜索模式，没有明确线索的消息仍然搜索
+_CLASSIFIER_BIAS = 0.2
+_CLASSIFIER_FEATURES = [
+    (re.compile(r"最新|最近|今天|今年|昨天|本周|这周|现在|目前|当前|实时|刚刚"), 1.6),
+    (re.compile(r"\b(latest|recent|today|current|now|this (week|year)|news)\b", re.IGNORECASE), 1.6),
+    (re.compile(r"新闻|消息|发布|公告|股价|价格|汇率|天气|比分|赛程|票房|排名|榜单|政策|版本|更新"), 1.3),
+    (re.compile(r"\b(price|stock|weather|score|release|version|update|announce\w*)\b", re.IGNORECASE), 1.3),
+    (re.compile(r"(19|20)\d{2}\s*年?"), 0.9),
+    (re.compile(r"谁是|是谁|哪里|哪个公司|官网|链接|网址|地址|多少钱|什么时候"), 0.9),
+    (re.compile(r"\b(who is|where is|when (is|was|did)|official site|link|url)\b", re.IGNORECASE), 0.9),
+    (re.compile(r"搜索|搜一下|查一下|查查|查询|上网|联网|google|谷歌|百度", re.IGNORECASE), 2.5),
+    (re.compile(r"翻译|润色|改写|总结|概括|摘要|续写|扩写|仿写|写一|帮我写|作文|诗|故事|小说"), -1.5),
+    (re.compile(r"\b(translate|rewrite|summari[sz]e|paraphrase|write a|poem|story)\b", re.IGNORECASE), -1.5),
+    (re.compile(r"代码|函数|报错|bug|调试|重构|正则|算法|复杂度|```", re.IGNORECASE), -1.1),
+    (re.compile(r"证明|计算|求解|推导|等于多少|解方程"), -1.0),
+    (re.compile(r"附件|这份文档|这篇文章|这段代码|上传"), -1.4),
+]
+
+def search_probability(text):
+    """词法分类器：返回本条消息需要联网搜索的概率"""
+    score = _CLASSIFIER_BIAS + sum(weight for pattern, weight in _CLASSIFIER_FEATURES if pattern.search(text))
+    if "?" in text or "？" in text:
+        score += 0.3
+    return 1.0 / (1.0 + math.exp(-score))
+
+def _has_previous_turn(history):
+    """快照中除本次用户消息外是否还有助手回复（追问需要有可指代的前文）"""
+    if history is None:
+        return False
+    return any(msg["role"] == "assistant" for msg in history)
+
+def decide_search(text, history=None, directives=frozenset(), is_cached=None):
+    """
+    判断本条消息是否需要联网搜索。
+    参数:
+        text (str): 用户输入（已去掉指令）
+        history (HistorySnapshot): 对话历史快照，用于判断是否为追问
+        directives (frozenset): 单条消息指令，"search" / "nosearch" 直接决定结果
+        is_cached (function): is_cached(text) -> bool，结果已在搜索缓存中时返回 True
+    返回:
+        tuple: (是否搜索, 原因)。命中缓存时返回 (True, "cached")，此时搜索只读缓存，不产生网络请求
+    """
+    stripped = (text or "").strip()
+    if "nosearch" in directives:
+        decision = (False, "directive")
+    elif "search" in directives:
+        decision = (True, "directive")
+    elif not SEARCH_GATE_ENABLED:
+        decision = (True, "gate_disabled")
+    elif not stripped:
+        decision = (False, "empty")
+    elif _SMALL_TALK_PATTERN.match(stripped):
+        decision = (False, "small_talk")
+    elif is_cached is not None and is_cached(stripped):
+        decision = (True, "cached")
+    elif len(stripped) <= FOLLOW_UP_MAX_LENGTH and _FOLLOW_UP_PATTERN.search(stripped) and _has_previous_turn(history) \
+            and search_probability(stripped) < FOLLOW_UP_SEARCH_PROBABILITY:
+        decision = (False, "follow_up")
+    else:
+        probability = search_probability(stripped)
+        decision = (probability >= SEARCH_GATE_THRESHOLD, f"classifier p={probability:.2f}")
+    logging.info("[搜索判断] %s (%s): '%s'", "搜索" if decision[0] else "跳过", decision[1], stripped[:40])
+    return decision
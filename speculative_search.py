@@ -0,0 +1,151 @@
+# speculative_search.py (v1.1 - 预测性搜索：输入停顿后在后台提前搜索草稿，结果写入搜索缓存，发送时近似匹配直接复用；每小时上限按 Tavily 点数计算，搜索判断移到工作线程)
+import os
+import time
+import difflib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import web_search
+from search_cache import normalize_query
+from search_gate import decide_search
+from utils import parse_message_directives
+
+SPECULATIVE_SEARCH_ENABLED = os.getenv("SPECULATIVE_SEARCH", "1") == "1"
+SPECULATIVE_DEBOUNCE_MS = int(os.getenv("SPECULATIVE_DEBOUNCE_MS", "900"))  # 停止输入多久后认为草稿已稳定（毫秒）
+SPECULATIVE_MAX_PER_MESSAGE = int(os.getenv("SPECULATIVE_MAX_PER_MESSAGE", "2"))  # 每条消息最多预测搜索次数
+SPECULATIVE_MAX_PER_HOUR = int(os.getenv("SPECULATIVE_MAX_PER_HOUR", "20"))  # 预测搜索每小时最多消耗的 Tavily 点数（每个子查询按搜索深度计点）
+SPECULATIVE_MIN_LENGTH = 6  # 草稿过短时不搜索
+SPECULATIVE_MATCH_RATIO = 0.85  # 发送内容与预测查询的相似度不低于该值时复用预测结果
+SPECULATIVE_DEADLINE = 10.0  # 预测搜索不阻塞任何人，可以等得更久
+SPECULATIVE_WAIT_SECONDS = web_search.SEARCH_DEADLINE  # 发送时预测搜索仍在进行，最多等待的时间
+MAX_REMEMBERED_QUERIES = 4
+
+class SpeculativeSearch:
+    """
+    在输入框的按键事件上做防抖：草稿稳定 SPECULATIVE_DEBOUNCE_MS 毫秒后交给后台线程，
+    由后台线程判断是否需要搜索、检查缓存（读磁盘）与每小时点数上限，再执行多查询搜索（结果经 get_or_fetch 写入搜索缓存）。
+    发送时 resolve_query 把最终输入映射到相同或近似的预测查询，搜索直接命中缓存。
+    """
+
+    def __init__(self, app, input_entry, is_active):
+        """
+        参数:
+            app: 主应用程序实例（用于 after 调度）
+            input_entry: 输入框控件
+            is_active (function): 返回当前是否适合预测搜索（搜索模式已开启、后端支持搜索、没有在生成回复）
+        """
+        self.app = app
+        self.input_entry = input_entry
+        self.is_active = is_active
+        self._after_id = None
+        self._last_draft = None
+        self._count_this_message = 0  # 本条消息已占用的预测搜索名额（在 Tk 主线程提交前占用，未搜索时归还）
+        self._message_generation = 0  # 每发送一条消息加一，旧消息的草稿不再归还名额
+        self._recent_calls = deque()  # 最近一小时内预测搜索的 (时间戳, 消耗点数)
+        self._queries = deque(maxlen=MAX_REMEMBERED_QUERIES)  # (归一化查询, 原查询, future)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-search")
+        self.stats = {"speculated": 0, "reused": 0}
+        if SPECULATIVE_SEARCH_ENABLED and input_entry is not None:
+            # ui_builder 已为调整高度绑定了 KeyRelease，这里追加绑定而不是覆盖
+            input_entry.bind("<KeyRelease>", self._on_key_release, add="+")
+
+    # --- Tk 主线程 ---
+    def _on_key_release(self, event=None):
+        if self._after_id is not None:
+            self.app.after_cancel(self._after_id)
+        self._after_id = self.app.after(SPECULATIVE_DEBOUNCE_MS, self._on_draft_settled)
+
+    def _on_draft_settled(self):
+        self._after_id = None
+        if not self.is_active():
+            return
+        draft, directives = parse_message_directives(self.input_entry.get("1.0", "end-1c").strip())
+        if len(draft) < SPECULATIVE_MIN_LENGTH or draft == self._last_draft or "nosearch" in directives:
+            return
+        self._last_draft = draft
+        # 提交前占用名额：工作线程中排队的草稿也计入，不会超出每条消息的上限
+        with self._lock:
+            if self._count_this_message >= SPECULATIVE_MAX_PER_MESSAGE:
+                return
+            self._count_this_message += 1
+            generation = self._message_generation
+        # 搜索判断会读取磁盘上的搜索缓存，交给工作线程完成；future 的结果表示该草稿的结果是否已在缓存中
+        future = self._executor.submit(self._speculate, draft, directives, generation)
+        with self._lock:
+            self._queries.append((normalize_query(draft), draft, future))
+
+    def on_message_sent(self):
+        """发送消息后调用：取消尚未触发的防抖，重置本条消息的计数"""
+        if self._after_id is not None:
+            self.app.after_cancel(self._after_id)
+            self._after_id = None
+        with self._lock:
+            self._count_this_message = 0
+            self._message_generation += 1
+        self._last_draft = None
+
+    # --- 工作线程 ---
+    def _release_slot(self, generation):
+        """草稿没有产生搜索时归还占用的名额（已发送下一条消息时名额已重置，不再归还）"""
+        with self._lock:
+            if generation == self._message_generation and self._count_this_message > 0:
+                self._count_this_message -= 1
+
+    def _speculate(self, draft, directives, generation):
+        """判断草稿是否需要搜索，未超出每小时点数上限时执行搜索。返回草稿的结果是否已在（或已写入）搜索缓存"""
+        # 判断和缓存检查在 decide_search 中完成；已缓存的草稿无需再搜索
+        should_search, reason = decide_search(draft, None, directives, web_search.is_cached)
+        if reason == "cached":
+            self._release_slot(generation)
+            return True
+        if not should_search:
+            self._release_slot(generation)
+            return False
+        # 每个子查询消耗一次 Tavily 搜索的点数
+        credits = len(web_search.split_queries(draft)) * web_search.SEARCH_CREDITS[web_search.SEARCH_DEPTH]
+        now = time.time()
+        with self._lock:
+            while self._recent_calls and now - self._recent_calls[0][0] > 3600:
+                self._recent_calls.popleft()
+            spent = sum(cost for _, cost in self._recent_calls)
+            if spent + credits > SPECULATIVE_MAX_PER_HOUR:
+                logging.info("[预测搜索] 本小时已消耗 %d 点，再搜索 %d 点将超过上限 %d，跳过", spent, credits, SPECULATIVE_MAX_PER_HOUR)
+                if generation == self._message_generation and self._count_this_message > 0:
+                    self._count_this_message -= 1  # 已持有锁，直接归还名额
+                return False
+            self._recent_calls.append((now, credits))
+            self.stats["speculated"] += 1
+        logging.info("[预测搜索] 草稿已稳定，后台搜索 (%d 点): '%s'", credits, draft[:40])
+        return web_search.search_multi(draft, 3, SPECULATIVE_DEADLINE) is not None
+
+    def resolve_query(self, text):
+        """
+        为最终输入选择搜索查询：与某个预测查询相同或足够相似时返回该预测查询（等待仍在进行的预测搜索完成），
+        否则返回原文本。
+        """
+        normalized = normalize_query(text)
+        with self._lock:
+            candidates = list(self._queries)
+        best = None
+        best_ratio = 0.0
+        for query_key, query, future in candidates:
+            ratio = 1.0 if query_key == normalized else difflib.SequenceMatcher(None, query_key, normalized).ratio()
+            if ratio >= SPECULATIVE_MATCH_RATIO and ratio > best_ratio:
+                best, best_ratio = (query, future), ratio
+        if best is None:
+            return text
+        query, future = best
+        try:
+            # 预测搜索仍在进行时等待它完成，避免重复请求同一查询
+            if not future.result(timeout=SPECULATIVE_WAIT_SECONDS):
+                return text  # 草稿判断为不需要搜索、超出上限或搜索失败，结果不在缓存中
+        except Exception as e:
+            logging.info("[预测搜索] 预测查询未在等待时间内完成，使用原输入搜索: %s", e)
+            return text
+        self.stats["reused"] += 1
+        logging.info("[预测搜索] 复用预测结果 (相似度 %.2f): '%s' -> '%s'，累计 %d/%d",
+                     best_ratio, text[:30], query[:30], self.stats["reused"], self.stats["speculated"])
+        return query
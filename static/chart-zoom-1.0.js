@@ -0,0 +1,91 @@
+/* chart-zoom-1.0.js - 降采样图表的缩放：在图上拖动选择横轴范围，向 Artifacts 服务器请求该范围重新取样的数据；范围足够小时即为完整分辨率 */
+(function () {
+    'use strict';
+
+    var MIN_DRAG_PIXELS = 5;
+
+    function mount(chart, zoom, status) {
+        var canvas = chart.canvas;
+        var indices = zoom.indices;  // 折线图：当前显示的每个点在完整数据中的下标
+        var history = [];
+        var dragStart = null;
+
+        var band = document.createElement('div');
+        band.style.cssText = 'position:absolute;display:none;background:rgba(54,162,235,0.15);border:1px solid rgba(54,162,235,0.6);pointer-events:none;';
+        document.body.appendChild(band);
+
+        function describe(view) {
+            var text = '显示 ' + view.shown + ' / ' + view.in_range + ' 个点';
+            text += view.shown >= view.in_range ? '（完整分辨率）' : '（已降采样，拖动选择范围放大，双击返回上一级）';
+            status.textContent = text;
+        }
+
+        function apply(view) {
+            if (zoom.axis === 'index') {
+                chart.data.labels = view.labels;
+                indices = view.indices;
+            }
+            chart.data.datasets.forEach(function (dataset, i) { dataset.data = view.datasets[i] || []; });
+            chart.update('none');
+            describe(view);
+        }
+
+        function load(params) {
+            if (!zoom.url) {
+                status.textContent = '离线页面不支持按范围重新取样';
+                return;
+            }
+            status.textContent = '加载中…';
+            fetch(zoom.url + '?' + new URLSearchParams(params).toString())
+                .then(function (response) { return response.json(); })
+                .then(apply)
+                .catch(function (error) { status.textContent = '加载数据失败: ' + error.message; });
+        }
+
+        function rangeFor(left, right) {
+            var scale = chart.scales.x;
+            var low = scale.getValueForPixel(left), high = scale.getValueForPixel(right);
+            if (zoom.axis === 'index') {
+                var last = indices.length - 1;
+                var first = indices[Math.max(0, Math.min(last, Math.floor(low)))];
+                var end = indices[Math.max(0, Math.min(last, Math.ceil(high)))];
+                return { start: first, end: end + 1 };
+            }
+            return { x0: low, x1: high };
+        }
+
+        canvas.addEventListener('mousedown', function (event) {
+            dragStart = event.offsetX;
+        });
+        canvas.addEventListener('mousemove', function (event) {
+            if (dragStart === null) return;
+            var rect = canvas.getBoundingClientRect();
+            band.style.display = 'block';
+            band.style.left = (window.scrollX + rect.left + Math.min(dragStart, event.offsetX)) + 'px';
+            band.style.top = (window.scrollY + rect.top) + 'px';
+            band.style.width = Math.abs(event.offsetX - dragStart) + 'px';
+            band.style.height = rect.height + 'px';
+        });
+        window.addEventListener('mouseup', function (event) {
+            if (dragStart === null) return;
+            var rect = canvas.getBoundingClientRect();
+            var end = Math.max(0, Math.min(rect.width, event.clientX - rect.left));
+            var left = Math.min(dragStart, end), right = Math.max(dragStart, end);
+            dragStart = null;
+            band.style.display = 'none';
+            if (right - left < MIN_DRAG_PIXELS) return;
+            var range = rangeFor(left, right);
+            history.push(range);
+            load(range);
+        });
+        canvas.addEventListener('dblclick', function () {
+            if (!history.length) return;
+            history.pop();
+            load(history.length ? history[history.length - 1] : {});
+        });
+
+        describe(zoom);
+    }
+
+    window.ChartZoom = { mount: mount };
+})();
@@ -0,0 +1,162 @@
+/* virtual-table-1.0.js - 大表格的虚拟滚动：数据按列保存（columnar JSON），只为可见行创建 DOM，排序与筛选在列数据上进行 */
+(function () {
+    'use strict';
+
+    var ROW_HEIGHT = 28;  // 与 artifact.css 中 .vt-row 的高度一致
+    var OVERSCAN = 10;    // 可见区域上下额外渲染的行数
+    var FILTER_DEBOUNCE_MS = 150;
+
+    function isNumericColumn(column) {
+        for (var i = 0; i < column.length; i++) {
+            if (column[i] !== null && typeof column[i] !== 'number') return false;
+        }
+        return true;
+    }
+
+    function cellText(value) {
+        return value === null || value === undefined ? '' : String(value);
+    }
+
+    function mount(root, payload) {
+        var headers = payload.headers;
+        var columns = payload.columns;
+        var rowCount = payload.row_count;
+        var numeric = columns.map(isNumericColumn);
+        var lowered = [];  // 筛选用的小写文本列，首次筛选时生成
+        var collator = new Intl.Collator(undefined, { numeric: true, sensitivity: 'base' });
+        var sortColumn = -1, sortDescending = false, filterText = '';
+        var view = new Uint32Array(0);
+        var template = 'repeat(' + headers.length + ', minmax(120px, 1fr))';
+
+        var toolbar = document.createElement('div');
+        toolbar.className = 'vt-toolbar';
+        var filterInput = document.createElement('input');
+        filterInput.placeholder = '筛选（在所有列中查找）';
+        var status = document.createElement('span');
+        status.className = 'vt-status';
+        toolbar.appendChild(filterInput);
+        toolbar.appendChild(status);
+
+        var viewport = document.createElement('div');
+        viewport.className = 'vt-viewport';
+        var header = document.createElement('div');
+        header.className = 'vt-row vt-header';
+        header.style.gridTemplateColumns = template;
+        var spacer = document.createElement('div');
+        spacer.className = 'vt-spacer';
+        var body = document.createElement('div');
+        body.className = 'vt-body';
+        spacer.appendChild(body);
+        viewport.appendChild(header);
+        viewport.appendChild(spacer);
+        root.appendChild(toolbar);
+        root.appendChild(viewport);
+
+        function renderHeader() {
+            header.textContent = '';
+            headers.forEach(function (name, index) {
+                var cell = document.createElement('div');
+                var marker = index === sortColumn ? (sortDescending ? ' ▼' : ' ▲') : '';
+                cell.textContent = cellText(name) + marker;
+                cell.title = '点击排序';
+                cell.onclick = function () {
+                    if (sortColumn === index) {
+                        sortDescending = !sortDescending;
+                    } else {
+                        sortColumn = index;
+                        sortDescending = false;
+                    }
+                    applyView();
+                };
+                header.appendChild(cell);
+            });
+        }
+
+        function compareBy(column, isNumeric) {
+            // 空值始终排在最后
+            return function (a, b) {
+                var x = column[a], y = column[b];
+                if (x === null || x === undefined) return (y === null || y === undefined) ? 0 : 1;
+                if (y === null || y === undefined) return -1;
+                var result = isNumeric ? x - y : collator.compare(String(x), String(y));
+                return sortDescending ? -result : result;
+            };
+        }
+
+        function applyView() {
+            var indices;
+            if (filterText) {
+                for (var c = 0; c < columns.length; c++) {
+                    if (!lowered[c]) lowered[c] = columns[c].map(function (v) { return cellText(v).toLowerCase(); });
+                }
+                indices = [];
+                for (var row = 0; row < rowCount; row++) {
+                    for (var col = 0; col < columns.length; col++) {
+                        if (lowered[col][row].indexOf(filterText) !== -1) {
+                            indices.push(row);
+                            break;
+                        }
+                    }
+                }
+                view = Uint32Array.from(indices);
+            } else {
+                view = new Uint32Array(rowCount);
+                for (var i = 0; i < rowCount; i++) view[i] = i;
+            }
+            if (sortColumn >= 0) {
+                view.sort(compareBy(columns[sortColumn], numeric[sortColumn]));
+            }
+            spacer.style.height = (view.length * ROW_HEIGHT) + 'px';
+            status.textContent = filterText ? ('匹配 ' + view.length + ' / ' + rowCount + ' 行') : ('共 ' + rowCount + ' 行');
+            renderHeader();
+            renderRows();
+        }
+
+        function renderRows() {
+            var top = Math.max(0, viewport.scrollTop - header.offsetHeight);
+            var start = Math.max(0, Math.floor(top / ROW_HEIGHT) - OVERSCAN);
+            var end = Math.min(view.length, Math.ceil((top + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            var fragment = document.createDocumentFragment();
+            for (var position = start; position < end; position++) {
+                var rowIndex = view[position];
+                var line = document.createElement('div');
+                line.className = position % 2 ? 'vt-row even' : 'vt-row';
+                line.style.gridTemplateColumns = template;
+                for (var col = 0; col < columns.length; col++) {
+                    var cell = document.createElement('div');
+                    cell.textContent = cellText(columns[col][rowIndex]);
+                    line.appendChild(cell);
+                }
+                fragment.appendChild(line);
+            }
+            body.style.transform = 'translateY(' + (start * ROW_HEIGHT) + 'px)';
+            body.textContent = '';
+            body.appendChild(fragment);
+        }
+
+        var frameRequested = false;
+        viewport.addEventListener('scroll', function () {
+            if (frameRequested) return;
+            frameRequested = true;
+            window.requestAnimationFrame(function () {
+                frameRequested = false;
+                renderRows();
+            });
+        });
+        window.addEventListener('resize', renderRows);
+
+        var filterTimer = null;
+        filterInput.addEventListener('input', function () {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(function () {
+                filterText = filterInput.value.trim().toLowerCase();
+                viewport.scrollTop = 0;
+                applyView();
+            }, FILTER_DEBOUNCE_MS);
+        });
+
+        applyView();
+    }
+
+    window.VirtualTable = { mount: mount };
+})();
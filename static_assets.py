@@ -0,0 +1,47 @@
+# static_assets.py (v1.2 - Artifacts 页面使用的静态资源：随程序打包的 Chart.js、共用样式、虚拟滚动表格与图表缩放脚本，文件名带版本号，离线可用)
+import sys
+import logging
+from pathlib import Path
+
+# 逻辑名称 -> (static 目录下带版本号的文件名, 版本, 本地文件缺失时使用的 CDN 地址)
+STATIC_ASSETS = {
+    "chart.js": ("chart-4.4.0.umd.min.js", "4.4.0", "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"),
+    "artifact.css": ("artifact-1.1.css", "1.1", None),
+    "virtual-table.js": ("virtual-table-1.0.js", "1.0", None),
+    "chart-zoom.js": ("chart-zoom-1.0.js", "1.0", None),
+}
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"  # 文件名带版本号，内容不会变化
+
+def get_static_dir():
+    """static 目录：打包后位于 PyInstaller 解压目录（sys._MEIPASS），开发模式下位于源码目录"""
+    base_path = Path(getattr(sys, '_MEIPASS', Path(__file__).resolve().parent))
+    return base_path / "static"
+
+def asset_path(name):
+    """资源的本地路径，文件不存在时返回 None"""
+    filename = STATIC_ASSETS[name][0]
+    path = get_static_dir() / filename
+    return path if path.is_file() else None
+
+def asset_url(name, server=None):
+    """
+    页面中引用资源使用的 URL。
+    - 传入 Artifacts 服务器时由服务器的 /static/ 提供（长期缓存）；
+    - 否则使用本地文件的 file:// 地址（临时文件页面）；
+    - 本地文件缺失时退回 CDN（没有 CDN 的资源返回 None）。
+    """
+    filename, _, cdn_url = STATIC_ASSETS[name]
+    path = asset_path(name)
+    if path is None:
+        logging.warning("[静态资源] 未找到本地文件 %s，使用 CDN: %s", filename, cdn_url)
+        return cdn_url
+    if server is not None:
+        return f"{server.url}static/{filename}"
+    return path.as_uri()
+
+def static_file_for(filename):
+    """Artifacts 服务器使用：只提供 STATIC_ASSETS 中登记过的文件（防止路径穿越）"""
+    for name, (registered, _, _) in STATIC_ASSETS.items():
+        if registered == filename:
+            return asset_path(name)
+    return None
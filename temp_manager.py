@@ -0,0 +1,195 @@
+# temp_manager.py (v1.0 - 统一的临时文件目录：附件、图像、Artifacts 页面、超长回复与各类缓存都放在同一目录下，索引记录大小与最近使用时间，超出容量按 LRU 淘汰)
+import os
+import json
+import time
+import glob
+import uuid
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+TEMP_CACHE_DIR = os.getenv("COPILOT_TEMP_DIR", os.path.join(tempfile.gettempdir(), "personal_copilot"))
+TEMP_CACHE_MAX_MB = float(os.getenv("TEMP_CACHE_MAX_MB", "1024"))  # 临时目录的容量上限（MB）
+INDEX_SAVE_DELAY_SECONDS = 2.0  # 索引变化后延迟写盘，合并短时间内的多次登记
+# 旧版本直接写在系统临时目录下的文件，启动清理时删除一次
+LEGACY_TEMP_PATTERNS = ("full_response_*.txt", "artifacts_*.html", "copilot_attachment_*")
+
+class TempFileManager:
+    """
+    管理应用的所有临时文件。
+    - 各模块通过 dir_for / new_path 取得目录或路径，写完后调用 register 登记；读取时调用 touch 更新最近使用时间；
+    - 索引文件 index.json 记录 路径 -> {大小, 最近使用时间}，统计总量与淘汰都只看索引，不扫描目录；
+    - 总量超过 max_bytes 时按最近使用时间淘汰最旧的文件（各模块自己的索引在使用前都会检查文件是否存在）；
+    - start_cleanup 在后台线程中执行一次启动清理：去掉索引中已不存在的文件、删除旧版本遗留的临时文件、淘汰到容量以内。
+    """
+
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, root_dir=TEMP_CACHE_DIR, max_bytes=int(TEMP_CACHE_MAX_MB * 1024 * 1024)):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = self.root_dir / self.INDEX_FILE_NAME
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self.total_bytes = sum(entry["size"] for entry in self._index.values())
+        self._save_timer = None
+        logging.info("[临时文件] 目录: %s，已登记 %d 个文件，共 %.1f MB（上限 %.0f MB）",
+                     self.root_dir, len(self._index), self.total_bytes / 1048576, self.max_bytes / 1048576)
+
+    # --- 索引 ---
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning("[临时文件] 索引文件损坏，将重新建立: %s", e)
+            return {}
+
+    def _save_index(self):
+        """原子地写回索引文件"""
+        with self._lock:
+            self._save_timer = None
+            data = json.dumps(self._index, ensure_ascii=False)
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logging.error("[临时文件] 写入索引文件出错: %s", e)
+
+    def _schedule_save(self):
+        """调用方需持有锁"""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(INDEX_SAVE_DELAY_SECONDS, self._save_index)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    # --- 路径 ---
+    def dir_for(self, category):
+        """某一类临时文件的目录（attachments、images、artifacts、responses 等）"""
+        path = self.root_dir / category
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def new_path(self, category, prefix, suffix):
+        """新的临时文件路径：<类别目录>/<prefix><时间戳>_<随机串><suffix>"""
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        return self.dir_for(category) / f"{prefix}{stamp}_{uuid.uuid4().hex[:8]}{suffix}"
+
+    # --- 登记与淘汰 ---
+    def register(self, path):
+        """文件写完后登记（已登记的文件更新大小），超出容量时淘汰最久未使用的文件"""
+        key = os.path.abspath(path)
+        try:
+            size = os.path.getsize(key)
+        except OSError:
+            return
+        with self._lock:
+            previous = self._index.get(key)
+            if previous is not None:
+                self.total_bytes -= previous["size"]
+            self._index[key] = {"size": size, "last_used": time.time()}
+            self.total_bytes += size
+            evicted = self._evict_locked(keep=key)
+            self._schedule_save()
+        self._delete(evicted)
+
+    def touch(self, path):
+        """读取已登记的文件时调用，更新最近使用时间"""
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                self._schedule_save()
+
+    def forget(self, path):
+        """调用方自己删除或移走了文件时调用"""
+        with self._lock:
+            entry = self._index.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self.total_bytes -= entry["size"]
+                self._schedule_save()
+
+    def _evict_locked(self, keep=None):
+        """按最近使用时间从旧到新选出要删除的文件，直到总量不超过上限（调用方需持有锁，删除在锁外进行）"""
+        if self.total_bytes <= self.max_bytes:
+            return []
+        evicted = []
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_used"]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del self._index[key]
+            self.total_bytes -= entry["size"]
+            evicted.append(key)
+        return evicted
+
+    def _delete(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning("[临时文件] 删除 %s 失败: %s", path, e)
+        if paths:
+            logging.info("[临时文件] 超出容量，已淘汰 %d 个最久未使用的文件，当前 %.1f MB", len(paths), self.total_bytes / 1048576)
+
+    # --- 启动清理 ---
+    def start_cleanup(self):
+        """在后台线程中执行一次启动清理"""
+        threading.Thread(target=self._cleanup, name="temp-cleanup", daemon=True).start()
+
+    def _cleanup(self):
+        started = time.time()
+        with self._lock:
+            missing = [key for key in self._index if not os.path.exists(key)]
+            for key in missing:
+                self.total_bytes -= self._index.pop(key)["size"]
+            evicted = self._evict_locked()
+            if missing or evicted:
+                self._schedule_save()
+        self._delete(evicted)
+        legacy = 0
+        temp_dir = tempfile.gettempdir()
+        for pattern in LEGACY_TEMP_PATTERNS:
+            for path in glob.glob(os.path.join(temp_dir, pattern)):
+                try:
+                    os.remove(path)
+                    legacy += 1
+                except OSError:
+                    pass
+        logging.info("[临时文件] 启动清理完成：移除 %d 条失效索引，淘汰 %d 个文件，删除 %d 个旧版临时文件，耗时 %.2f 秒",
+                     len(missing), len(evicted), legacy, time.time() - started)
+
+    def close(self):
+        """程序退出时调用：立即写回尚未保存的索引"""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self._save_index()
+
+_temp_manager = None
+_temp_manager_lock = threading.Lock()
+
+def get_temp_manager():
+    """获取共享的临时文件管理器（延迟创建）"""
+    global _temp_manager
+    with _temp_manager_lock:
+        if _temp_manager is None:
+            _temp_manager = TempFileManager()
+        return _temp_manager
+
+def shutdown_temp_manager():
+    """程序退出时调用"""
+    with _temp_manager_lock:
+        if _temp_manager is not None:
+            _temp_manager.close()
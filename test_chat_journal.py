@@ -0,0 +1,65 @@
+# test_chat_journal.py - 对话日志：写入数据库失败后的重试与重放
+import os
+import shutil
+import tempfile
+import unittest
+
+from chat_store import ChatStore
+from chat_journal import ChatJournal
+
+class FlakyChatStore(ChatStore):
+    """前 fail_times 次 apply_journal_batch 抛出异常（事务回滚，数据库不变）"""
+
+    def __init__(self, *args, fail_times=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_times = fail_times
+
+    def apply_journal_batch(self, records, last_seq):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("模拟写库失败")
+        super().apply_journal_batch(records, last_seq)
+
+class ChatJournalRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "chats.db")
+        self.manifest_path = os.path.join(self.tmp_dir, "chats_manifest.json")
+        self.journal_path = os.path.join(self.tmp_dir, "chats.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def open_store(self, fail_times=0):
+        return FlakyChatStore(db_path=self.db_path, manifest_path=self.manifest_path, fail_times=fail_times)
+
+    def test_failed_batch_is_applied_with_next_batch(self):
+        store = self.open_store(fail_times=1)
+        journal = ChatJournal(store, journal_path=self.journal_path)
+        journal.create_chat("c1", "标题")
+        journal.append_message("c1", "user", "第一条")
+        self.assertFalse(journal.flush(timeout=0.5))  # 第一批写库失败，journal_seq 不前进
+        self.assertEqual(store.get_journal_seq(), 0)
+
+        journal.append_message("c1", "assistant", "第二条")
+        self.assertTrue(journal.flush(timeout=2))
+        self.assertEqual([m["content"] for m in store.load_messages("c1")], ["第一条", "第二条"])
+        self.assertEqual(store.get_journal_seq(), 3)
+        journal.close()
+
+    def test_failed_batch_is_replayed_after_crash(self):
+        store = self.open_store(fail_times=100)
+        journal = ChatJournal(store, journal_path=self.journal_path)
+        journal.append_message("c1", "user", "崩溃前的消息")
+        self.assertFalse(journal.flush(timeout=0.5))
+        journal._queue.put(None)  # 模拟崩溃：停止写线程，不做关闭时的重试
+        journal._writer.join(timeout=2)
+        journal._file.close()
+        store._conn.close()
+
+        store = self.open_store()
+        ChatJournal(store, journal_path=self.journal_path).close()
+        self.assertEqual([m["content"] for m in store.load_messages("c1")], ["崩溃前的消息"])
+
+if __name__ == "__main__":
+    unittest.main()
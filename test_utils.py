@@ -0,0 +1,22 @@
+# test_utils.py - 单条消息指令：只删除指令本身，其余内容保持不变
+import unittest
+
+from utils import parse_message_directives
+
+class ParseMessageDirectivesTest(unittest.TestCase):
+    def test_code_indentation_survives(self):
+        text, directives = parse_message_directives("!search fix this:\n    def f():\n        return  1")
+        self.assertEqual(text, "fix this:\n    def f():\n        return  1")
+        self.assertEqual(directives, frozenset({"search"}))
+
+    def test_directive_inside_line_leaves_one_space(self):
+        self.assertEqual(parse_message_directives("写首诗  !nosearch  关于秋天"), ("写首诗 关于秋天", frozenset({"nosearch"})))
+
+    def test_batch_lines_are_kept(self):
+        self.assertEqual(parse_message_directives("!batch\n一只猫 x3\n一只狗"), ("一只猫 x3\n一只狗", frozenset({"batch"})))
+
+    def test_text_without_directive_is_unchanged(self):
+        self.assertEqual(parse_message_directives("价格是 !important  吗"), ("价格是 !important  吗", frozenset()))
+
+if __name__ == "__main__":
+    unittest.main()
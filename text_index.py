@@ -0,0 +1,168 @@
+# text_index.py (v1.1 - 本地文本检索：中日韩感知分词、文本分块与 BM25 倒排索引，全文索引用的汉字切分)
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+
+from utils import estimate_tokens
+
+# 中日韩连续字符串 / 拉丁字母数字单词
+_TOKEN_PATTERN = re.compile(r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)|([0-9a-z_]+)")
+
+# 出现频率极高、几乎不带检索信息的词
+STOPWORDS = {
+    "the", "a", "an", "of", "to", "and", "or", "in", "on", "for", "is", "are", "be", "it", "this", "that", "with", "as",
+    "的", "了", "是", "在", "和", "我", "你", "吗", "呢", "吧",
+}
+
+def split_words(text):
+    """
+    把文本切分为 中日韩连续字符串 与 拉丁字母数字单词（转为小写），不做二元切分、不去停用词。
+    返回:
+        list: (中日韩连续字符串, 单词) 元组列表，每个元组中只有一项非空
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def tokenize(text):
+    """
+    中日韩感知的分词：
+    - 中日韩连续字符切分为相邻二元组（单字串保留单字），无需词典即可匹配中文词语；
+    - 拉丁字母与数字按单词切分并转为小写。
+    参数:
+        text (str): 待分词文本
+    返回:
+        list: 词项列表
+    """
+    tokens = []
+    for cjk_run, word in split_words(text):
+        if cjk_run:
+            if len(cjk_run) == 1:
+                if cjk_run not in STOPWORDS:
+                    tokens.append(cjk_run)
+            else:
+                tokens.extend(cjk_run[i:i + 2] for i in range(len(cjk_run) - 1))
+        elif word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+# 单个中日韩字符
+_CJK_CHAR_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+def split_cjk(text):
+    """
+    在每个中日韩字符两侧插入空格，使按空白分词的全文索引（如 FTS5 unicode61）把每个汉字视为一个词项。
+    配合短语查询（相邻字符序列）即可匹配任意中文词语。
+    """
+    return _CJK_CHAR_PATTERN.sub(lambda m: f" {m.group(0)} ", text)
+
+def join_cjk(text, markers=""):
+    """
+    split_cjk 的逆操作：去掉每个中日韩字符前后各一个插入的空格（跳过 markers 中的高亮标记字符），用于还原检索片段。
+    """
+    result = []
+    skip_space = False
+    for ch in text:
+        if ch in markers:
+            result.append(ch)
+            continue
+        if _CJK_CHAR_PATTERN.match(ch):
+            # 删除前面插入的空格
+            index = len(result) - 1
+            while index >= 0 and result[index] in markers:
+                index -= 1
+            if index >= 0 and result[index] == " ":
+                del result[index]
+            result.append(ch)
+            skip_space = True
+            continue
+        if ch == " " and skip_space:
+            skip_space = False
+            continue
+        skip_space = False
+        result.append(ch)
+    return "".join(result)
+
+def chunk_text(text, max_tokens=400):
+    """
+    按行把文本切分为大约 max_tokens 的块，单行过长时按字符硬切。
+    参数:
+        text (str): 原文
+        max_tokens (int): 每块的目标 token 数
+    返回:
+        list: 每块为字典 {"text", "start_line", "end_line"}，行号从 1 开始
+    """
+    chunks = []
+    current_lines = []
+    current_tokens = 0
+    start_line = 1
+    line_number = 0
+    for line_number, line in enumerate(text.splitlines(keepends=True), start=1):
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            # 超长单行（如压缩过的 JSON 或日志），先收尾当前块再硬切
+            if current_lines:
+                chunks.append({"text": "".join(current_lines), "start_line": start_line, "end_line": line_number - 1})
+                current_lines, current_tokens = [], 0
+            step = max(1, len(line) * max_tokens // line_tokens)
+            for offset in range(0, len(line), step):
+                chunks.append({"text": line[offset:offset + step], "start_line": line_number, "end_line": line_number})
+            start_line = line_number + 1
+            continue
+        if current_lines and current_tokens + line_tokens > max_tokens:
+            chunks.append({"text": "".join(current_lines), "start_line": start_line, "end_line": line_number - 1})
+            current_lines, current_tokens = [], 0
+            start_line = line_number
+        current_lines.append(line)
+        current_tokens += line_tokens
+    if current_lines:
+        chunks.append({"text": "".join(current_lines), "start_line": start_line, "end_line": line_number})
+    return chunks
+
+class BM25Index:
+    """基于倒排索引的 BM25 检索，文档以插入顺序编号"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # 词项 -> [(文档编号, 词频)]
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text):
+        """添加一个文档，返回其编号"""
+        doc_id = len(self.doc_lengths)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings[term].append((doc_id, tf))
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def scores(self, query):
+        """
+        计算查询与所有命中文档的 BM25 得分。
+        返回:
+            dict: 文档编号 -> 得分（未命中的文档不出现）
+        """
+        doc_count = len(self.doc_lengths)
+        if not doc_count:
+            return {}
+        avg_length = self.total_length / doc_count or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=10):
+        """返回得分最高的 top_k 个 (文档编号, 得分)，按得分降序"""
+        return heapq.nlargest(top_k, self.scores(query).items(), key=lambda item: item[1])
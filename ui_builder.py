@@ -81,6 +81,9 @@ def initialize_function_buttons(functions_frame, colors):
     upload_button = ctk.CTkButton(functions_frame, text="📁", width=30, height=30, font=ctk.CTkFont(size=16))
     upload_button.pack(side="left", padx=(5, 10))
 
+    history_search_button = ctk.CTkButton(functions_frame, text="🔍", width=30, height=30, font=ctk.CTkFont(size=16))
+    history_search_button.pack(side="left", padx=(5, 10))
+
     topmost_var = ctk.IntVar(value=1)  # 初始状态为置顶
     topmost_button = ctk.CTkButton(functions_frame, text="📌", width=30, height=30, font=ctk.CTkFont(size=16), fg_color=colors["button_active"])
     topmost_button.pack(side="left", padx=(5, 10))
@@ -96,6 +99,7 @@ def initialize_function_buttons(functions_frame, colors):
         'artifacts_var': artifacts_var, 'artifacts_button': artifacts_button,
         'translate_var': translate_var, 'translate_button': translate_button,
         'upload_button': upload_button,
+        'history_search_button': history_search_button,
         'topmost_var': topmost_var, 'topmost_button': topmost_button,
         'model_optionmenu_var': model_optionmenu_var, 'model_optionmenu': model_optionmenu
     }
@@ -209,6 +213,7 @@ def build_ui(app, app_controller=None):
         'settings_button': settings_button,
         'heart_new_chat_button': heart_new_chat_button,
         'upload_button': button_elements['upload_button'],
+        'history_search_button': button_elements['history_search_button'],
         'model_optionmenu': button_elements['model_optionmenu'], 'model_optionmenu_var': button_elements['model_optionmenu_var'],
         'cancel_button': cancel_button,
         'topmost_button': button_elements['topmost_button'], 'topmost_var': button_elements['topmost_var'],
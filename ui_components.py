@@ -1,12 +1,14 @@
-# ui_components.py (v3.4 - 支持运行时输入API密钥并移除对 prompt.txt 的依赖，支持主题切换，更新按钮颜色)
+# ui_components.py (v3.5 - 支持运行时输入API密钥并移除对 prompt.txt 的依赖，支持主题切换，更新按钮颜色，新增对话搜索窗口)
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox
 import os
+import threading
 from pathlib import Path
 import logging
 from config_manager import update_api_key, save_theme_preference
 from prompts import PROMPT_ATRI
+from chat_store import HIGHLIGHT_START, HIGHLIGHT_END
 
 class SettingsWindow(ctk.CTkToplevel):
     def __init__(self, master, selected_config, all_backend_configs, chat_manager_ref, switch_backend_func, create_new_chat_func, ensure_prompt_func):
@@ -139,6 +141,12 @@ class SettingsWindow(ctk.CTkToplevel):
         self.translate_check = ctk.CTkCheckBox(frame, text="翻译模式", variable=self.translate_var)
         self.translate_check.pack(padx=15, pady=5, anchor="w")
 
+        # 附件发送方式：默认超出预算时只发送检索到的相关片段
+        message_handler = self.master_app.app_controller.message_handler
+        self.full_attachments_var = ctk.BooleanVar(value=message_handler.force_full_attachments)
+        self.full_attachments_check = ctk.CTkCheckBox(frame, text="附件全文发送（不做检索）", variable=self.full_attachments_var)
+        self.full_attachments_check.pack(padx=15, pady=5, anchor="w")
+
     def create_api_section(self):
         """创建API密钥设置卡片"""
         frame = ctk.CTkFrame(self.content_frame, fg_color=ctk.ThemeManager.theme["CTkFrame"]["top_fg_color"], corner_radius=10)
@@ -262,6 +270,8 @@ class SettingsWindow(ctk.CTkToplevel):
         self.master_app.app_controller.toggle_atri_mode()
         self.master_app.app_controller.toggle_artifacts_mode()
         self.master_app.app_controller.toggle_translate_mode()
+        self.master_app.app_controller.message_handler.force_full_attachments = self.full_attachments_var.get()
+        logging.info("附件全文发送: %s", self.full_attachments_var.get())
 
         # 5. 如果提示词被修改了，则调用新建对话的回调
         if prompt_changed:
@@ -315,4 +325,100 @@ class SettingsWindow(ctk.CTkToplevel):
             self.master_app.after(50, self.create_new_chat_callback)
         except Exception as e:
             logging.error("保存提示词时出错: %s", e)
-            messagebox.showerror("保存错误", f"保存提示词时出错:\n{e}")
\ No newline at end of file
+            messagebox.showerror("保存错误", f"保存提示词时出错:\n{e}")
+
+
+class ChatSearchWindow(ctk.CTkToplevel):
+    """在所有已保存对话中全文检索，双击结果打开对应对话"""
+
+    SEARCH_DELAY_MS = 250  # 输入停止后再检索，避免每次按键都查询
+
+    def __init__(self, master, chat_manager_ref, open_chat_func):
+        """
+        Args:
+            master: 父窗口 (主 App)。
+            chat_manager_ref: ChatManager 实例引用。
+            open_chat_func: Controller 中按 id 打开对话的函数引用。
+        """
+        super().__init__(master)
+        self.title("搜索对话")
+        self.geometry("520x480")
+        self.master_app = master
+        self.chat_manager = chat_manager_ref
+        self.open_chat_callback = open_chat_func
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self._pending_search = None
+        self._search_generation = 0
+        self._result_chat_ids = {}  # 结果起始行号 -> 对话 id
+
+        self.query_entry = ctk.CTkEntry(self, placeholder_text="输入关键词（支持中文）...")
+        self.query_entry.pack(fill="x", padx=10, pady=(10, 5))
+        self.query_entry.bind("<KeyRelease>", self.schedule_search)
+        self.status_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.status_label.pack(fill="x", padx=10)
+        self.results_text = ctk.CTkTextbox(self, wrap="word", state="disabled")
+        self.results_text.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        self.results_text.tag_config("title", foreground="#1E90FF")
+        self.results_text.tag_config("highlight", foreground="#FF8C00")
+        self.results_text.bind("<Double-Button-1>", self.on_result_double_click)
+        self.query_entry.focus()
+
+    def schedule_search(self, event=None):
+        if self._pending_search:
+            self.after_cancel(self._pending_search)
+        self._pending_search = self.after(self.SEARCH_DELAY_MS, self.start_search)
+
+    def start_search(self):
+        """在后台线程中查询，结果回到主线程显示"""
+        self._pending_search = None
+        query = self.query_entry.get().strip()
+        self._search_generation += 1
+        generation = self._search_generation
+        if not query:
+            self.show_results([], "")
+            return
+
+        def worker():
+            try:
+                results = self.chat_manager.search_chats(query)
+            except Exception as e:
+                logging.error("[对话搜索] 检索出错: %s", e)
+                results = []
+            if generation == self._search_generation:
+                self.master_app.after(0, self.show_results, results, query)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def show_results(self, results, query):
+        if not self.winfo_exists():
+            return
+        self._result_chat_ids.clear()
+        self.results_text.configure(state="normal")
+        self.results_text.delete("1.0", "end")
+        for result in results:
+            line = int(self.results_text.index("end-1c").split(".")[0])
+            self._result_chat_ids[line] = result["chat_id"]
+            role = "我" if result["role"] == "user" else "AI"
+            self.results_text.insert("end", f"{result['title']}  ({role})\n", "title")
+            # 片段中的高亮标记转为 highlight 标签
+            for i, part in enumerate(result["snippet"].replace(HIGHLIGHT_END, HIGHLIGHT_START).split(HIGHLIGHT_START)):
+                self.results_text.insert("end", part, "highlight" if i % 2 else ())
+            self.results_text.insert("end", "\n\n")
+        self.results_text.configure(state="disabled")
+        self.status_label.configure(text=f"找到 {len(results)} 条结果，双击打开对话" if query else "")
+
+    def on_result_double_click(self, event):
+        index = self.results_text.index(f"@{event.x},{event.y}")
+        clicked_line = int(index.split(".")[0])
+        chat_id = None
+        for line, candidate in sorted(self._result_chat_ids.items()):
+            if line > clicked_line:
+                break
+            chat_id = candidate
+        if chat_id:
+            self.open_chat_callback(chat_id)
+
+    def on_closing(self):
+        if hasattr(self.master_app, 'app_controller') and self.master_app.app_controller:
+            self.master_app.app_controller.chat_search_window = None
+        self.destroy()
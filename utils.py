@@ -1,6 +1,7 @@
 # utils.py
 import sys
 import os
+import re
 from pathlib import Path
 import logging
 
@@ -25,4 +26,49 @@ def get_data_dir():
         return base_path
     except Exception as e:
         logging.error("!!! 获取数据目录失败: %s !!!", e)
-        return Path(".")  # 退回当前目录
\ No newline at end of file
+        return Path(".")  # 退回当前目录
+
+# 中日韩字符（统一汉字、扩展A、假名、谚文、兼容汉字）
+_CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的 token 数（不依赖分词器）。
+    中日韩字符按每字约 1 token 计算，其余字符按每 4 个字符约 1 token 计算。
+    参数:
+        text (str): 待估算的文本
+    返回:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk_count = sum(len(run) for run in _CJK_RUN_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+# 单条消息的指令：以 "!" 开头、前后为空白的单词，例如 "!search 今天的新闻"、"写首诗 !nosearch"、"!fresh 一只猫"（不使用图像库，重新生成）、
+# "!batch"（每行一条图像提示词，行尾 x3 表示 3 张变体）
+MESSAGE_DIRECTIVES = ("search", "nosearch", "fresh", "batch")
+_DIRECTIVE_PATTERN = re.compile(r"(?<!\S)!(%s)(?!\S)" % "|".join(MESSAGE_DIRECTIVES), re.IGNORECASE)
+# 删除指令时连同它两侧同一行内的空格一起删除
+_DIRECTIVE_TOKEN_PATTERN = re.compile(r"[ \t]*(?<!\S)!(?:%s)(?!\S)[ \t]*" % "|".join(MESSAGE_DIRECTIVES), re.IGNORECASE)
+
+def parse_message_directives(text):
+    """
+    从用户输入中取出单条消息指令。
+    参数:
+        text (str): 用户输入
+    返回:
+        tuple: (去掉指令后的文本, 指令名集合 frozenset，小写)
+    """
+    if not text or "!" not in text:
+        return text, frozenset()
+    directives = frozenset(match.lower() for match in _DIRECTIVE_PATTERN.findall(text))
+    if not directives:
+        return text, directives
+    def remove_token(match):
+        # 只删除指令本身：前后都是同一行的文字时保留一个空格，其余内容（如代码缩进）保持不变
+        before = text[match.start() - 1] if match.start() > 0 else "\n"
+        after = text[match.end()] if match.end() < len(text) else "\n"
+        return " " if before not in "\r\n" and after not in "\r\n" else ""
+    cleaned = _DIRECTIVE_TOKEN_PATTERN.sub(remove_token, text).strip()
+    return cleaned, directives
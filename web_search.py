@@ -1,19 +1,30 @@
-# web_search.py (v1.2 - 适配 Python 3.9，修改类型提示语法)
+# web_search.py (v1.7 - 适配 Python 3.9，修改类型提示语法，搜索结果缓存，多查询并行搜索，结果压缩，深度搜索，缓存命中判断)
 import os
+import re
+import time
 from tavily import TavilyClient
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urlunsplit
 from typing import Union  # 导入 typing.Union 以支持 Python 3.9
+from search_cache import get_search_cache
+from search_compactor import compact_results, SEARCH_TOKEN_BUDGET
+from page_fetcher import DEEP_SEARCH_ENABLED, deepen_results
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='--- [%(levelname)s - %(module)s] %(message)s')
 
-def perform_search(query: str, max_results: int = 3) -> Union[str, None]:
-    """Performs a web search using Tavily API and returns formatted results.
+# search_depth 对应的 Tavily 点数消耗（basic 为 1，advanced 为 2）
+SEARCH_DEPTH = "basic"
+SEARCH_CREDITS = {"basic": 1, "advanced": 2}
+
+def search_raw(query: str, max_results: int = 3) -> Union[list, None]:
+    """调用 Tavily API 搜索（不经过缓存）。
     参数:
         query (str): 搜索查询字符串
-        max_results (int): 最大返回结果数量，默认为3
+        max_results (int): 最大返回结果数量
     返回:
-        Union[str, None]: 格式化后的搜索结果字符串，如果搜索失败则返回None
+        Union[list, None]: 结果列表 [{"title", "content", "url"}]，搜索失败时返回None，没有结果时返回空列表
     """
     # --- 在函数内部获取 API Key ---
     local_tavily_api_key = os.getenv("TAVILY_API_KEY")
@@ -29,31 +40,155 @@ def perform_search(query: str, max_results: int = 3) -> Union[str, None]:
         # 优化搜索参数，减少不必要的数据传输
         response = client.search(
             query=query, 
-            search_depth="basic", 
+            search_depth=SEARCH_DEPTH, 
             max_results=max_results,
             include_raw_content=False,  # 不包含原始内容，减少数据量
             include_images=False  # 不包含图片，减少数据量
         )
-
-        if response and 'results' in response and response['results']:
-            formatted_results = []
-            for i, result in enumerate(response['results']):
-                title = result.get('title', 'N/A')
-                content = result.get('content', 'N/A').strip()  # 移除片段首尾空白
-                url = result.get('url', 'N/A')
-                # 简化格式，减少 token 占用
-                formatted_results.append(f"[{i+1}] {title}\n   {content}\n   (Source: {url})")
-            final_string = "\n\n".join(formatted_results)
-            logging.info(f"Tavily search successful, returning {len(response['results'])} results.")
-            # logging.debug(f"Formatted results:\n{final_string}")  # Debug 时可以取消注释
-            return final_string
-        else:
-            logging.info(f"No results found or empty response from Tavily for query: {query}")
-            return None
+        results = [
+            {"title": r.get('title', 'N/A'), "content": (r.get('content') or 'N/A').strip(), "url": r.get('url', 'N/A')}
+            for r in (response or {}).get('results') or []
+        ]
+        logging.info(f"Tavily search returned {len(results)} results.")
+        return results
     except Exception as e:
         logging.error(f"Error during Tavily search for query '{query}': {e}", exc_info=True)  # 记录完整错误
         return None
 
+def format_results(results: list) -> str:
+    """把结果列表格式化为提示词使用的文本（简化格式，减少 token 占用）"""
+    return "\n\n".join(f"[{i+1}] {r['title']}\n   {r['content']}\n   (Source: {r['url']})" for i, r in enumerate(results))
+
+def perform_search(query: str, max_results: int = 3) -> Union[str, None]:
+    """Performs a web search using Tavily API (through the result cache) and returns formatted results.
+    参数:
+        query (str): 搜索查询字符串
+        max_results (int): 最大返回结果数量，默认为3
+    返回:
+        Union[str, None]: 格式化后的搜索结果字符串，如果搜索失败或没有结果则返回None
+    """
+    results = get_search_cache().get_or_fetch(query, max_results, search_raw, cost=SEARCH_CREDITS[SEARCH_DEPTH])
+    if not results:
+        logging.info(f"No results found or empty response from Tavily for query: {query}")
+        return None
+    return format_results(results)
+
+# --- 多查询并行搜索 ---
+SEARCH_MAX_QUERIES = int(os.getenv("SEARCH_MAX_QUERIES", "3"))  # 每条消息最多拆分的子查询数
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE_SECONDS", "3"))  # 搜索阶段的硬性截止时间（秒）
+MIN_SUBQUERY_LENGTH = 4  # 过短的子句（如"谢谢"）不单独搜索
+
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="web-search")
+
+# 子问题之间的分隔：句末标点、分号、换行
+_QUERY_SPLIT_PATTERN = re.compile(r"[。？！?!；;\n]+")
+
+def split_queries(text: str, max_queries: int = SEARCH_MAX_QUERIES) -> list:
+    """
+    把用户输入拆分为若干子查询：按句末标点/换行切分，过短的子句并入前一句，最多 max_queries 个。
+    只有一个子句时直接返回原输入。
+    """
+    text = text.strip()
+    clauses = []
+    for clause in _QUERY_SPLIT_PATTERN.split(text):
+        clause = clause.strip(" ，,、")
+        if not clause:
+            continue
+        if clauses and len(clause) < MIN_SUBQUERY_LENGTH:
+            clauses[-1] = f"{clauses[-1]} {clause}"
+        else:
+            clauses.append(clause)
+    if len(clauses) <= 1:
+        return [text] if text else []
+    # 去重（忽略大小写与空白差异）并截断
+    unique = []
+    seen = set()
+    for clause in clauses:
+        key = "".join(clause.lower().split())
+        if key not in seen:
+            seen.add(key)
+            unique.append(clause)
+    return unique[:max_queries]
+
+def _normalize_url(url: str) -> str:
+    """去掉片段、末尾斜杠和 www. 前缀，用于按 URL 去重"""
+    try:
+        parts = urlsplit(url.strip())
+        netloc = parts.netloc.lower()
+        if netloc.startswith("www."):
+            netloc = netloc[4:]
+        return urlunsplit((parts.scheme.lower(), netloc, parts.path.rstrip("/"), parts.query, ""))
+    except ValueError:
+        return url.strip()
+
+def merge_results(result_lists: list) -> list:
+    """按查询顺序轮流取结果（每个子查询的最佳结果优先），按 URL 去重"""
+    merged = []
+    seen_urls = set()
+    longest = max((len(results) for results in result_lists), default=0)
+    for rank in range(longest):
+        for results in result_lists:
+            if rank < len(results):
+                key = _normalize_url(results[rank]["url"])
+                if key not in seen_urls:
+                    seen_urls.add(key)
+                    merged.append(results[rank])
+    return merged
+
+def search_multi(user_input: str, max_results: int = 3, deadline: float = SEARCH_DEADLINE) -> Union[list, None]:
+    """
+    把输入拆分为子查询并行搜索（经过结果缓存），到截止时间立即返回已完成查询的合并结果。
+    未完成的查询继续在后台运行，完成后写入缓存，供之后的相同问题使用。
+    返回:
+        Union[list, None]: 合并去重后的结果列表；所有查询都失败时返回None
+    """
+    queries = split_queries(user_input)
+    if not queries:
+        return None
+    started = time.time()
+    futures = [
+        _search_executor.submit(get_search_cache().get_or_fetch, query, max_results, search_raw, SEARCH_CREDITS[SEARCH_DEPTH])
+        for query in queries
+    ]
+    done, not_done = wait(futures, timeout=deadline)
+    result_lists = []
+    failed = 0
+    for future in futures:  # 保持查询顺序
+        if future not in done:
+            continue
+        try:
+            results = future.result()
+        except Exception as e:
+            logging.error(f"Sub-query search failed: {e}")
+            results = None
+        if results is None:
+            failed += 1
+        else:
+            result_lists.append(results)
+    logging.info(f"Multi-query search: {len(queries)} queries, {len(done)} finished in {time.time() - started:.2f}s "
+                 f"(deadline {deadline}s, {len(not_done)} still running, {failed} failed)")
+    if not result_lists:
+        return None
+    return merge_results(result_lists)
+
+def is_cached(user_input: str, max_results: int = 3) -> bool:
+    """所有子查询的结果是否都已在搜索缓存中（包括可先返回的过期结果），此时搜索不会产生网络请求"""
+    queries = split_queries(user_input)
+    return bool(queries) and all(get_search_cache().peek(query, max_results)[0] is not None for query in queries)
+
+def perform_multi_search(user_input: str, max_results: int = 3, deadline: float = SEARCH_DEADLINE,
+                         token_budget: int = SEARCH_TOKEN_BUDGET) -> Union[str, None]:
+    """
+    并行多查询搜索，去重压缩到 token 预算内后返回格式化结果；没有任何结果时返回None。
+    开启深度搜索（DEEP_SEARCH=1）时，先抓取排名靠前的网页全文替换摘要，再做压缩。
+    """
+    results = search_multi(user_input, max_results, deadline)
+    if not results:
+        return None
+    if DEEP_SEARCH_ENABLED:
+        results = deepen_results(results)
+    return compact_results(results, user_input, token_budget)
+
 # 简单测试 (可选)
 # if __name__ == '__main__':
 #     # 如果要单独测试此文件，需要确保 .env 文件在正确的位置或手动设置环境变量